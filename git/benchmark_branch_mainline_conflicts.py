@@ -0,0 +1,398 @@
+"""
+为 `check_branch_mainline_conflicts.py` 生成合成仓库并测量分析耗时。
+
+合成仓库通过 `git fast-import` 一次性写入：
+1. 主分支先提交全部文件，然后追加 `--depth` 个只修改 CHANGELOG 的提交，模拟历史深度。
+2. 每个候选分支从主分支历史中随机位置分出，修改若干互不相邻的专属行，彼此不会冲突。
+3. 每个分支以 `--conflict-density` 的概率额外修改一个共享热点行，改到同一热点的分支两两冲突。
+
+对每种引擎、并行度与预筛开关组合，分别测量冷缓存（全新临时目录）与热缓存（复用上一轮缓存）下的耗时，
+并统计分支收集、祖先索引、预合并、后续合并、缓存读写等阶段的累计耗时，结果以 JSON 输出，便于在提交之间比较。
+"""
+
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from argparse import ArgumentParser, Namespace
+from dataclasses import asdict, dataclass
+from itertools import product
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+os.environ.setdefault("TQDM_DISABLE", "1")
+
+import check_branch_mainline_conflicts as checker
+
+LINES_PER_FILE = 60
+# 每个槽位占 3 行，只修改中间一行，保证不同槽位的修改之间至少隔一行不会被合并成同一个冲突块
+LINES_PER_SLOT = 3
+COMMITTER = "Bench <bench@example.invalid>"
+BASE_TIMESTAMP = 1_700_000_000
+
+
+@dataclass(frozen=True)
+class Args:
+    branches: int
+    files: int
+    depth: int
+    commits_per_branch: int
+    conflict_density: float
+    seed: int
+    engines: List[checker.MergeEngine]
+    jobs: List[int]
+    prefilter_modes: List[bool]
+    output: Optional[Path]
+    work_dir: Optional[Path]
+    keep: bool
+
+    @classmethod
+    def from_ns(cls, ns: Namespace) -> "Args":
+        if ns.branches < 2:
+            raise ValueError("--branches 必须大于等于 2")
+        if ns.files < 1:
+            raise ValueError("--files 必须大于等于 1")
+        if ns.depth < 0:
+            raise ValueError("--depth 不能为负数")
+        if ns.commits_per_branch < 1:
+            raise ValueError("--commits-per-branch 必须大于等于 1")
+        if not 0 <= ns.conflict_density <= 1:
+            raise ValueError("--conflict-density 必须在 0 到 1 之间")
+
+        slot_count = ns.files * (LINES_PER_FILE // LINES_PER_SLOT)
+        if ns.branches * ns.commits_per_branch + ns.branches > slot_count:
+            raise ValueError("--files 太少，无法为每个分支分配互不冲突的修改位置")
+
+        engines = [checker.MergeEngine(value) for value in ns.engine] if ns.engine else default_engines()
+        jobs = sorted(set(ns.jobs or [1]))
+        if any(value < 1 for value in jobs):
+            raise ValueError("--jobs 必须大于等于 1")
+
+        return cls(
+            branches=ns.branches,
+            files=ns.files,
+            depth=ns.depth,
+            commits_per_branch=ns.commits_per_branch,
+            conflict_density=ns.conflict_density,
+            seed=ns.seed,
+            engines=engines,
+            jobs=jobs,
+            prefilter_modes=[True] if ns.prefilter_only else [True, False],
+            output=Path(ns.output).expanduser().resolve() if ns.output else None,
+            work_dir=Path(ns.work_dir).expanduser().resolve() if ns.work_dir else None,
+            keep=bool(ns.keep),
+        )
+
+
+def default_engines() -> List[checker.MergeEngine]:
+    engines = [checker.MergeEngine.CHECKOUT]
+    if checker.MergeEngine.AUTO.resolve() is checker.MergeEngine.MERGE_TREE:
+        engines.append(checker.MergeEngine.MERGE_TREE)
+    return engines
+
+
+def parse_args() -> Args:
+    parser = ArgumentParser(description="生成合成仓库，测量分支合并冲突预测脚本在各种引擎与选项下的耗时。")
+    parser.add_argument("--branches", type=int, default=20, help="候选分支数量 (默认: 20)")
+    parser.add_argument("--files", type=int, default=50, help="仓库中的文件数量 (默认: 50)")
+    parser.add_argument("--depth", type=int, default=200, help="主分支历史提交数量 (默认: 200)")
+    parser.add_argument("--commits-per-branch", type=int, default=3, help="每个分支上的提交数量 (默认: 3)")
+    parser.add_argument(
+        "--conflict-density",
+        type=float,
+        default=0.5,
+        help="每个分支修改共享热点行的概率，越大冲突的分支对越多；合成仓库没有冲突的分支对时报错 (默认: 0.5)",
+    )
+    parser.add_argument("--seed", type=int, default=0, help="随机种子，相同参数与种子生成相同的仓库 (默认: 0)")
+    parser.add_argument(
+        "--engine",
+        action="append",
+        choices=[engine.value for engine in checker.MergeEngine if engine is not checker.MergeEngine.AUTO],
+        help="要测量的合并引擎，可重复传入；默认测量当前 git 支持的全部引擎",
+    )
+    parser.add_argument("--jobs", "-j", type=int, action="append", help="要测量的并行度，可重复传入 (默认: 1)")
+    parser.add_argument("--prefilter-only", action="store_true", help="只测量开启预筛的情况")
+    parser.add_argument("--output", "-o", help="JSON 结果输出路径；省略时输出到标准输出")
+    parser.add_argument("--work-dir", help="合成仓库与临时目录的位置；省略时使用系统临时目录")
+    parser.add_argument("--keep", action="store_true", help="结束后保留自动创建的合成仓库与缓存目录")
+
+    namespace = parser.parse_args()
+    try:
+        return Args.from_ns(namespace)
+    except ValueError as exc:
+        parser.error(str(exc))
+
+
+class FastImportWriter:
+    """拼接 `git fast-import` 输入流。"""
+
+    def __init__(self) -> None:
+        self._chunks: List[bytes] = []
+        self._next_mark = 1
+        self._timestamp = BASE_TIMESTAMP
+
+    def _data(self, content: str) -> None:
+        encoded = content.encode("utf-8")
+        self._chunks.append(f"data {len(encoded)}\n".encode("ascii") + encoded + b"\n")
+
+    def commit(
+        self,
+        ref: str,
+        message: str,
+        files: Dict[str, str],
+        parent: Optional[int] = None,
+    ) -> int:
+        mark = self._next_mark
+        self._next_mark += 1
+        self._timestamp += 60
+        self._chunks.append(f"commit {ref}\nmark :{mark}\ncommitter {COMMITTER} {self._timestamp} +0000\n".encode())
+        self._data(message)
+        if parent is not None:
+            self._chunks.append(f"from :{parent}\n".encode())
+        for path, content in sorted(files.items()):
+            self._chunks.append(f"M 100644 inline {path}\n".encode())
+            self._data(content)
+        self._chunks.append(b"\n")
+        return mark
+
+    def stream(self) -> bytes:
+        return b"".join(self._chunks)
+
+
+@dataclass(frozen=True)
+class SyntheticRepoSpec:
+    branches: int
+    files: int
+    depth: int
+    commits_per_branch: int
+    conflict_density: float
+    seed: int
+
+    @staticmethod
+    def file_path(index: int) -> str:
+        return f"src/module_{index:04d}.txt"
+
+    def initial_lines(self, index: int) -> List[str]:
+        return [f"file {index} line {line}" for line in range(LINES_PER_FILE)]
+
+    def build(self, path: Path) -> Dict[str, object]:
+        """生成仓库并返回其实际统计信息。"""
+        rng = random.Random(self.seed)
+        writer = FastImportWriter()
+        contents = {self.file_path(index): self.initial_lines(index) for index in range(self.files)}
+
+        changelog: List[str] = ["changelog"]
+        main_marks = [
+            writer.commit(
+                "refs/heads/main",
+                "initial import",
+                {**{path: "\n".join(lines) + "\n" for path, lines in contents.items()}, "CHANGELOG": "changelog\n"},
+            )
+        ]
+        for depth in range(self.depth):
+            changelog.append(f"release note {depth}")
+            main_marks.append(
+                writer.commit("refs/heads/main", f"main {depth}", {"CHANGELOG": "\n".join(changelog) + "\n"})
+            )
+
+        slots = list(product(range(self.files), range(LINES_PER_FILE // LINES_PER_SLOT)))
+        rng.shuffle(slots)
+        hot_slot_count = max(1, self.branches // 4)
+        hot_slots, private_slots = slots[:hot_slot_count], slots[hot_slot_count:]
+
+        hot_slot_users = {slot: 0 for slot in hot_slots}
+        for branch_index in range(self.branches):
+            branch_lines = {path: list(lines) for path, lines in contents.items()}
+            edits = [private_slots.pop() for _ in range(self.commits_per_branch)]
+            if rng.random() < self.conflict_density:
+                edits[-1] = rng.choice(hot_slots)
+                hot_slot_users[edits[-1]] += 1
+
+            parent = rng.choice(main_marks)
+            ref = f"refs/heads/feature/{branch_index:03d}"
+            for commit_index, (file_index, slot) in enumerate(edits):
+                file_path = self.file_path(file_index)
+                branch_lines[file_path][slot * LINES_PER_SLOT + 1] = f"branch {branch_index} commit {commit_index}"
+                parent = writer.commit(
+                    ref,
+                    f"feature {branch_index} step {commit_index}",
+                    {file_path: "\n".join(branch_lines[file_path]) + "\n"},
+                    parent=parent,
+                )
+
+        path.mkdir(parents=True, exist_ok=True)
+        checker.run_git(path, "init", "--quiet")
+        subprocess.run(
+            ["git", "-C", str(path), "fast-import", "--quiet"],
+            input=writer.stream(),
+            capture_output=True,
+            check=True,
+        )
+        checker.run_git(path, "symbolic-ref", "HEAD", "refs/heads/main")
+        return {
+            **asdict(self),
+            "hot_slots": hot_slot_count,
+            "hot_branches": sum(hot_slot_users.values()),
+            # 改到同一热点的分支两两冲突，其余修改位置互不相同
+            "expected_conflicting_pairs": sum(users * (users - 1) // 2 for users in hot_slot_users.values()),
+        }
+
+
+# 各阶段由检查脚本自身的 `@profiled("phase")` 记录，这里只把限定名映射为报告中的阶段名
+PHASE_NAMES: Dict[str, str] = {
+    # 检查脚本中的 `collect_branches` 只覆盖读取引用，这里统计包含分支筛选与解析在内的整段
+    "BranchSelection": "collect_branches",
+    "AnalysisCache.load": "cache_load",
+    "AncestryIndex.load_or_build": "ancestry_index",
+    "PreparedMerge.from_main_merge": "prepared_merges",
+    "PreparedMerge.analyse_followup": "followup_merges",
+    "PreparedMerge.predict_clean_followup": "prefiltered_followups",
+    "ChangedPathIndex.get": "changed_paths",
+    "MergeLabPool.__init__": "lab_setup",
+    "AnalysisCache.save": "cache_save",
+    "AnalysisCache.get_pair_result": "cache_lookup",
+    "teardown": "teardown",
+}
+
+
+def phase_summary() -> Dict[str, Dict[str, float]]:
+    """汇总本轮各阶段在所有线程中的累计耗时；并行运行时总和可能大于墙钟时间。"""
+    phases: Dict[str, Dict[str, float]] = {}
+    for stat in checker.PROFILER.summary():
+        if stat.name in PHASE_NAMES:
+            phases[PHASE_NAMES[stat.name]] = {"calls": stat.calls, "seconds": round(stat.total_seconds, 6)}
+    return dict(sorted(phases.items()))
+
+
+def run_scenario(
+    repo: Path,
+    temp_root: Path,
+    engine: checker.MergeEngine,
+    jobs: int,
+    prefilter: bool,
+    cache_state: str,
+) -> Dict[str, object]:
+    cache_dir = temp_root / "cache"
+    checker.PROFILER.reset()
+    checker.PROFILER.enable()
+    started = time.perf_counter()
+    try:
+        with checker.PROFILER.span("phase", "BranchSelection"):
+            main_branch = checker.detect_main_branch(repo, "main")
+            branch_tips = checker.collect_branches(repo)
+            branch_names = checker.select_branches(list(branch_tips), [], [main_branch])
+            branches = checker.BranchInfo.resolve_many(repo, branch_names, known_tips=branch_tips)
+        with checker.PROFILER.span("phase", "AnalysisCache.load"):
+            cache = checker.AnalysisCache.load(cache_dir)
+        analyser = checker.MainlineAnalyser(
+            repo,
+            temp_root=temp_root,
+            cache=cache,
+            jobs=jobs,
+            engine=engine,
+            ancestry_file=temp_root / "ancestry.json",
+            prefilter=prefilter,
+            lab_store_dir=temp_root / "lab.git",
+        )
+        try:
+            report = analyser.analyse(main_branch, branches)
+        finally:
+            with checker.PROFILER.span("phase", "teardown"):
+                analyser.close()
+                cache.close()
+                checker.close_git_batches()
+        wall_seconds = time.perf_counter() - started
+    finally:
+        checker.PROFILER.enabled = False
+
+    return {
+        "engine": engine.resolve().value,
+        "jobs": jobs,
+        "prefilter": prefilter,
+        "cache": cache_state,
+        "wall_seconds": round(wall_seconds, 6),
+        "pairs": len(report.pair_results),
+        "prefiltered_pairs": report.prefiltered_pair_count,
+        "mergeless_sequences": report.mergeless_sequence_count,
+        "conflicting_pairs": len(report.filtered_pair_results(conflicts_only=True)),
+        "phases": phase_summary(),
+    }
+
+
+def checker_revision() -> Optional[str]:
+    result = checker.run_git(Path(__file__).resolve().parent, "rev-parse", "HEAD", check=False)
+    return result.stdout.strip() or None
+
+
+def run_benchmark(args: Args, work_dir: Path) -> Dict[str, object]:
+    spec = SyntheticRepoSpec(
+        branches=args.branches,
+        files=args.files,
+        depth=args.depth,
+        commits_per_branch=args.commits_per_branch,
+        conflict_density=args.conflict_density,
+        seed=args.seed,
+    )
+    repo = work_dir / "repo"
+    shutil.rmtree(repo, ignore_errors=True)
+    started = time.perf_counter()
+    repo_stats = spec.build(repo)
+    repo_stats["build_seconds"] = round(time.perf_counter() - started, 6)
+    # 没有冲突的分支对时只测到了全部干净的快速路径，结果没有参考价值
+    if args.conflict_density > 0 and repo_stats["expected_conflicting_pairs"] == 0:
+        raise RuntimeError("合成仓库中没有冲突的分支对，请调大 --conflict-density 或 --branches，或更换 --seed")
+
+    results: List[Dict[str, object]] = []
+    for engine, jobs, prefilter in product(args.engines, args.jobs, args.prefilter_modes):
+        temp_root = work_dir / f"run-{engine.value}-j{jobs}-{'prefilter' if prefilter else 'full'}"
+        shutil.rmtree(temp_root, ignore_errors=True)
+        for cache_state in ("cold", "warm"):
+            print(f"running {engine.value} jobs={jobs} prefilter={prefilter} cache={cache_state}", file=sys.stderr)
+            result = run_scenario(repo, temp_root, engine, jobs, prefilter, cache_state)
+            if result["conflicting_pairs"] != repo_stats["expected_conflicting_pairs"]:
+                raise RuntimeError(
+                    f"检测到 {result['conflicting_pairs']} 个冲突的分支对，"
+                    f"与合成仓库预期的 {repo_stats['expected_conflicting_pairs']} 个不一致"
+                )
+            results.append(result)
+
+    return {
+        "generated_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "checker_revision": checker_revision(),
+        "git_version": ".".join(str(part) for part in checker.git_version()),
+        "python_version": platform.python_version(),
+        "platform": platform.platform(),
+        "repo": repo_stats,
+        "results": results,
+    }
+
+
+def main() -> int:
+    args = parse_args()
+    work_dir = args.work_dir or Path(tempfile.mkdtemp(prefix="bench-mainline-conflicts-"))
+    try:
+        payload = run_benchmark(args, work_dir)
+    except (RuntimeError, subprocess.CalledProcessError) as exc:
+        print(f"Error: {exc}", file=sys.stderr)
+        return 1
+    finally:
+        # 只清理脚本自己创建的目录，用户指定的 --work-dir 保持原样
+        if args.work_dir is None and not args.keep:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    text = json.dumps(payload, ensure_ascii=False, indent=2) + "\n"
+    if args.output is not None:
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        args.output.write_text(text, encoding="utf-8")
+    else:
+        sys.stdout.write(text)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -12,22 +12,78 @@
 2. 所有尚未存在同名本地分支的远程跟踪分支。
 
 另外，远程分支中以 `archive` 开头的分支会被自动排除。
+传入 `--since 30d` 等时，最新提交早于该时间的分支会在收集引用时直接排除。
+
+`--main` 可重复传入多个主分支（例如 main 与各 release 分支），一次运行中共享引用解析、
+祖先关系表与实验对象库，并为每个主分支分别输出报告。
+
+传入 `-X ignore-space-change` 等时，合并测试使用对应的 `-X` 策略选项；不同选项组合的结果以各自的策略指纹分别缓存。
+
+传入 `--jobs N` 时会创建 N 个共享同一对象库的实验工作树，并行分析多个分支对。
+
+实验对象库与工作树默认在运行结束后删除；传入 `--keep-lab` 时保留在 `--temp-root`（或 `--ram-lab` 的内存目录）下的
+`check_lab_*.git` 中，并固定已算出的集成提交，后续运行可直接复用，不再需要时手动删除该目录即可。
+
+传入 `--coordinator [HOST:]PORT` 时脚本只负责把待测分支对分批派发给各机器上以 `--worker URL` 运行的实例，
+各 worker 在自己的本地克隆中合并，结果汇总回同一份缓存与报告。
+
+传入 `--watch` 时脚本常驻运行，轮询分支引用并持续更新 `--report-file` / `--serve-port` 提供的报告。
 """
 
 import base64
 import fnmatch
+import functools
+import hashlib
 import json
+import os
+import posixpath
+import queue
+import re
 import shutil
+import signal
+import socket
+import struct
 import subprocess
 import sys
+import threading
+import time
+import urllib.error
+import urllib.request
 import uuid
+import zlib
 from argparse import ArgumentParser, Namespace
-from dataclasses import asdict, dataclass
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field, replace
+from datetime import datetime
 from enum import StrEnum
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from itertools import combinations
 from math import comb
 from pathlib import Path
-from typing import Dict, List, Mapping, Optional, Self, Sequence, Set, Tuple, TypedDict
+from types import FrameType
+from typing import (
+    Any,
+    BinaryIO,
+    Callable,
+    ClassVar,
+    Dict,
+    FrozenSet,
+    Iterator,
+    List,
+    Mapping,
+    NotRequired,
+    Optional,
+    ParamSpec,
+    Self,
+    Sequence,
+    Set,
+    TextIO,
+    Tuple,
+    TypedDict,
+    TypeVar,
+)
 
 from pydantic import TypeAdapter, ValidationError
 from rich.console import Console
@@ -41,6 +97,86 @@ class PreparedMergeStatus(StrEnum):
     ALREADY_CONTAINED = "already-contained"
 
 
+class MergeEngine(StrEnum):
+    AUTO = "auto"
+    CHECKOUT = "checkout"
+    MERGE_TREE = "merge-tree"
+
+    def resolve(self) -> "MergeEngine":
+        if self is not MergeEngine.AUTO:
+            return self
+        if git_version() >= MERGE_TREE_MIN_GIT_VERSION:
+            return MergeEngine.MERGE_TREE
+        return MergeEngine.CHECKOUT
+
+    @property
+    def needs_worktree(self) -> bool:
+        return self is MergeEngine.CHECKOUT
+
+
+@dataclass(frozen=True)
+class MergeStrategy:
+    """合并测试使用的 `-X` 策略选项，同时传给 `git merge` 与 `git merge-tree`。"""
+
+    options: Tuple[str, ...] = ()
+
+    # ours/theirs 会直接消解冲突，使预测失去意义
+    ALLOWED_OPTIONS: ClassVar[FrozenSet[str]] = frozenset(
+        {
+            "ignore-space-change",
+            "ignore-all-space",
+            "ignore-space-at-eol",
+            "ignore-cr-at-eol",
+            "renormalize",
+            "no-renormalize",
+            "no-renames",
+            "find-renames",
+            "rename-threshold",
+            "diff-algorithm",
+            "patience",
+            "subtree",
+        }
+    )
+
+    @classmethod
+    def from_options(cls, values: Optional[Sequence[str]]) -> Self:
+        options: List[str] = []
+        for raw_value in values or []:
+            option = raw_value.strip()
+            name = option.partition("=")[0]
+            if name in {"ours", "theirs"}:
+                raise ValueError(f"-X {name} 会直接消解冲突，不能用于冲突预测")
+            if name not in cls.ALLOWED_OPTIONS:
+                raise ValueError(f"不支持的合并策略选项: -X {option}")
+            if option not in options:
+                options.append(option)
+        return cls(options=tuple(options))
+
+    @property
+    def fingerprint(self) -> str:
+        """选项组合的指纹；默认策略为空串。选项顺序会影响 git 的解析结果，因此保留顺序。"""
+        if not self.options:
+            return ""
+        return hashlib.sha1("\0".join(self.options).encode("utf-8")).hexdigest()[:12]
+
+    def cache_key(self, main_commit: str) -> str:
+        # 默认策略沿用原有的按主分支提交命名，已有缓存无需迁移
+        return f"{main_commit}-{self.fingerprint}" if self.options else main_commit
+
+    @property
+    def git_args(self) -> List[str]:
+        return [arg for option in self.options for arg in ("-X", option)]
+
+    def compatible_engine(self, engine: MergeEngine) -> MergeEngine:
+        """`git merge-tree` 自 2.40 起才接受 `-X`；更低版本的 git 上自动改用 checkout 引擎。"""
+        engine = engine.resolve()
+        if not self.options or engine is not MergeEngine.MERGE_TREE:
+            return engine
+        if git_version() >= MERGE_TREE_STRATEGY_OPTION_MIN_GIT_VERSION:
+            return engine
+        return MergeEngine.CHECKOUT
+
+
 class SequenceStatus(StrEnum):
     FIRST_CONFLICTS_WITH_MAIN = "first-conflicts-with-main"
     CONFLICT = "conflict"
@@ -111,24 +247,283 @@ class PairCacheEntryPayload(TypedDict):
     first_then_second_conflict_files: List[str]
     second_then_first_status: SequenceStatus
     second_then_first_conflict_files: List[str]
+    # 与冲突文件一一对应的冲突指纹；旧缓存中没有该字段
+    first_then_second_conflict_fingerprints: NotRequired[List[str]]
+    second_then_first_conflict_fingerprints: NotRequired[List[str]]
 
 
+class PreparedCacheEntryPayload(TypedDict):
+    status: PreparedMergeStatus
+    conflict_files: List[str]
+    conflict_fingerprints: List[str]
+    integration_commit: str
+    integration_parents: List[str]
+
+
+class ConflictFingerprintPayload(TypedDict):
+    hunks: int
+    lines: int
+    first_seen: int
+
+
+# 旧版单文件 JSON 缓存的格式，仅用于迁移
 AnalysisCachePayload = Dict[str, PairCacheEntryPayload]
 ANALYSIS_CACHE_PAYLOAD_ADAPTER = TypeAdapter(AnalysisCachePayload)
 
+# 分片缓存：每个主分支提交一个文件，内容为 magic + 版本号 + zlib 压缩的二进制记录
+CACHE_SHARD_MAGIC = b"BMCC"
+# 版本 2 在分支对记录之后追加了预合并记录，版本 3 为冲突文件增加了指纹与指纹表，
+# 版本 4 把冲突文件数从 16 位扩展为 32 位；旧版本分片仍可读取
+CACHE_SHARD_VERSION = 4
+CACHE_SHARD_SUPPORTED_VERSIONS = (1, 2, 3, 4)
+CACHE_SHARD_SUFFIX = ".bin"
+# 跨主分支提交共享的冲突指纹表，与分片使用同一种编码，只包含指纹段
+CONFLICT_TABLE_NAME = "conflicts"
+DEFAULT_CACHE_MAX_AGE_DAYS = 30
+# 分片旁的追加日志：每条记录为 长度 + CRC32 + 单条目分片，运行中途被杀死也不会丢失已完成的结果
+CACHE_JOURNAL_SUFFIX = ".journal"
+CACHE_JOURNAL_FLUSH_SECONDS = 5.0
+DEFAULT_POLL_INTERVAL_SECONDS = 10.0
+# --since 的相对时长单位
+SINCE_UNIT_SECONDS = {"h": 3600, "d": 86400, "w": 7 * 86400}
+# 分布式模式：每次租约派发的分支对数量；连续的分支对共享第一个分支，worker 可复用其预合并结果
+DISTRIBUTED_CHUNK_PAIRS = 32
+# 租约超时未交回结果时（worker 崩溃或失联）重新派发
+DISTRIBUTED_LEASE_TIMEOUT_SECONDS = 900.0
+DISTRIBUTED_REQUEST_TIMEOUT_SECONDS = 30.0
+# coordinator 连续这么久收不到任何结果时放弃本次任务；默认是租约超时的两倍，足以覆盖一次租约重新派发
+DEFAULT_COORDINATOR_TIMEOUT_SECONDS = 2 * DISTRIBUTED_LEASE_TIMEOUT_SECONDS
+# 还有待派发的分支对却这么久没有 worker 来领取时给出提示
+DISTRIBUTED_IDLE_WARNING_SECONDS = 60.0
+# coordinator 结束后继续应答 "done" 的最长时间，空闲 worker 每秒轮询一次，足以让它们都收到通知
+DISTRIBUTED_SHUTDOWN_GRACE_SECONDS = 5.0
+# worker 先于 coordinator 启动时，等待其上线的最长时间
+WORKER_CONNECT_TIMEOUT_SECONDS = 60.0
+
+
+class AncestryIndexPayload(TypedDict):
+    commits: List[str]
+    ancestors: Dict[str, List[str]]
+
+
+ANCESTRY_INDEX_PAYLOAD_ADAPTER = TypeAdapter(AncestryIndexPayload)
+
+# `git merge-tree --write-tree` 自 2.38 起可用，`-X` 策略选项自 2.40 起可用
+MERGE_TREE_MIN_GIT_VERSION = (2, 38)
+MERGE_TREE_STRATEGY_OPTION_MIN_GIT_VERSION = (2, 40)
+
 
 console = Console()
 
+P = ParamSpec("P")
+R = TypeVar("R")
+
+
+@dataclass(frozen=True)
+class ProfileEvent:
+    category: str
+    name: str
+    start: float
+    duration: float
+    thread_id: int
+    output_bytes: int
+
+
+@dataclass(frozen=True)
+class ProfileStat:
+    category: str
+    name: str
+    calls: int
+    total_seconds: float
+    p50_ms: float
+    p90_ms: float
+    p99_ms: float
+    max_ms: float
+    output_bytes: int
+
+    def to_row(self) -> Dict[str, str]:
+        return {
+            "category": self.category,
+            "name": self.name,
+            "calls": str(self.calls),
+            "total_seconds": f"{self.total_seconds:.3f}",
+            "p50_ms": f"{self.p50_ms:.2f}",
+            "p90_ms": f"{self.p90_ms:.2f}",
+            "p99_ms": f"{self.p99_ms:.2f}",
+            "max_ms": f"{self.max_ms:.2f}",
+            "output_bytes": str(self.output_bytes),
+        }
+
+
+class Profiler:
+    """记录 git 子命令、实验仓库操作与各分析阶段的耗时；默认关闭，关闭时每次调用只多一次布尔判断。"""
+
+    def __init__(self) -> None:
+        self.enabled = False
+        self._events: List[ProfileEvent] = []
+        self._thread_names: Dict[int, str] = {}
+        self._lock = threading.Lock()
+        self._origin = time.perf_counter()
+
+    def enable(self) -> None:
+        self._origin = time.perf_counter()
+        self.enabled = True
+
+    def reset(self) -> None:
+        """丢弃已记录的事件，供同一进程内多次分析分别统计。"""
+        with self._lock:
+            self._events.clear()
+            self._thread_names.clear()
+
+    def record(self, category: str, name: str, start: float, duration: float, output_bytes: int = 0) -> None:
+        thread = threading.current_thread()
+        event = ProfileEvent(category, name, start, duration, thread.ident or 0, output_bytes)
+        with self._lock:
+            self._events.append(event)
+            # 导出时工作线程可能已经退出，线程名需要在记录时保存
+            self._thread_names.setdefault(event.thread_id, thread.name)
+
+    @contextmanager
+    def span(self, category: str, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(category, name, start, time.perf_counter() - start)
+
+    @staticmethod
+    def _percentile(sorted_values: Sequence[float], fraction: float) -> float:
+        # 最近秩法：样本较少时直接返回实际出现过的耗时
+        rank = max(1, int(-(-fraction * len(sorted_values) // 1)))
+        return sorted_values[rank - 1]
+
+    def summary(self) -> List[ProfileStat]:
+        with self._lock:
+            events = list(self._events)
+
+        grouped: Dict[Tuple[str, str], List[ProfileEvent]] = {}
+        for event in events:
+            grouped.setdefault((event.category, event.name), []).append(event)
+
+        stats: List[ProfileStat] = []
+        for (category, name), group in grouped.items():
+            durations = sorted(event.duration for event in group)
+            stats.append(
+                ProfileStat(
+                    category=category,
+                    name=name,
+                    calls=len(durations),
+                    total_seconds=round(sum(durations), 6),
+                    p50_ms=round(self._percentile(durations, 0.50) * 1000, 3),
+                    p90_ms=round(self._percentile(durations, 0.90) * 1000, 3),
+                    p99_ms=round(self._percentile(durations, 0.99) * 1000, 3),
+                    max_ms=round(durations[-1] * 1000, 3),
+                    output_bytes=sum(event.output_bytes for event in group),
+                )
+            )
+        return sorted(stats, key=lambda stat: (stat.category, -stat.total_seconds, stat.name))
+
+    def to_chrome_trace(self) -> Dict[str, object]:
+        """导出为 Chrome Trace Event 格式，可在 chrome://tracing 或 Perfetto 中查看时间线。"""
+        with self._lock:
+            events = list(self._events)
+            thread_names = dict(self._thread_names)
+
+        pid = os.getpid()
+        thread_ids: Dict[int, int] = {}
+        trace_events: List[Dict[str, object]] = []
+        for event in sorted(events, key=lambda item: item.start):
+            tid = thread_ids.setdefault(event.thread_id, len(thread_ids))
+            trace_events.append(
+                {
+                    "name": event.name,
+                    "cat": event.category,
+                    "ph": "X",
+                    "ts": round((event.start - self._origin) * 1_000_000, 1),
+                    "dur": round(event.duration * 1_000_000, 1),
+                    "pid": pid,
+                    "tid": tid,
+                    "args": {"output_bytes": event.output_bytes} if event.output_bytes else {},
+                }
+            )
+        for thread_id, tid in thread_ids.items():
+            trace_events.append(
+                {"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": thread_names[thread_id]}}
+            )
+        return {"traceEvents": trace_events, "displayTimeUnit": "ms"}
+
+
+PROFILER = Profiler()
+
+
+def profiled(category: str) -> Callable[[Callable[P, R]], Callable[P, R]]:
+    def decorator(function: Callable[P, R]) -> Callable[P, R]:
+        name = function.__qualname__
+
+        @functools.wraps(function)
+        def wrapper(*args: P.args, **kwargs: P.kwargs) -> R:
+            if not PROFILER.enabled:
+                return function(*args, **kwargs)
+            with PROFILER.span(category, name):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def git_subcommand(args: Sequence[str]) -> str:
+    index = 0
+    while index < len(args) and args[index].startswith("-"):
+        # `-c key=value` 与 `-C path` 带一个参数
+        index += 2 if args[index] in {"-c", "-C"} else 1
+    return args[index] if index < len(args) else "git"
+
+
+def parse_since(value: str, now: float) -> float:
+    """把 --since 的取值解析为提交时间下限（Unix 时间戳）：`30d`、`2w`、`12h` 等相对时长，或 ISO 日期。"""
+    text = value.strip()
+    match = re.fullmatch(r"(\d+(?:\.\d+)?)\s*([hdw])", text, flags=re.IGNORECASE)
+    if match:
+        return now - float(match.group(1)) * SINCE_UNIT_SECONDS[match.group(2).lower()]
+
+    try:
+        moment = datetime.fromisoformat(text)
+    except ValueError:
+        raise ValueError(f"无法解析 --since: {value}（可用 30d、2w、12h 或 2024-01-31 等格式）") from None
+    return moment.timestamp()
+
 
 @dataclass(frozen=True)
 class Args:
     repo_arg: str
     repo: Path
-    main_branch: Optional[str]
+    # 为空时自动检测唯一的主分支
+    main_branches: List[str]
     branch_patterns: List[str]
+    since: Optional[str]
     conflicts_only: bool
     output_json: bool
+    output_ndjson: bool
     temp_root: Path
+    lab_root: Path
+    ram_lab: bool
+    keep_lab: bool
+    jobs: int
+    engine: MergeEngine
+    strategy: MergeStrategy
+    prefilter: bool
+    cache_max_age_days: float
+    plan: bool
+    watch: bool
+    poll_interval: float
+    report_file: Optional[Path]
+    serve_port: Optional[int]
+    profile: bool
+    trace_file: Optional[Path]
+    coordinator_address: Optional[Tuple[str, int]]
+    coordinator_timeout: float
+    worker_url: Optional[str]
 
     @classmethod
     def from_ns(cls, ns: Namespace) -> "Args":
@@ -142,8 +537,11 @@ class Args:
         if not repo.is_dir():
             raise ValueError(f"仓库路径不是目录: {repo}")
 
-        main_branch = ns.main.strip() if ns.main else None
+        main_branches = cls._normalize_main_branches(ns.main)
         branch_patterns = cls._normalize_branch_patterns(ns.branch)
+        since = ns.since.strip() if ns.since else None
+        if since is not None:
+            parse_since(since, time.time())
 
         if ns.temp_root:
             temp_root = Path(str(ns.temp_root)).expanduser().resolve()
@@ -153,16 +551,116 @@ class Args:
         if temp_root.exists() and not temp_root.is_dir():
             raise ValueError(f"临时目录不是文件夹: {temp_root}")
 
+        lab_root = temp_root
+        if ns.ram_lab:
+            ram_dir = find_ram_backed_dir()
+            if ram_dir is not None:
+                lab_root = ram_dir / "branch-mainline-conflicts"
+
+        jobs = int(ns.jobs)
+        if jobs < 1:
+            raise ValueError("--jobs 必须大于等于 1")
+
+        cache_max_age_days = float(ns.cache_max_age_days)
+        if cache_max_age_days < 0:
+            raise ValueError("--cache-max-age-days 不能为负数")
+
+        if ns.json and ns.ndjson:
+            raise ValueError("--json 与 --ndjson 不能同时使用")
+        if ns.ndjson and ns.watch:
+            raise ValueError("--ndjson 不能与 --watch 同时使用")
+
+        poll_interval = float(ns.poll_interval)
+        if poll_interval <= 0:
+            raise ValueError("--poll-interval 必须大于 0")
+
+        report_file = Path(str(ns.report_file)).expanduser().resolve() if ns.report_file else None
+        serve_port = ns.serve_port
+        if serve_port is not None and not 0 <= serve_port <= 65535:
+            raise ValueError("--serve-port 必须在 0 到 65535 之间")
+        if ns.watch and report_file is None and serve_port is None:
+            raise ValueError("--watch 需要同时指定 --report-file 或 --serve-port")
+        if not ns.watch and (report_file is not None or serve_port is not None):
+            raise ValueError("--report-file 与 --serve-port 只能在 --watch 模式下使用")
+        # 常驻进程的计时事件会无限累积，且不会输出统计结果
+        if ns.watch and (ns.profile or ns.trace_file):
+            raise ValueError("--profile 与 --trace-file 不能与 --watch 同时使用")
+
+        coordinator_address = cls._parse_coordinator_address(ns.coordinator) if ns.coordinator else None
+        worker_url = cls._normalize_worker_url(ns.worker) if ns.worker else None
+        if coordinator_address is not None and worker_url is not None:
+            raise ValueError("--coordinator 与 --worker 不能同时使用")
+        coordinator_timeout = float(ns.coordinator_timeout)
+        if coordinator_timeout <= 0:
+            raise ValueError("--coordinator-timeout 必须大于 0")
+        if worker_url is not None:
+            if ns.watch or ns.plan or ns.json or ns.ndjson:
+                raise ValueError("--worker 不能与 --watch、--plan、--json、--ndjson 同时使用")
+            if ns.main or ns.branch or ns.since:
+                raise ValueError(
+                    "--worker 模式下主分支与候选分支由 coordinator 下发，不能指定 --main、--branch、--since"
+                )
+
         return cls(
             repo_arg=repo_arg,
             repo=repo,
-            main_branch=main_branch,
+            main_branches=main_branches,
             branch_patterns=branch_patterns,
+            since=since,
             conflicts_only=bool(ns.conflicts_only),
             output_json=bool(ns.json),
+            output_ndjson=bool(ns.ndjson),
             temp_root=temp_root,
+            lab_root=lab_root,
+            ram_lab=bool(ns.ram_lab),
+            keep_lab=bool(ns.keep_lab),
+            jobs=jobs,
+            engine=MergeEngine(ns.engine),
+            strategy=MergeStrategy.from_options(ns.strategy_option),
+            prefilter=not ns.no_prefilter,
+            cache_max_age_days=cache_max_age_days,
+            plan=bool(ns.plan),
+            watch=bool(ns.watch),
+            poll_interval=poll_interval,
+            report_file=report_file,
+            serve_port=serve_port,
+            profile=bool(ns.profile),
+            trace_file=Path(str(ns.trace_file)).expanduser().resolve() if ns.trace_file else None,
+            coordinator_address=coordinator_address,
+            coordinator_timeout=coordinator_timeout,
+            worker_url=worker_url,
         )
 
+    @staticmethod
+    def _parse_coordinator_address(value: str) -> Tuple[str, int]:
+        host, _, port_text = value.strip().rpartition(":")
+        if not port_text.isdigit() or not 0 <= int(port_text) <= 65535:
+            raise ValueError(f"--coordinator 需要 [HOST:]PORT 形式，端口在 0 到 65535 之间: {value}")
+        return host or "127.0.0.1", int(port_text)
+
+    @staticmethod
+    def _normalize_worker_url(value: str) -> str:
+        url = value.strip().rstrip("/")
+        if not url:
+            raise ValueError("--worker 不能为空")
+        return url if "://" in url else f"http://{url}"
+
+    @staticmethod
+    def _normalize_main_branches(values: Optional[Sequence[str]]) -> List[str]:
+        if not values:
+            return []
+
+        main_branches: List[str] = []
+        for raw_value in values:
+            for part in raw_value.split(","):
+                main_branch = part.strip()
+                if not main_branch:
+                    raise ValueError("--main 不能为空")
+                if main_branch not in main_branches:
+                    main_branches.append(main_branch)
+
+        return main_branches
+
     @staticmethod
     def _normalize_branch_patterns(values: Optional[Sequence[str]]) -> List[str]:
         if not values:
@@ -183,22 +681,138 @@ class Args:
         return patterns
 
     @property
-    def cache_file(self) -> Path:
-        repo_arg_base64 = base64.urlsafe_b64encode(self.repo_arg.encode("utf-8")).decode("ascii")
-        return self.temp_root / f"check_cache_{repo_arg_base64}.json"
+    def min_committer_date(self) -> Optional[float]:
+        # 相对时长每次取用时重新计算，--watch 长时间运行时截止时间随之推移
+        return parse_since(self.since, time.time()) if self.since is not None else None
+
+    @property
+    def _repo_arg_base64(self) -> str:
+        return base64.urlsafe_b64encode(self.repo_arg.encode("utf-8")).decode("ascii")
+
+    @property
+    def cache_dir(self) -> Path:
+        return self.temp_root / f"check_cache_{self._repo_arg_base64}"
+
+    @property
+    def ancestry_file(self) -> Path:
+        return self.temp_root / f"check_ancestry_{self._repo_arg_base64}.json"
+
+    @property
+    def lab_store_dir(self) -> Optional[Path]:
+        """`--keep-lab` 时跨运行复用的实验对象库位置；否则为 None，每次运行使用用完即删的临时对象库。"""
+        if not self.keep_lab:
+            return None
+        return self.lab_root / f"check_lab_{self._repo_arg_base64}.git"
 
 
 def parse_args() -> Args:
     parser = ArgumentParser(description="预测多个分支按不同顺序合回主分支时，是否会产生人工冲突。")
     parser.add_argument("repo", help="Git 仓库路径")
-    parser.add_argument("--main", help="主分支名称，例如 main、master、origin/main；省略时自动检测")
+    parser.add_argument(
+        "--main",
+        action="append",
+        help="主分支名称，例如 main、release/2.x；可重复传入或用逗号分隔以一次分析多个主分支，省略时自动检测",
+    )
     parser.add_argument("--branch", action="append", help="分支名或通配模式，可重复传入，例如 --branch 'feat/*'")
+    parser.add_argument(
+        "--since",
+        help="只测试最近有提交的分支：按分支最新提交的提交时间过滤，例如 30d、2w、12h 或 2024-01-31",
+    )
     parser.add_argument("--conflicts-only", action="store_true", help="只输出存在风险或已经冲突的分支对")
     parser.add_argument("--json", action="store_true", help="输出机器可读的 JSON 结果")
+    parser.add_argument(
+        "--ndjson",
+        action="store_true",
+        help="流式输出：每个分支对结果一得出就输出一行 JSON，最后输出一行汇总",
+    )
     parser.add_argument(
         "--temp-root",
         help="临时实验仓库的根目录，默认使用脚本目录下的 .tmp；缓存文件也会放在这里",
     )
+    parser.add_argument(
+        "--jobs",
+        "-j",
+        type=int,
+        default=1,
+        help="并行测试的实验工作树数量，默认 1；各工作树共享同一个对象库",
+    )
+    parser.add_argument(
+        "--ram-lab",
+        action="store_true",
+        help="把实验对象库与实验工作树放到内存文件系统（/dev/shm 等）中，找不到时仍使用 --temp-root",
+    )
+    parser.add_argument(
+        "--keep-lab",
+        action="store_true",
+        help="运行结束后保留实验对象库与工作树，后续运行直接复用；默认删除。保留的目录为 check_lab_*.git，可随时手动删除",
+    )
+    parser.add_argument(
+        "--engine",
+        choices=[engine.value for engine in MergeEngine],
+        default=MergeEngine.AUTO.value,
+        help="合并引擎：merge-tree 不需要工作区，checkout 使用真实工作区；auto 在 git >= 2.38 时选择 merge-tree",
+    )
+    parser.add_argument(
+        "--strategy-option",
+        "-X",
+        action="append",
+        help="传给 git merge / merge-tree 的策略选项，可重复传入，例如 -X ignore-space-change、-X find-renames=30%%；"
+        "不同选项组合的结果分别缓存",
+    )
+    parser.add_argument(
+        "--no-prefilter",
+        action="store_true",
+        help="关闭改动路径预筛；默认对改动文件互不相交且各自能干净合入主分支的分支对直接判定为 clean",
+    )
+    parser.add_argument(
+        "--cache-max-age-days",
+        type=float,
+        default=DEFAULT_CACHE_MAX_AGE_DAYS,
+        help=f"超过该天数未被使用的主分支提交缓存分片会被清理，0 表示不清理 (默认: {DEFAULT_CACHE_MAX_AGE_DAYS})",
+    )
+    parser.add_argument(
+        "--plan",
+        action="store_true",
+        help="根据两两结果规划整批分支的合并顺序，并在实验仓库中按该顺序真实合并一遍进行验证",
+    )
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="常驻运行：轮询分支引用，主分支或候选分支移动时只补算受影响的分支对，并持续更新报告",
+    )
+    parser.add_argument(
+        "--poll-interval",
+        type=float,
+        default=DEFAULT_POLL_INTERVAL_SECONDS,
+        help=f"--watch 模式下轮询分支引用的间隔秒数 (默认: {DEFAULT_POLL_INTERVAL_SECONDS})",
+    )
+    parser.add_argument("--report-file", help="--watch 模式下持续覆盖写入的 JSON 报告路径")
+    parser.add_argument(
+        "--serve-port",
+        type=int,
+        help="--watch 模式下在 127.0.0.1 的该端口以 HTTP 提供最新 JSON 报告，0 表示随机端口",
+    )
+
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="统计各 git 子命令、实验仓库操作与分析阶段的调用次数、耗时分位数与输出字节数",
+    )
+    parser.add_argument("--trace-file", help="把全部计时事件导出为 Chrome Trace JSON，可在 Perfetto 中查看时间线")
+    parser.add_argument(
+        "--coordinator",
+        help="分布式模式：在 [HOST:]PORT 上监听 worker，把待测分支对分批派发出去，自身不执行合并；HOST 默认 127.0.0.1",
+    )
+    parser.add_argument(
+        "--coordinator-timeout",
+        type=float,
+        default=DEFAULT_COORDINATOR_TIMEOUT_SECONDS,
+        help=f"分布式模式：连续这么多秒收不到任何 worker 交回的结果时报错退出 (默认: {DEFAULT_COORDINATOR_TIMEOUT_SECONDS:.0f})",
+    )
+    parser.add_argument(
+        "--worker",
+        help="分布式模式：连接该地址上的 coordinator 领取分支对，在 repo 指定的本地克隆中合并并交回结果",
+    )
 
     namespace = parser.parse_args()
     try:
@@ -213,26 +827,91 @@ class BranchInfo:
     tip: str
 
     @classmethod
-    def resolve_many(cls, repo: Path, branches: Sequence[str]) -> List[Self]:
-        return [
-            cls(
-                name=branch,
-                tip=run_git(repo, "rev-parse", f"{branch}^{{commit}}").stdout.strip(),
-            )
-            for branch in branches
-        ]
+    def resolve_many(
+        cls,
+        repo: Path,
+        branches: Sequence[str],
+        known_tips: Optional[Mapping[str, str]] = None,
+    ) -> List[Self]:
+        known_tips = known_tips or {}
+        unknown = [branch for branch in branches if branch not in known_tips]
+        resolved = dict(zip(unknown, git_batch(repo).resolve_commits(unknown)))
+
+        infos: List[Self] = []
+        for branch in branches:
+            tip = known_tips.get(branch) or resolved.get(branch)
+            if tip is None:
+                raise RuntimeError(f"unable to resolve branch: {branch}")
+            infos.append(cls(name=branch, tip=tip))
+        return infos
+
+
+@dataclass(frozen=True)
+class ConflictDetail:
+    path: str
+    hunks: int
+    # 冲突块中双方内容的总行数，不含冲突标记与 diff3 的共同祖先段
+    lines: int
+    # rerere 式指纹：只由各冲突块两侧的内容决定，且与两侧先后无关；没有冲突标记（二进制、修改/删除等）时为空串
+    fingerprint: str
+    first_seen: Optional[str] = None
+
+    @classmethod
+    def unknown(cls, path: str) -> Self:
+        return cls(path=path, hunks=0, lines=0, fingerprint="")
+
+    @classmethod
+    def from_text(cls, path: str, text: str) -> Self:
+        if "\0" in text:
+            return cls.unknown(path)
+
+        hunks = 0
+        lines = 0
+        digest = hashlib.sha1()
+        sides: Optional[Tuple[List[str], List[str]]] = None
+        section = "ours"
+        for line in text.splitlines():
+            if sides is None:
+                if line.startswith("<<<<<<<"):
+                    sides = ([], [])
+                    section = "ours"
+                continue
+
+            if section == "ours" and line.startswith("|||||||"):
+                section = "base"
+            elif section in {"ours", "base"} and line.startswith("======="):
+                section = "theirs"
+            elif section == "theirs" and line.startswith(">>>>>>>"):
+                hunks += 1
+                lines += len(sides[0]) + len(sides[1])
+                for side in sorted("\n".join(side_lines) for side_lines in sides):
+                    digest.update(side.encode("utf-8") + b"\0")
+                sides = None
+            elif section == "ours":
+                sides[0].append(line)
+            elif section == "theirs":
+                sides[1].append(line)
+
+        return cls(path=path, hunks=hunks, lines=lines, fingerprint=digest.hexdigest()[:16] if hunks else "")
+
+    def describe(self) -> str:
+        if not self.fingerprint:
+            return self.path
+        return f"{self.path} ({self.hunks} 处/{self.lines} 行 #{self.fingerprint[:8]})"
 
 
 @dataclass(frozen=True)
 class SequenceResult:
     status: SequenceStatus
     conflict_files: Tuple[str, ...]
+    conflict_details: Tuple[ConflictDetail, ...] = ()
 
     @classmethod
-    def first_conflicts_with_main(cls, conflict_files: Sequence[str]) -> Self:
+    def first_conflicts_with_main(cls, conflict_details: Sequence[ConflictDetail]) -> Self:
         return cls(
             status=SequenceStatus.FIRST_CONFLICTS_WITH_MAIN,
-            conflict_files=tuple(conflict_files),
+            conflict_files=tuple(detail.path for detail in conflict_details),
+            conflict_details=tuple(conflict_details),
         )
 
     @classmethod
@@ -244,95 +923,498 @@ class SequenceResult:
         return cls(status=SequenceStatus.CLEAN, conflict_files=())
 
     @classmethod
-    def conflict(cls, conflict_files: Sequence[str]) -> Self:
-        return cls(status=SequenceStatus.CONFLICT, conflict_files=tuple(conflict_files))
+    def conflict(cls, conflict_details: Sequence[ConflictDetail]) -> Self:
+        return cls(
+            status=SequenceStatus.CONFLICT,
+            conflict_files=tuple(detail.path for detail in conflict_details),
+            conflict_details=tuple(conflict_details),
+        )
 
 
-class AnalysisCache:
+_SEQUENCE_STATUS_CODES: Tuple[SequenceStatus, ...] = tuple(SequenceStatus)
+_PAIR_STATUS_CODES: Tuple[PairStatus, ...] = tuple(PairStatus)
+_PREPARED_STATUS_CODES: Tuple[PreparedMergeStatus, ...] = tuple(PreparedMergeStatus)
+ShardEntries = Dict[Tuple[str, str], PairCacheEntryPayload]
+PreparedEntries = Dict[str, PreparedCacheEntryPayload]
+ConflictEntries = Dict[str, ConflictFingerprintPayload]
+
+
+@dataclass(frozen=True)
+class CacheShard:
+    """一个主分支提交下的缓存内容：分支对结果，各分支提交与主分支的预合并结果，以及新出现的冲突指纹。"""
+
+    pairs: ShardEntries = field(default_factory=dict)
+    prepared: PreparedEntries = field(default_factory=dict)
+    conflicts: ConflictEntries = field(default_factory=dict)
+
+    def update(self, other: "CacheShard") -> None:
+        self.pairs.update(other.pairs)
+        self.prepared.update(other.prepared)
+        for fingerprint, payload in other.conflicts.items():
+            self.conflicts.setdefault(fingerprint, payload)
+
+    def __bool__(self) -> bool:
+        return bool(self.pairs or self.prepared or self.conflicts)
+
+
+def encode_cache_shard(shard: CacheShard) -> bytes:
+    """把一个主分支提交下的全部缓存内容编码为紧凑的二进制分片。
+
+    记录格式：提交 ID 以原始字节存储，状态以枚举序号存储，冲突文件名与冲突指纹统一放入字符串表后按序号引用。
+    """
+    strings: Dict[str, int] = {}
+
+    def intern(value: str) -> int:
+        return strings.setdefault(value, len(strings))
+
+    def pack_files(values: Sequence[str]) -> bytes:
+        indexes = [intern(value) for value in values]
+        # 整棵目录改名等情况下冲突文件可能超过 65535 个，数量与字符串序号一样用 32 位存储
+        return struct.pack(f"<I{len(indexes)}I", len(indexes), *indexes)
+
+    def pack_fingerprints(files: Sequence[str], fingerprints: Sequence[str]) -> bytes:
+        # 指纹与冲突文件一一对应，缺失的指纹以空串补齐
+        padded = [*fingerprints[: len(files)], *[""] * (len(files) - len(fingerprints))]
+        return b"".join(struct.pack("<I", intern(value)) for value in padded)
+
+    sample_oid = next(iter(shard.pairs))[0] if shard.pairs else next(iter(shard.prepared), "")
+    oid_length = len(bytes.fromhex(sample_oid)) if sample_oid else 20
+    records = bytearray()
+    for (first_tip, second_tip), payload in sorted(shard.pairs.items()):
+        records += bytes.fromhex(first_tip) + bytes.fromhex(second_tip)
+        records += struct.pack(
+            "<BBB",
+            _PAIR_STATUS_CODES.index(payload["pair_status"]),
+            _SEQUENCE_STATUS_CODES.index(payload["first_then_second_status"]),
+            _SEQUENCE_STATUS_CODES.index(payload["second_then_first_status"]),
+        )
+        for files_key, fingerprints_key in (
+            ("first_then_second_conflict_files", "first_then_second_conflict_fingerprints"),
+            ("second_then_first_conflict_files", "second_then_first_conflict_fingerprints"),
+        ):
+            files = payload[files_key]
+            records += pack_files(files) + pack_fingerprints(files, payload.get(fingerprints_key, []))
+
+    records += struct.pack("<I", len(shard.prepared))
+    for tip, prepared in sorted(shard.prepared.items()):
+        records += bytes.fromhex(tip) + struct.pack("<B", _PREPARED_STATUS_CODES.index(prepared["status"]))
+        records += pack_files(prepared["conflict_files"])
+        records += pack_fingerprints(prepared["conflict_files"], prepared["conflict_fingerprints"])
+        records += bytes.fromhex(prepared["integration_commit"])
+        records += struct.pack("<B", len(prepared["integration_parents"]))
+        records += b"".join(bytes.fromhex(parent) for parent in prepared["integration_parents"])
+
+    records += struct.pack("<I", len(shard.conflicts))
+    for fingerprint, conflict in sorted(shard.conflicts.items()):
+        records += struct.pack(
+            "<IIIQ", intern(fingerprint), conflict["hunks"], conflict["lines"], conflict["first_seen"]
+        )
+
+    body = bytearray(struct.pack("<I", len(strings)))
+    for value in strings:
+        encoded = value.encode("utf-8")
+        body += struct.pack("<I", len(encoded)) + encoded
+    body += struct.pack("<BI", oid_length, len(shard.pairs)) + records
+
+    return CACHE_SHARD_MAGIC + struct.pack("<B", CACHE_SHARD_VERSION) + zlib.compress(bytes(body), 6)
+
+
+def decode_cache_shard(data: bytes) -> CacheShard:
+    header_length = len(CACHE_SHARD_MAGIC) + 1
+    if data[: len(CACHE_SHARD_MAGIC)] != CACHE_SHARD_MAGIC or len(data) < header_length:
+        raise ValueError("not an analysis cache shard")
+    version = data[len(CACHE_SHARD_MAGIC)]
+    if version not in CACHE_SHARD_SUPPORTED_VERSIONS:
+        raise ValueError(f"unsupported cache shard version: {version}")
+
+    try:
+        body = zlib.decompress(data[header_length:])
+        offset = 0
+
+        def unpack(fmt: str) -> Tuple[int, ...]:
+            nonlocal offset
+            values = struct.unpack_from(fmt, body, offset)
+            offset += struct.calcsize(fmt)
+            return values
+
+        def unpack_oid() -> str:
+            nonlocal offset
+            value = body[offset : offset + oid_length]
+            if len(value) != oid_length:
+                raise IndexError("truncated object id")
+            offset += oid_length
+            return value.hex()
+
+        def unpack_files() -> List[str]:
+            (count,) = unpack("<H" if version < 4 else "<I")
+            return [strings[index] for index in unpack(f"<{count}I")]
+
+        def unpack_fingerprints(files: Sequence[str]) -> List[str]:
+            if version < 3:
+                return [""] * len(files)
+            return [strings[index] for index in unpack(f"<{len(files)}I")]
+
+        (string_count,) = unpack("<I")
+        strings: List[str] = []
+        for _ in range(string_count):
+            (length,) = unpack("<I")
+            strings.append(body[offset : offset + length].decode("utf-8"))
+            offset += length
+
+        oid_length, entry_count = unpack("<BI")
+        shard = CacheShard()
+        for _ in range(entry_count):
+            first_tip = unpack_oid()
+            second_tip = unpack_oid()
+            pair_code, first_code, second_code = unpack("<BBB")
+            first_files = unpack_files()
+            first_fingerprints = unpack_fingerprints(first_files)
+            second_files = unpack_files()
+            second_fingerprints = unpack_fingerprints(second_files)
+            shard.pairs[(first_tip, second_tip)] = {
+                "pair_status": _PAIR_STATUS_CODES[pair_code],
+                "first_then_second_status": _SEQUENCE_STATUS_CODES[first_code],
+                "first_then_second_conflict_files": first_files,
+                "second_then_first_status": _SEQUENCE_STATUS_CODES[second_code],
+                "second_then_first_conflict_files": second_files,
+                "first_then_second_conflict_fingerprints": first_fingerprints,
+                "second_then_first_conflict_fingerprints": second_fingerprints,
+            }
+
+        if version >= 2:
+            (prepared_count,) = unpack("<I")
+            for _ in range(prepared_count):
+                tip = unpack_oid()
+                (status_code,) = unpack("<B")
+                conflict_files = unpack_files()
+                conflict_fingerprints = unpack_fingerprints(conflict_files)
+                integration_commit = unpack_oid()
+                (parent_count,) = unpack("<B")
+                shard.prepared[tip] = {
+                    "status": _PREPARED_STATUS_CODES[status_code],
+                    "conflict_files": conflict_files,
+                    "conflict_fingerprints": conflict_fingerprints,
+                    "integration_commit": integration_commit,
+                    "integration_parents": [unpack_oid() for _ in range(parent_count)],
+                }
+
+        if version >= 3:
+            (conflict_count,) = unpack("<I")
+            for _ in range(conflict_count):
+                fingerprint_index, hunks, lines, first_seen = unpack("<IIIQ")
+                shard.conflicts[strings[fingerprint_index]] = {
+                    "hunks": hunks,
+                    "lines": lines,
+                    "first_seen": first_seen,
+                }
+    except (zlib.error, struct.error, IndexError, UnicodeDecodeError) as exc:
+        raise ValueError(f"corrupted cache shard: {exc}") from exc
+
+    return shard
+
+
+class CacheJournal:
+    """单个分片的追加日志，写入先进入内存缓冲，由后台线程按固定间隔刷到磁盘。"""
+
+    _RECORD_HEADER = struct.Struct("<II")
+
     def __init__(self, path: Path) -> None:
         self.path = path
-        self._pair_results: Dict[str, PairCacheEntryPayload] = {}
-        self._dirty = False
+        self._buffer = bytearray()
+        self._lock = threading.Lock()
+
+    def append(self, delta: CacheShard) -> None:
+        record = encode_cache_shard(delta)
+        with self._lock:
+            self._buffer += self._RECORD_HEADER.pack(len(record), zlib.crc32(record)) + record
+
+    def flush(self) -> None:
+        with self._lock:
+            if not self._buffer:
+                return
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with self.path.open("ab") as file_obj:
+                file_obj.write(self._buffer)
+                file_obj.flush()
+                os.fsync(file_obj.fileno())
+            self._buffer.clear()
+
+    def discard(self) -> None:
+        with self._lock:
+            self._buffer.clear()
+            self.path.unlink(missing_ok=True)
+
+    @classmethod
+    def replay(cls, path: Path) -> CacheShard:
+        entries = CacheShard()
+        try:
+            data = path.read_bytes()
+        except OSError:
+            return entries
+
+        offset = 0
+        while offset + cls._RECORD_HEADER.size <= len(data):
+            length, checksum = cls._RECORD_HEADER.unpack_from(data, offset)
+            record = data[offset + cls._RECORD_HEADER.size : offset + cls._RECORD_HEADER.size + length]
+            # 末尾可能是进程被杀时只写了一半的记录，遇到即停止
+            if len(record) != length or zlib.crc32(record) != checksum:
+                break
+            try:
+                entries.update(decode_cache_shard(record))
+            except ValueError:
+                break
+            offset += cls._RECORD_HEADER.size + length
+        return entries
+
+
+class AnalysisCache:
+    """按主分支提交分片存储的分析缓存，只在首次访问某个主分支提交时读取对应分片。
+
+    每次写入结果都会追加到该分片的日志中并在限定时间内落盘；下次加载分片时日志会被合并进分片。
+    """
+
+    def __init__(
+        self,
+        directory: Path,
+        max_age_days: float = DEFAULT_CACHE_MAX_AGE_DAYS,
+        flush_interval: float = CACHE_JOURNAL_FLUSH_SECONDS,
+    ) -> None:
+        self.directory = directory
+        self.max_age_days = max_age_days
+        self.flush_interval = flush_interval
+        self._shards: Dict[str, CacheShard] = {}
+        self._dirty_shards: Set[str] = set()
+        # 冲突指纹跨主分支提交去重，单独存放在一张全局表中，首次用到时才读取
+        self._conflicts: Optional[ConflictEntries] = None
+        self._conflicts_dirty = False
+        self._journals: Dict[str, CacheJournal] = {}
+        self._journals_lock = threading.Lock()
+        self._flusher: Optional[threading.Thread] = None
+        self._flusher_stop = threading.Event()
 
     @classmethod
-    def load(cls, path: Path) -> "AnalysisCache":
-        cache = cls(path)
-        if not path.exists():
-            return cache
+    def load(cls, directory: Path, max_age_days: float = DEFAULT_CACHE_MAX_AGE_DAYS) -> "AnalysisCache":
+        cache = cls(directory, max_age_days)
+        cache._migrate_legacy_file(directory.with_suffix(".json"))
+        return cache
+
+    def _shard_path(self, main_commit: str) -> Path:
+        return self.directory / f"{main_commit}{CACHE_SHARD_SUFFIX}"
+
+    def _conflict_table_path(self) -> Path:
+        return self.directory / f"{CONFLICT_TABLE_NAME}{CACHE_SHARD_SUFFIX}"
+
+    def _conflict_table(self) -> ConflictEntries:
+        if self._conflicts is None:
+            try:
+                self._conflicts = decode_cache_shard(self._conflict_table_path().read_bytes()).conflicts
+            except (OSError, ValueError):
+                self._conflicts = {}
+        return self._conflicts
+
+    def _absorb_conflicts(self, conflicts: ConflictEntries) -> None:
+        table = self._conflict_table()
+        for fingerprint, payload in conflicts.items():
+            known = table.get(fingerprint)
+            if known is None or payload["first_seen"] < known["first_seen"]:
+                table[fingerprint] = payload
+                self._conflicts_dirty = True
+        conflicts.clear()
+
+    def _write_conflict_table(self) -> None:
+        if not self._conflicts_dirty:
+            return
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self._conflict_table_path()
+        temp_path = path.with_suffix(path.suffix + ".tmp")
+        temp_path.write_bytes(encode_cache_shard(CacheShard(conflicts=self._conflict_table())))
+        temp_path.replace(path)
+        self._conflicts_dirty = False
+
+    def _journal(self, main_commit: str) -> CacheJournal:
+        with self._journals_lock:
+            journal = self._journals.get(main_commit)
+            if journal is None:
+                journal = CacheJournal(self.directory / f"{main_commit}{CACHE_JOURNAL_SUFFIX}")
+                self._journals[main_commit] = journal
+
+        if self._flusher is None:
+            self._flusher = threading.Thread(target=self._flush_periodically, name="cache-journal", daemon=True)
+            self._flusher.start()
+        return journal
+
+    def _flush_periodically(self) -> None:
+        while not self._flusher_stop.wait(self.flush_interval):
+            self.flush_journals()
+
+    def flush_journals(self) -> None:
+        with self._journals_lock:
+            journals = list(self._journals.values())
+        for journal in journals:
+            journal.flush()
+
+    def _migrate_legacy_file(self, legacy_path: Path) -> None:
+        if not legacy_path.exists():
+            return
 
         try:
-            payload = json.loads(path.read_text(encoding="utf-8"))
+            payload = json.loads(legacy_path.read_text(encoding="utf-8"))
             validated_payload = ANALYSIS_CACHE_PAYLOAD_ADAPTER.validate_python(payload)
         except (OSError, json.JSONDecodeError, ValidationError):
-            return cache
+            validated_payload = {}
 
-        cache._pair_results = validated_payload
-        return cache
+        for pair_key, entry_payload in validated_payload.items():
+            main_commit, first_tip, second_tip = pair_key.split(":")
+            self._shard(main_commit).pairs[(first_tip, second_tip)] = entry_payload
+            self._dirty_shards.add(main_commit)
+
+        self.save()
+        legacy_path.unlink(missing_ok=True)
+
+    def _shard(self, main_commit: str) -> CacheShard:
+        shard = self._shards.get(main_commit)
+        if shard is not None:
+            return shard
+
+        shard = CacheShard()
+        path = self._shard_path(main_commit)
+        try:
+            shard = decode_cache_shard(path.read_bytes())
+            # 以修改时间记录分片最近一次被使用的时间，供过期清理判断
+            os.utime(path)
+        except (OSError, ValueError):
+            pass
+
+        self._shards[main_commit] = shard
+
+        # 上次运行中断时留下的日志：合并进分片并立即压实，其中的冲突指纹移入全局表
+        journal_path = self.directory / f"{main_commit}{CACHE_JOURNAL_SUFFIX}"
+        journal_entries = CacheJournal.replay(journal_path)
+        if journal_entries:
+            shard.update(journal_entries)
+            self._absorb_conflicts(shard.conflicts)
+            self._write_conflict_table()
+            self._write_shard(main_commit)
+        journal_path.unlink(missing_ok=True)
+        return shard
+
+    def _write_shard(self, main_commit: str) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self._shard_path(main_commit)
+        temp_path = path.with_suffix(path.suffix + ".tmp")
+        temp_path.write_bytes(encode_cache_shard(self._shards[main_commit]))
+        temp_path.replace(path)
 
     @staticmethod
-    def _pair_key(main_commit: str, first_tip: str, second_tip: str) -> str:
+    def _tip_key(first_tip: str, second_tip: str) -> Tuple[str, str]:
         ordered_tips = sorted((first_tip, second_tip))
-        return ":".join((main_commit, ordered_tips[0], ordered_tips[1]))
+        return ordered_tips[0], ordered_tips[1]
+
+    def _details_from_fingerprints(self, files: Sequence[str], fingerprints: Sequence[str]) -> List[ConflictDetail]:
+        table = self._conflict_table()
+        details: List[ConflictDetail] = []
+        for path, fingerprint in zip(files, [*fingerprints, *[""] * (len(files) - len(fingerprints))]):
+            payload = table.get(fingerprint) if fingerprint else None
+            if payload is None:
+                details.append(ConflictDetail.unknown(path))
+                continue
+            details.append(
+                ConflictDetail(
+                    path=path,
+                    hunks=payload["hunks"],
+                    lines=payload["lines"],
+                    fingerprint=fingerprint,
+                    first_seen=time.strftime("%Y-%m-%dT%H:%M:%S%z", time.localtime(payload["first_seen"])),
+                )
+            )
+        return details
+
+    def _register_conflicts(self, details: Sequence[ConflictDetail], new_conflicts: ConflictEntries) -> List[str]:
+        """登记尚未见过的冲突指纹，返回与冲突文件一一对应的指纹列表。"""
+        table = self._conflict_table()
+        now = int(time.time())
+        for detail in details:
+            if detail.fingerprint and detail.fingerprint not in table:
+                new_conflicts[detail.fingerprint] = {"hunks": detail.hunks, "lines": detail.lines, "first_seen": now}
+                table[detail.fingerprint] = new_conflicts[detail.fingerprint]
+                self._conflicts_dirty = True
+        return [detail.fingerprint for detail in details]
 
-    @staticmethod
     def _pair_result_from_payload(
+        self,
         payload: PairCacheEntryPayload,
         branch_a: BranchInfo,
         branch_b: BranchInfo,
     ) -> "PairResult":
+        first_then_second_details = self._details_from_fingerprints(
+            payload["first_then_second_conflict_files"], payload.get("first_then_second_conflict_fingerprints", [])
+        )
+        second_then_first_details = self._details_from_fingerprints(
+            payload["second_then_first_conflict_files"], payload.get("second_then_first_conflict_fingerprints", [])
+        )
         if branch_a.tip <= branch_b.tip:
             a_then_b_status = payload["first_then_second_status"]
-            a_then_b_conflict_files = payload["first_then_second_conflict_files"]
+            a_then_b_conflict_details = first_then_second_details
             b_then_a_status = payload["second_then_first_status"]
-            b_then_a_conflict_files = payload["second_then_first_conflict_files"]
+            b_then_a_conflict_details = second_then_first_details
         else:
             a_then_b_status = payload["second_then_first_status"]
-            a_then_b_conflict_files = payload["second_then_first_conflict_files"]
+            a_then_b_conflict_details = second_then_first_details
             b_then_a_status = payload["first_then_second_status"]
-            b_then_a_conflict_files = payload["first_then_second_conflict_files"]
+            b_then_a_conflict_details = first_then_second_details
 
         return PairResult(
             branch_a=branch_a.name,
             branch_b=branch_b.name,
             pair_status=payload["pair_status"],
             a_then_b_status=a_then_b_status,
-            a_then_b_conflict_files=list(a_then_b_conflict_files),
+            a_then_b_conflict_files=[detail.path for detail in a_then_b_conflict_details],
             b_then_a_status=b_then_a_status,
-            b_then_a_conflict_files=list(b_then_a_conflict_files),
+            b_then_a_conflict_files=[detail.path for detail in b_then_a_conflict_details],
+            a_then_b_conflict_details=a_then_b_conflict_details,
+            b_then_a_conflict_details=b_then_a_conflict_details,
         )
 
-    @staticmethod
     def _payload_from_pair_result(
+        self,
         branch_a: BranchInfo,
         branch_b: BranchInfo,
         result: "PairResult",
+        new_conflicts: ConflictEntries,
     ) -> PairCacheEntryPayload:
         if branch_a.tip <= branch_b.tip:
             first_then_second_status = result.a_then_b_status
-            first_then_second_conflict_files = result.a_then_b_conflict_files
+            first_then_second_conflict_details = result.a_then_b_conflict_details
             second_then_first_status = result.b_then_a_status
-            second_then_first_conflict_files = result.b_then_a_conflict_files
+            second_then_first_conflict_details = result.b_then_a_conflict_details
         else:
             first_then_second_status = result.b_then_a_status
-            first_then_second_conflict_files = result.b_then_a_conflict_files
+            first_then_second_conflict_details = result.b_then_a_conflict_details
             second_then_first_status = result.a_then_b_status
-            second_then_first_conflict_files = result.a_then_b_conflict_files
+            second_then_first_conflict_details = result.a_then_b_conflict_details
 
         return {
             "pair_status": result.pair_status,
             "first_then_second_status": first_then_second_status,
-            "first_then_second_conflict_files": list(first_then_second_conflict_files),
+            "first_then_second_conflict_files": [detail.path for detail in first_then_second_conflict_details],
             "second_then_first_status": second_then_first_status,
-            "second_then_first_conflict_files": list(second_then_first_conflict_files),
+            "second_then_first_conflict_files": [detail.path for detail in second_then_first_conflict_details],
+            "first_then_second_conflict_fingerprints": self._register_conflicts(
+                first_then_second_conflict_details, new_conflicts
+            ),
+            "second_then_first_conflict_fingerprints": self._register_conflicts(
+                second_then_first_conflict_details, new_conflicts
+            ),
         }
 
+    @profiled("phase")
     def get_pair_result(
         self,
         main_commit: str,
         branch_a: BranchInfo,
         branch_b: BranchInfo,
     ) -> Optional["PairResult"]:
-        payload = self._pair_results.get(self._pair_key(main_commit, branch_a.tip, branch_b.tip))
+        payload = self._shard(main_commit).pairs.get(self._tip_key(branch_a.tip, branch_b.tip))
         if payload is None:
             return None
         return self._pair_result_from_payload(payload, branch_a, branch_b)
@@ -343,32 +1425,105 @@ class AnalysisCache:
         branch_a: BranchInfo,
         branch_b: BranchInfo,
         result: "PairResult",
-    ) -> None:
-        cache_key = self._pair_key(main_commit, branch_a.tip, branch_b.tip)
-        payload = self._payload_from_pair_result(branch_a, branch_b, result)
-        if self._pair_results.get(cache_key) == payload:
+    ) -> "PairResult":
+        """写入分支对结果，返回补全了冲突指纹首次出现时间的结果。"""
+        shard = self._shard(main_commit)
+        tip_key = self._tip_key(branch_a.tip, branch_b.tip)
+        new_conflicts: ConflictEntries = {}
+        payload = self._payload_from_pair_result(branch_a, branch_b, result, new_conflicts)
+        if shard.pairs.get(tip_key) != payload or new_conflicts:
+            shard.pairs[tip_key] = payload
+            self._dirty_shards.add(main_commit)
+            self._journal(main_commit).append(CacheShard(pairs={tip_key: payload}, conflicts=new_conflicts))
+        return self._pair_result_from_payload(payload, branch_a, branch_b)
+
+    def get_prepared_merges(self, main_commit: str) -> Dict[str, "PreparedMerge"]:
+        return {
+            tip: PreparedMerge(
+                status=payload["status"],
+                conflict_files=tuple(payload["conflict_files"]),
+                conflict_details=tuple(
+                    self._details_from_fingerprints(payload["conflict_files"], payload["conflict_fingerprints"])
+                ),
+                integration_commit=payload["integration_commit"],
+                integration_parents=tuple(payload["integration_parents"]),
+            )
+            for tip, payload in self._shard(main_commit).prepared.items()
+        }
+
+    def store_prepared_merge(self, main_commit: str, tip: str, prepared: "PreparedMerge") -> None:
+        shard = self._shard(main_commit)
+        new_conflicts: ConflictEntries = {}
+        payload: PreparedCacheEntryPayload = {
+            "status": prepared.status,
+            "conflict_files": list(prepared.conflict_files),
+            "conflict_fingerprints": self._register_conflicts(prepared.conflict_details, new_conflicts),
+            "integration_commit": prepared.integration_commit,
+            "integration_parents": list(prepared.integration_parents),
+        }
+        if shard.prepared.get(tip) == payload and not new_conflicts:
             return
 
-        self._pair_results[cache_key] = payload
-        self._dirty = True
+        shard.prepared[tip] = payload
+        self._dirty_shards.add(main_commit)
+        self._journal(main_commit).append(CacheShard(prepared={tip: payload}, conflicts=new_conflicts))
+
+    def main_commits(self) -> Set[str]:
+        """仍有缓存内容的主分支提交，包括磁盘上尚未加载的分片与日志。"""
+        main_commits = {main_commit for main_commit, shard in self._shards.items() if shard}
+        if self.directory.is_dir():
+            main_commits.update(
+                path.stem
+                for path in self.directory.iterdir()
+                if path.suffix in {CACHE_SHARD_SUFFIX, CACHE_JOURNAL_SUFFIX} and path.stem != CONFLICT_TABLE_NAME
+            )
+        return main_commits
 
+    @profiled("phase")
     def save(self) -> None:
-        if not self._dirty:
+        # 冲突指纹表先于分片落盘，丢弃日志时其中登记的指纹已经保存
+        self._write_conflict_table()
+        for main_commit in sorted(self._dirty_shards):
+            self._write_shard(main_commit)
+            # 分片已包含日志中的全部记录，日志可以丢弃
+            with self._journals_lock:
+                journal = self._journals.get(main_commit)
+            if journal is not None:
+                journal.discard()
+        self._dirty_shards.clear()
+        self.evict_expired()
+
+    def close(self) -> None:
+        self._flusher_stop.set()
+        if self._flusher is not None:
+            self._flusher.join()
+            self._flusher = None
+        self.save()
+
+    def evict_expired(self) -> None:
+        if self.max_age_days <= 0 or not self.directory.is_dir():
             return
 
-        payload: AnalysisCachePayload = {
-            pair_key: entry_payload for pair_key, entry_payload in sorted(self._pair_results.items())
-        }
-        serializable_payload = ANALYSIS_CACHE_PAYLOAD_ADAPTER.dump_python(payload, mode="json")
+        deadline = time.time() - self.max_age_days * 86400
+        for path in self.directory.iterdir():
+            if path.suffix not in {CACHE_SHARD_SUFFIX, CACHE_JOURNAL_SUFFIX} or path.stem in self._shards:
+                continue
+            if path.stem == CONFLICT_TABLE_NAME:
+                continue
+            try:
+                if path.stat().st_mtime < deadline:
+                    path.unlink()
+            except OSError:
+                continue
 
-        self.path.parent.mkdir(parents=True, exist_ok=True)
-        temp_path = self.path.with_suffix(self.path.suffix + ".tmp")
-        temp_path.write_text(
-            json.dumps(serializable_payload, ensure_ascii=False, indent=2) + "\n",
-            encoding="utf-8",
-        )
-        temp_path.replace(self.path)
-        self._dirty = False
+
+@dataclass(frozen=True)
+class MergeAttempt:
+    parents: Tuple[str, str]
+    clean: bool
+    conflict_files: Tuple[str, ...]
+    tree: Optional[str] = None
+    conflict_details: Tuple[ConflictDetail, ...] = ()
 
 
 @dataclass(frozen=True)
@@ -376,6 +1531,9 @@ class PreparedMerge:
     status: PreparedMergeStatus
     conflict_files: Tuple[str, ...]
     integration_commit: str
+    # 集成提交的父提交均来自源仓库，集成提交包含某个提交当且仅当某个父提交包含它
+    integration_parents: Tuple[str, ...]
+    conflict_details: Tuple[ConflictDetail, ...] = ()
 
     @classmethod
     def already_contained(cls, integration_commit: str) -> Self:
@@ -383,56 +1541,78 @@ class PreparedMerge:
             status=PreparedMergeStatus.ALREADY_CONTAINED,
             conflict_files=(),
             integration_commit=integration_commit,
+            integration_parents=(integration_commit,),
         )
 
     @classmethod
-    def conflict_with_main(cls, conflict_files: Sequence[str], integration_commit: str) -> Self:
+    def conflict_with_main(cls, conflict_details: Sequence[ConflictDetail], integration_commit: str) -> Self:
         return cls(
             status=PreparedMergeStatus.CONFLICT_WITH_MAIN,
-            conflict_files=tuple(conflict_files),
+            conflict_files=tuple(detail.path for detail in conflict_details),
             integration_commit=integration_commit,
+            integration_parents=(integration_commit,),
+            conflict_details=tuple(conflict_details),
         )
 
     @classmethod
-    def clean(cls, integration_commit: str) -> Self:
+    def clean(cls, integration_commit: str, integration_parents: Sequence[str]) -> Self:
         return cls(
             status=PreparedMergeStatus.CLEAN,
             conflict_files=(),
             integration_commit=integration_commit,
+            integration_parents=tuple(integration_parents),
         )
 
     @classmethod
+    @profiled("phase")
     def from_main_merge(
         cls,
-        source_repo: Path,
+        ancestry: "AncestryIndex",
         lab: "MergeLab",
         main_commit: str,
         branch: BranchInfo,
     ) -> Self:
-        if branch.tip == main_commit or is_ancestor(source_repo, branch.tip, main_commit):
+        if ancestry.is_ancestor(branch.tip, main_commit):
             return cls.already_contained(main_commit)
 
-        lab.reset_to(main_commit)
-        clean, conflict_files = lab.merge_without_commit(branch.tip)
-        if not clean:
-            return cls.conflict_with_main(conflict_files, main_commit)
+        attempt = lab.merge(main_commit, branch.tip)
+        if not attempt.clean:
+            return cls.conflict_with_main(attempt.conflict_details, main_commit)
 
-        integration_commit = lab.commit_merge(f"temp merge {branch.name} into main")
-        return cls.clean(integration_commit)
+        integration_commit = lab.commit_attempt(attempt, f"temp merge {branch.name} into main")
+        return cls.clean(integration_commit, attempt.parents)
 
-    def analyse_followup(self, lab: "MergeLab", second_branch: BranchInfo) -> SequenceResult:
+    @profiled("phase")
+    def analyse_followup(
+        self,
+        lab: "MergeLab",
+        second_branch: BranchInfo,
+        ancestry: "AncestryIndex",
+    ) -> SequenceResult:
         if self.status is PreparedMergeStatus.CONFLICT_WITH_MAIN:
-            return SequenceResult.first_conflicts_with_main(self.conflict_files)
+            return SequenceResult.first_conflicts_with_main(self.conflict_details)
 
         current_commit = self.integration_commit
-        if is_ancestor(lab.path, second_branch.tip, current_commit):
+        if any(ancestry.is_ancestor(second_branch.tip, parent) for parent in self.integration_parents):
             return SequenceResult.already_contained()
 
-        lab.reset_to(current_commit)
-        clean, conflict_files = lab.merge_without_commit(second_branch.tip)
-        if clean:
+        attempt = lab.merge(current_commit, second_branch.tip)
+        if attempt.clean:
             return SequenceResult.clean()
-        return SequenceResult.conflict(conflict_files)
+        return SequenceResult.conflict(attempt.conflict_details)
+
+    def needs_followup_merge(self, second_branch: BranchInfo, ancestry: "AncestryIndex") -> bool:
+        """`main + 本分支 + second_branch` 是否需要真正执行一次合并；否则结果可由预合并状态与祖先关系直接得出。"""
+        if self.status is PreparedMergeStatus.CONFLICT_WITH_MAIN:
+            return False
+        return not any(ancestry.is_ancestor(second_branch.tip, parent) for parent in self.integration_parents)
+
+    @profiled("phase")
+    def predict_clean_followup(self, second_branch: BranchInfo, ancestry: "AncestryIndex") -> SequenceResult:
+        """预筛已确认后续合并不会冲突时，不执行合并直接给出与真实合并一致的结果。"""
+        if any(ancestry.is_ancestor(second_branch.tip, parent) for parent in self.integration_parents):
+            return SequenceResult.already_contained()
+        return SequenceResult.clean()
 
 
 @dataclass(frozen=True)
@@ -444,6 +1624,8 @@ class PairResult:
     a_then_b_conflict_files: List[str]
     b_then_a_status: SequenceStatus
     b_then_a_conflict_files: List[str]
+    a_then_b_conflict_details: List[ConflictDetail] = field(default_factory=list)
+    b_then_a_conflict_details: List[ConflictDetail] = field(default_factory=list)
 
     @classmethod
     def from_sequences(
@@ -461,8 +1643,16 @@ class PairResult:
             a_then_b_conflict_files=list(sequence_ab.conflict_files),
             b_then_a_status=sequence_ba.status,
             b_then_a_conflict_files=list(sequence_ba.conflict_files),
+            a_then_b_conflict_details=list(sequence_ab.conflict_details),
+            b_then_a_conflict_details=list(sequence_ba.conflict_details),
         )
 
+    @property
+    def mergeless_sequence_count(self) -> int:
+        """两个合并序列中由与主分支冲突或已包含关系直接得出结论、没有执行后续合并的个数（不区分是否预筛）。"""
+        decided_without_merge = {SequenceStatus.FIRST_CONFLICTS_WITH_MAIN, SequenceStatus.ALREADY_CONTAINED}
+        return sum(status in decided_without_merge for status in (self.a_then_b_status, self.b_then_a_status))
+
     @property
     def sort_key(self) -> Tuple[int, int, int, str, str]:
         return (
@@ -474,7 +1664,9 @@ class PairResult:
         )
 
     @staticmethod
-    def _format_conflict_files(values: Sequence[str]) -> str:
+    def _format_conflict_files(values: Sequence[str], details: Sequence[ConflictDetail]) -> str:
+        if details:
+            return "\n".join(detail.describe() for detail in details)
         return "\n".join(values) if values else "-"
 
     def to_row(self) -> Dict[str, str]:
@@ -483,18 +1675,57 @@ class PairResult:
             "branch_b": self.branch_b,
             "pair_status": self.pair_status,
             "a_then_b_status": self.a_then_b_status,
-            "a_then_b_conflict_files": self._format_conflict_files(self.a_then_b_conflict_files),
+            "a_then_b_conflict_files": self._format_conflict_files(
+                self.a_then_b_conflict_files, self.a_then_b_conflict_details
+            ),
             "b_then_a_status": self.b_then_a_status,
-            "b_then_a_conflict_files": self._format_conflict_files(self.b_then_a_conflict_files),
+            "b_then_a_conflict_files": self._format_conflict_files(
+                self.b_then_a_conflict_files, self.b_then_a_conflict_details
+            ),
+        }
+
+
+@dataclass(frozen=True)
+class MergePlanStep:
+    branch: str
+    # 按两两结果预测：该分支在此位置合入时，与已合入分支产生的冲突文件数
+    predicted_conflict_files: int
+    status: SequenceStatus
+    conflict_files: List[str]
+
+    def to_row(self, index: int) -> Dict[str, str]:
+        return {
+            "index": str(index),
+            "branch": self.branch,
+            "predicted_conflict_files": str(self.predicted_conflict_files),
+            "status": self.status,
+            "conflict_files": "\n".join(self.conflict_files) if self.conflict_files else "-",
         }
 
 
+@dataclass(frozen=True)
+class MergePlan:
+    order: List[str]
+    predicted_conflict_files: int
+    steps: List[MergePlanStep]
+
+    @property
+    def conflict_step_count(self) -> int:
+        return sum(step.status.is_conflict for step in self.steps)
+
+
 @dataclass(frozen=True)
 class AnalysisReport:
     main_branch: str
     main_commit: str
     tested_branches: List[str]
     pair_results: List[PairResult]
+    prefiltered_pair_count: int
+    merge_plan: Optional[MergePlan] = None
+    strategy_options: List[str] = field(default_factory=list)
+    # 本次实际分析（未命中缓存）且未被预筛的分支对中，没有执行后续合并就得出结论的合并序列数；
+    # 这类序列由预合并结果直接判定，预筛判定的分支对另见 prefiltered_pair_count
+    mergeless_sequence_count: int = 0
 
     @classmethod
     def create(
@@ -503,12 +1734,18 @@ class AnalysisReport:
         main_commit: str,
         tested_branches: Sequence[str],
         pair_results: Sequence[PairResult],
+        prefiltered_pair_count: int = 0,
+        strategy_options: Sequence[str] = (),
+        mergeless_sequence_count: int = 0,
     ) -> Self:
         return cls(
             main_branch=main_branch,
             main_commit=main_commit,
             tested_branches=list(tested_branches),
             pair_results=sorted(pair_results, key=lambda item: item.sort_key),
+            prefiltered_pair_count=prefiltered_pair_count,
+            strategy_options=list(strategy_options),
+            mergeless_sequence_count=mergeless_sequence_count,
         )
 
     @property
@@ -529,19 +1766,122 @@ class AnalysisReport:
         return payload
 
 
+class MergeOrderPlanner:
+    """根据两两合并结果构造冲突图，为整批分支寻找人工冲突最少的合并顺序。
+
+    `先 A 后 B` 冲突时记一条 A -> B 的边，权重为冲突文件数；问题即带权最小反馈弧集。
+    先用 Eades-Lin-Smyth 贪心得到初始顺序，再逐个分支移动到最优位置直到不再改进，
+    整体为 O(n^2) 每轮，100 个分支也只需毫秒级时间。
+    """
+
+    MAX_IMPROVEMENT_PASSES = 50
+
+    def __init__(self, report: AnalysisReport) -> None:
+        self.branches = sorted(report.tested_branches)
+        index = {branch: position for position, branch in enumerate(self.branches)}
+        size = len(self.branches)
+        self.costs = [[0] * size for _ in range(size)]
+        main_conflicts: Set[str] = set()
+        for pair in report.pair_results:
+            a, b = index[pair.branch_a], index[pair.branch_b]
+            for first, second, status, files in (
+                (a, b, pair.a_then_b_status, pair.a_then_b_conflict_files),
+                (b, a, pair.b_then_a_status, pair.b_then_a_conflict_files),
+            ):
+                if status is SequenceStatus.FIRST_CONFLICTS_WITH_MAIN:
+                    main_conflicts.add(self.branches[first])
+                elif status is SequenceStatus.CONFLICT:
+                    self.costs[first][second] = max(1, len(files))
+        # 与主分支本身冲突的分支无论放在哪里都需要人工处理，两两结果也无从比较，统一排在最后
+        self.main_conflicts = main_conflicts
+
+    def order_cost(self, order: Sequence[int]) -> int:
+        return sum(self.costs[first][second] for i, first in enumerate(order) for second in order[i + 1 :])
+
+    def step_costs(self, order: Sequence[str]) -> List[int]:
+        index = {branch: position for position, branch in enumerate(self.branches)}
+        positions = [index[branch] for branch in order]
+        return [sum(self.costs[earlier][node] for earlier in positions[:i]) for i, node in enumerate(positions)]
+
+    def _greedy_order(self, nodes: Sequence[int]) -> List[int]:
+        remaining = set(nodes)
+        out_weight = {node: sum(self.costs[node][other] for other in remaining) for node in remaining}
+        in_weight = {node: sum(self.costs[other][node] for other in remaining) for node in remaining}
+        head: List[int] = []
+        tail: List[int] = []
+
+        def remove(chosen: Sequence[int]) -> None:
+            remaining.difference_update(chosen)
+            for node in remaining:
+                for removed in chosen:
+                    out_weight[node] -= self.costs[node][removed]
+                    in_weight[node] -= self.costs[removed][node]
+
+        while remaining:
+            sinks = sorted(node for node in remaining if out_weight[node] == 0)
+            if sinks:
+                # 不会让任何后续分支冲突的分支放到最后合入最安全
+                tail = sinks + tail
+                remove(sinks)
+                continue
+            sources = sorted(node for node in remaining if in_weight[node] == 0)
+            if sources:
+                head.extend(sources)
+                remove(sources)
+                continue
+            best = max(sorted(remaining), key=lambda node: out_weight[node] - in_weight[node])
+            head.append(best)
+            remove([best])
+        return head + tail
+
+    def _improve(self, order: List[int]) -> List[int]:
+        for _ in range(self.MAX_IMPROVEMENT_PASSES):
+            improved = False
+            for node in list(order):
+                current_position = order.index(node)
+                others = order[:current_position] + order[current_position + 1 :]
+                # 插入位置从最前开始向后扫描：每越过一个分支 u，代价变化 c[u][node] - c[node][u]
+                cost = sum(self.costs[node][other] for other in others)
+                position_costs = [cost]
+                for other in others:
+                    cost += self.costs[other][node] - self.costs[node][other]
+                    position_costs.append(cost)
+                best_position = min(range(len(position_costs)), key=position_costs.__getitem__)
+                if position_costs[best_position] < position_costs[current_position]:
+                    others.insert(best_position, node)
+                    order = others
+                    improved = True
+            if not improved:
+                break
+        return order
+
+    def plan(self) -> Tuple[List[str], int]:
+        """返回建议的合并顺序及其按两两结果预测的冲突文件总数。"""
+        index = {branch: position for position, branch in enumerate(self.branches)}
+        train = [index[branch] for branch in self.branches if branch not in self.main_conflicts]
+        order = self._improve(self._greedy_order(train))
+        order += sorted(index[branch] for branch in self.main_conflicts)
+        return [self.branches[node] for node in order], self.order_cost(order)
+
+
 def run_git(
     repo: Path,
     *args: str,
     check: bool = True,
     allowed_returncodes: Tuple[int, ...] = (0,),
+    input: Optional[str] = None,
 ) -> subprocess.CompletedProcess[str]:
+    started = time.perf_counter()
     result = subprocess.run(
         ["git", "-C", str(repo), *args],
+        input=input,
         capture_output=True,
         text=True,
         encoding="utf-8",
         errors="replace",
     )
+    if PROFILER.enabled:
+        PROFILER.record("git", git_subcommand(args), started, time.perf_counter() - started, len(result.stdout))
     if check and result.returncode not in allowed_returncodes:
         stderr = result.stderr.strip()
         stdout = result.stdout.strip()
@@ -550,67 +1890,259 @@ def run_git(
     return result
 
 
-def validate_repo(repo: Path) -> Path:
-    run_git(repo, "rev-parse", "--git-dir")
-    return repo
+class GitBatch:
+    """
+    长驻的 `git cat-file --batch-check` 进程，批量把修订表达式解析为对象 ID，避免每次查询都新建 git 进程。
 
+    需要读取对象内容时，再按需启动同一仓库上的 `git cat-file --batch` 进程。
+    """
 
-def split_remote_branch(refname: str) -> Optional[Tuple[str, str]]:
-    prefix = "refs/remotes/"
-    if not refname.startswith(prefix):
-        return None
+    # 每批写入的请求数；git 不带 --buffer 时逐行刷新输出，分批读写可避免管道缓冲区写满造成死锁
+    _CHUNK_SIZE = 256
 
-    suffix = refname[len(prefix) :]
-    if "/" not in suffix:
-        return None
+    def __init__(self, repo: Path) -> None:
+        self.repo = repo
+        self._lock = threading.Lock()
+        self._process = subprocess.Popen(
+            ["git", "-C", str(repo), "cat-file", "--batch-check=%(objectname) %(objecttype)"],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+            encoding="utf-8",
+            errors="replace",
+        )
+        self._content_process: Optional[subprocess.Popen[bytes]] = None
+
+    def query_many(self, revisions: Sequence[str]) -> List[Optional[Tuple[str, str]]]:
+        """返回每个修订对应的 (对象 ID, 对象类型)，无法解析时为 None。"""
+        results: List[Optional[Tuple[str, str]]] = []
+        with self._lock:
+            process_stdin = self._process.stdin
+            process_stdout = self._process.stdout
+            assert process_stdin is not None and process_stdout is not None
+
+            for start in range(0, len(revisions), self._CHUNK_SIZE):
+                chunk = revisions[start : start + self._CHUNK_SIZE]
+                started = time.perf_counter()
+                output_bytes = 0
+                for revision in chunk:
+                    if "\n" in revision:
+                        raise ValueError(f"invalid revision: {revision!r}")
+                    process_stdin.write(revision + "\n")
+                process_stdin.flush()
+
+                for _ in chunk:
+                    line = process_stdout.readline()
+                    if not line:
+                        raise RuntimeError(f"git cat-file exited unexpectedly in {self.repo}")
+                    output_bytes += len(line)
+                    value, _, kind = line.rstrip("\n").rpartition(" ")
+                    results.append(None if kind in {"missing", "ambiguous"} else (value, kind))
+
+                if PROFILER.enabled:
+                    PROFILER.record(
+                        "git", "cat-file --batch-check", started, time.perf_counter() - started, output_bytes
+                    )
+
+        return results
+
+    def read_blobs(self, revisions: Sequence[str]) -> List[Optional[bytes]]:
+        """返回每个修订对应 blob 的内容，无法解析或不是 blob 时为 None。"""
+        results: List[Optional[bytes]] = []
+        with self._lock:
+            if self._content_process is None:
+                self._content_process = subprocess.Popen(
+                    ["git", "-C", str(self.repo), "cat-file", "--batch"],
+                    stdin=subprocess.PIPE,
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.DEVNULL,
+                )
+            process_stdin = self._content_process.stdin
+            process_stdout = self._content_process.stdout
+            assert process_stdin is not None and process_stdout is not None
+
+            # 对象内容可能很大，逐个请求、读完再发下一个，避免双方管道同时写满
+            for revision in revisions:
+                if "\n" in revision:
+                    raise ValueError(f"invalid revision: {revision!r}")
+                started = time.perf_counter()
+                process_stdin.write(revision.encode("utf-8") + b"\n")
+                process_stdin.flush()
+
+                header = process_stdout.readline()
+                if not header:
+                    raise RuntimeError(f"git cat-file exited unexpectedly in {self.repo}")
+                fields = header.split()
+                if len(fields) != 3:
+                    # "<修订> missing" / "<修订> ambiguous"
+                    results.append(None)
+                    continue
+                size = int(fields[2])
+                content = process_stdout.read(size)
+                process_stdout.read(1)
+                results.append(content if fields[1] == b"blob" else None)
 
-    remote_name, branch_name = suffix.split("/", 1)
-    if branch_name == "HEAD":
-        return None
+                if PROFILER.enabled:
+                    PROFILER.record(
+                        "git", "cat-file --batch", started, time.perf_counter() - started, len(header) + size
+                    )
 
-    return remote_name, branch_name
+        return results
 
+    def resolve_commits(self, revisions: Sequence[str]) -> List[Optional[str]]:
+        answers = self.query_many([f"{revision}^{{commit}}" for revision in revisions])
+        return [answer[0] if answer is not None else None for answer in answers]
 
-def collect_branches(repo: Path) -> List[str]:
-    local_result = run_git(repo, "for-each-ref", "--format=%(refname:short)", "refs/heads")
-    local_branches = sorted(
-        {line.strip() for line in local_result.stdout.splitlines() if line.strip() and line.strip() != "HEAD"}
-    )
-    local_branch_set: Set[str] = set(local_branches)
+    def resolve_commit(self, revision: str) -> Optional[str]:
+        return self.resolve_commits([revision])[0]
 
-    remote_result = run_git(repo, "for-each-ref", "--format=%(refname)", "refs/remotes")
-    remote_branches: List[str] = []
-    for raw_ref in remote_result.stdout.splitlines():
-        refname = raw_ref.strip()
-        if not refname:
-            continue
+    def close(self) -> None:
+        with self._lock:
+            content_process, self._content_process = self._content_process, None
+            for process in (self._process, content_process):
+                if process is None:
+                    continue
+                if process.stdin is not None:
+                    process.stdin.close()
+                process.wait()
+                if process.stdout is not None:
+                    process.stdout.close()
 
-        parsed = split_remote_branch(refname)
-        if not parsed:
-            continue
 
-        remote_name, branch_name = parsed
-        if branch_name.startswith("archive"):
-            continue
+_git_batches: Dict[Path, GitBatch] = {}
+_git_batches_lock = threading.Lock()
 
-        short_name = f"{remote_name}/{branch_name}"
-        if branch_name not in local_branch_set:
-            remote_branches.append(short_name)
 
-    return sorted(set(local_branches + remote_branches))
+def git_batch(repo: Path) -> GitBatch:
+    with _git_batches_lock:
+        batch = _git_batches.get(repo)
+        if batch is None:
+            batch = GitBatch(repo)
+            _git_batches[repo] = batch
+        return batch
 
 
-def branch_exists(repo: Path, branch: str) -> bool:
+def close_git_batches() -> None:
+    with _git_batches_lock:
+        batches = list(_git_batches.values())
+        _git_batches.clear()
+    for batch in batches:
+        batch.close()
+
+
+def resolve_commit(repo: Path, revision: str) -> str:
+    commit = git_batch(repo).resolve_commit(revision)
+    if commit is None:
+        raise RuntimeError(f"unable to resolve commit: {revision}")
+    return commit
+
+
+@functools.cache
+def git_version() -> Tuple[int, ...]:
+    output = subprocess.run(["git", "version"], capture_output=True, text=True, check=True).stdout
+    # 形如 "git version 2.43.0" 或 "git version 2.39.5.windows.1"
+    numbers: List[int] = []
+    for part in output.strip().removeprefix("git version ").split("."):
+        if not part.isdigit():
+            break
+        numbers.append(int(part))
+    return tuple(numbers)
+
+
+def validate_repo(repo: Path) -> Path:
+    run_git(repo, "rev-parse", "--git-dir")
+    return repo
+
+
+def split_remote_branch(refname: str) -> Optional[Tuple[str, str]]:
+    prefix = "refs/remotes/"
+    if not refname.startswith(prefix):
+        return None
+
+    suffix = refname[len(prefix) :]
+    if "/" not in suffix:
+        return None
+
+    remote_name, branch_name = suffix.split("/", 1)
+    if branch_name == "HEAD":
+        return None
+
+    return remote_name, branch_name
+
+
+@profiled("phase")
+def collect_branches(repo: Path, min_committer_date: Optional[float] = None) -> Dict[str, str]:
+    """一次 `for-each-ref` 同时取得候选分支名、提交与提交时间，返回按名称排序的 {分支: 提交}。
+
+    指定 `min_committer_date` 时，最新提交早于该时间的分支在这一步就被丢弃，不会进入后续的合并测试。
+    """
     result = run_git(
         repo,
-        "rev-parse",
-        "--verify",
-        "--quiet",
-        f"{branch}^{{commit}}",
-        check=False,
-        allowed_returncodes=(0, 1),
+        "for-each-ref",
+        "--format=%(refname)%00%(refname:short)%00%(objectname)%00%(objecttype)"
+        "%00%(committerdate:unix)%00%(*committerdate:unix)",
+        "refs/heads",
+        "refs/remotes",
     )
-    return result.returncode == 0
+
+    local_tips: Dict[str, str] = {}
+    remote_tips: Dict[str, str] = {}
+    remote_branch_names: Dict[str, str] = {}
+    non_commit_branches: List[str] = []
+    committer_dates: Dict[str, int] = {}
+    for line in result.stdout.splitlines():
+        fields = line.split("\0")
+        if len(fields) != 6:
+            continue
+
+        refname, short_name, object_name, object_type, committer_date, peeled_committer_date = fields
+        if refname.startswith("refs/heads/"):
+            if not short_name or short_name == "HEAD":
+                continue
+            local_tips[short_name] = object_name
+        else:
+            parsed = split_remote_branch(refname)
+            if not parsed:
+                continue
+
+            remote_name, branch_name = parsed
+            if branch_name.startswith("archive"):
+                continue
+
+            short_name = f"{remote_name}/{branch_name}"
+            remote_tips[short_name] = object_name
+            remote_branch_names[short_name] = branch_name
+
+        if object_type != "commit":
+            non_commit_branches.append(short_name)
+        # 附注标签没有提交时间，取其指向的提交的时间；两者都没有时视为时间未知，不参与过滤
+        date_text = committer_date or peeled_committer_date
+        if date_text.isdigit():
+            committer_dates[short_name] = int(date_text)
+
+    tips = dict(local_tips)
+    for short_name, tip in remote_tips.items():
+        if remote_branch_names[short_name] not in local_tips:
+            tips[short_name] = tip
+
+    if min_committer_date is not None:
+        for branch in [branch for branch, date in committer_dates.items() if date < min_committer_date]:
+            tips.pop(branch, None)
+
+    # 分支极少指向非提交对象（例如附注标签），这类分支需要额外剥离到提交
+    peel_targets = [branch for branch in non_commit_branches if branch in tips]
+    for branch, commit in zip(peel_targets, git_batch(repo).resolve_commits(peel_targets)):
+        if commit is None:
+            del tips[branch]
+        else:
+            tips[branch] = commit
+
+    return {branch: tips[branch] for branch in sorted(tips)}
+
+
+def branch_exists(repo: Path, branch: str) -> bool:
+    return git_batch(repo).resolve_commit(branch) is not None
 
 
 def detect_main_branch(repo: Path, requested: Optional[str]) -> str:
@@ -639,27 +2171,100 @@ def detect_main_branch(repo: Path, requested: Optional[str]) -> str:
     raise ValueError("unable to auto-detect main branch, please specify --main")
 
 
+def detect_main_branches(repo: Path, requested: Sequence[str]) -> List[str]:
+    if not requested:
+        return [detect_main_branch(repo, None)]
+    return [detect_main_branch(repo, main_branch) for main_branch in requested]
+
+
+class BranchMatcher:
+    """把全部 `--branch` 模式编译为一个匹配器，每个分支只需一次集合查找加一次正则匹配。
+
+    不含通配符的模式按名称直接查找；其余模式经 `fnmatch.translate` 合并为一个带命名分组的正则。
+    与 `fnmatch.fnmatch` 一样先做 `os.path.normcase`，在 Windows 上保持大小写不敏感。
+    """
+
+    def __init__(self, patterns: Sequence[str]) -> None:
+        self.patterns = list(patterns)
+        self._literals: Dict[str, int] = {}
+        wildcard_groups: List[str] = []
+        for index, pattern in enumerate(self.patterns):
+            normalized = os.path.normcase(pattern)
+            if any(char in normalized for char in "*?["):
+                wildcard_groups.append(f"(?P<p{index}>{fnmatch.translate(normalized)})")
+            else:
+                self._literals.setdefault(normalized, index)
+        self._regex = re.compile("|".join(wildcard_groups)) if wildcard_groups else None
+
+    def match(self, branch: str) -> Optional[int]:
+        """返回匹配到的第一个模式的序号，不匹配时为 None。"""
+        normalized = os.path.normcase(branch)
+        index = self._literals.get(normalized)
+        if index is not None:
+            return index
+        if self._regex is None:
+            return None
+        match = self._regex.match(normalized)
+        if match is None or match.lastgroup is None:
+            return None
+        return int(match.lastgroup[1:])
+
+    def unmatched_patterns(self, first_matches: Mapping[str, int]) -> List[str]:
+        """返回没有匹配任何分支的模式；`first_matches` 为选中分支到其命中的第一个模式序号的映射。
+
+        匹配时一个分支只记到它命中的第一个模式上，所有模式都被某个分支首先命中时这里不做任何额外匹配。
+        剩下的模式可能只是被更靠前的模式遮蔽：只对首个命中模式更靠前的分支逐个尝试，命中一次即停止，
+        因此额外开销只与遮蔽情况有关，通常远小于 模式数 × 选中分支数。
+        """
+        matched_indexes = set(first_matches.values())
+        missing: List[str] = []
+        for index, pattern in enumerate(self.patterns):
+            if index in matched_indexes:
+                continue
+            regex = re.compile(fnmatch.translate(os.path.normcase(pattern)))
+            shadowed = any(
+                first_index < index and regex.match(os.path.normcase(branch))
+                for branch, first_index in first_matches.items()
+            )
+            if not shadowed:
+                missing.append(pattern)
+        return missing
+
+
 def select_branches(
     all_branches: Sequence[str],
     patterns: Sequence[str],
-    main_branch: str,
+    main_branches: Sequence[str],
 ) -> List[str]:
     if patterns:
-        selected: Set[str] = set()
-        missing: List[str] = []
-        for pattern in patterns:
-            matches = [branch for branch in all_branches if fnmatch.fnmatch(branch, pattern)]
-            if not matches:
-                missing.append(pattern)
-                continue
-            selected.update(matches)
+        matcher = BranchMatcher(patterns)
+        first_matches: Dict[str, int] = {}
+        for branch in all_branches:
+            index = matcher.match(branch)
+            if index is not None:
+                first_matches[branch] = index
+        missing = matcher.unmatched_patterns(first_matches)
         if missing:
             raise ValueError(f"no branches matched pattern(s): {', '.join(missing)}")
-        branches = sorted(selected)
+        branches = sorted(first_matches)
     else:
         branches = list(all_branches)
 
-    return [branch for branch in branches if branch != main_branch]
+    # 同时分析的各个主分支彼此都不作为候选分支
+    return [branch for branch in branches if branch not in main_branches]
+
+
+def resolve_targets(args: Args, repo: Path) -> Tuple[List[BranchInfo], List[BranchInfo]]:
+    """一次收集引用，同时解析全部主分支与候选分支，返回 (主分支, 候选分支)。"""
+    main_branches = detect_main_branches(repo, args.main_branches)
+    branch_tips = collect_branches(repo, args.min_committer_date)
+    branches = select_branches(list(branch_tips), args.branch_patterns, main_branches)
+    if len(branches) < 2:
+        raise RuntimeError("过滤后至少需要 2 个候选分支")
+
+    # 主分支不受 --since 过滤，不在收集结果中时单独解析
+    targets = BranchInfo.resolve_many(repo, main_branches, known_tips=branch_tips)
+    return targets, BranchInfo.resolve_many(repo, branches, known_tips=branch_tips)
 
 
 def is_ancestor(repo: Path, ancestor: str, descendant: str) -> bool:
@@ -675,22 +2280,301 @@ def is_ancestor(repo: Path, ancestor: str, descendant: str) -> bool:
     return result.returncode == 0
 
 
+class AncestryIndex:
+    """主分支与候选分支提交之间的祖先关系表，构建一次后在内存中回答 "已包含" 判断。
+
+    提交图不可变，因此关系表可以持久化，只要本次涉及的提交都已在表中就直接复用。
+    """
+
+    def __init__(self, repo: Path, ancestors: Mapping[str, Set[str]]) -> None:
+        self._repo = repo
+        self._ancestors: Dict[str, Set[str]] = dict(ancestors)
+
+    @property
+    def commits(self) -> Set[str]:
+        return set(self._ancestors)
+
+    def covers(self, commits: Sequence[str]) -> bool:
+        return all(commit in self._ancestors for commit in commits)
+
+    @profiled("ancestry")
+    def is_ancestor(self, ancestor: str, descendant: str) -> bool:
+        if ancestor == descendant:
+            return True
+
+        known_ancestors = self._ancestors.get(descendant)
+        if known_ancestors is None or ancestor not in self._ancestors:
+            return is_ancestor(self._repo, ancestor, descendant)
+        return ancestor in known_ancestors
+
+    @classmethod
+    def build(cls, repo: Path, commits: Sequence[str]) -> Self:
+        return cls(repo, cls._compute_ancestors(repo, sorted(set(commits))))
+
+    @classmethod
+    def _compute_ancestors(cls, repo: Path, commits: Sequence[str]) -> Dict[str, Set[str]]:
+        if len(commits) <= 1:
+            return {commit: set() for commit in commits}
+
+        # 所有提交共同祖先之下的历史与判断无关，只遍历共同祖先之上的部分提交图
+        bases_result = run_git(
+            repo,
+            "merge-base",
+            "--all",
+            "--octopus",
+            *commits,
+            check=False,
+            allowed_returncodes=(0, 1),
+        )
+        bases = [line.strip() for line in bases_result.stdout.splitlines() if line.strip()]
+        rev_list_args = ["rev-list", "--parents", "--topo-order", *commits]
+        if bases:
+            rev_list_args += ["--not", *bases]
+        graph_lines = run_git(repo, *rev_list_args).stdout.splitlines()
+
+        bit_of = {commit: 1 << index for index, commit in enumerate(commits)}
+        reach: Dict[str, int] = {}
+        # --topo-order 保证子提交先于父提交输出，倒序遍历即可先算父提交
+        for line in reversed(graph_lines):
+            commit, *parents = line.split()
+            mask = bit_of.get(commit, 0)
+            for parent in parents:
+                mask |= reach.get(parent, 0)
+            reach[commit] = mask
+
+        # 不在子图中的提交是全部提交的共同祖先，它们彼此之间的关系递归求解
+        common = [commit for commit in commits if commit not in reach]
+        ancestors = cls._compute_ancestors(repo, common)
+        for commit in commits:
+            if commit not in reach:
+                continue
+            mask = reach[commit]
+            ancestors[commit] = {
+                other for other in commits if other != commit and other in reach and mask & bit_of[other]
+            } | set(common)
+        return ancestors
+
+    @classmethod
+    @profiled("phase")
+    def load_or_build(cls, repo: Path, commits: Sequence[str], path: Optional[Path]) -> Self:
+        if path is not None and path.exists():
+            try:
+                payload = ANCESTRY_INDEX_PAYLOAD_ADAPTER.validate_json(path.read_bytes())
+            except (OSError, ValidationError):
+                payload = None
+
+            if payload is not None:
+                index = cls(
+                    repo,
+                    {commit: set(payload["ancestors"].get(commit, [])) for commit in payload["commits"]},
+                )
+                if index.covers(commits):
+                    return index
+
+        index = cls.build(repo, commits)
+        if path is not None:
+            index.save(path)
+        return index
+
+    def save(self, path: Path) -> None:
+        payload: AncestryIndexPayload = {
+            "commits": sorted(self._ancestors),
+            "ancestors": {commit: sorted(values) for commit, values in sorted(self._ancestors.items()) if values},
+        }
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = path.with_suffix(path.suffix + ".tmp")
+        temp_path.write_bytes(ANCESTRY_INDEX_PAYLOAD_ADAPTER.dump_json(payload) + b"\n")
+        temp_path.replace(path)
+
+
+def parent_dirs(path: str) -> Iterator[str]:
+    parts = path.split("/")
+    for index in range(1, len(parts)):
+        yield "/".join(parts[:index])
+
+
+@dataclass(frozen=True)
+class BranchChanges:
+    """分支相对于它与主分支合并基点的改动路径。"""
+
+    paths: FrozenSet[str]
+    dirs: FrozenSet[str]
+    added_dirs: FrozenSet[str]
+    deleted_dirs: FrozenSet[str]
+
+    @classmethod
+    def from_name_status(cls, output: str) -> Self:
+        fields = output.split("\0")
+        paths: Set[str] = set()
+        added_dirs: Set[str] = set()
+        deleted_dirs: Set[str] = set()
+        for status, path in zip(fields[0::2], fields[1::2]):
+            if not path:
+                continue
+            paths.add(path)
+            if status.startswith("A"):
+                added_dirs.update(parent_dirs(path))
+            elif status.startswith("D"):
+                deleted_dirs.update(parent_dirs(path))
+
+        return cls(
+            paths=frozenset(paths),
+            dirs=frozenset(directory for path in paths for directory in parent_dirs(path)),
+            added_dirs=frozenset(added_dirs),
+            deleted_dirs=frozenset(deleted_dirs),
+        )
+
+    def is_disjoint(self, other: "BranchChanges") -> bool:
+        # 除了同名路径，还要排除文件/目录冲突，以及一侧删空目录（可能触发目录重命名检测）而另一侧在其中新增文件
+        return (
+            self.paths.isdisjoint(other.paths)
+            and self.paths.isdisjoint(other.dirs)
+            and other.paths.isdisjoint(self.dirs)
+            and self.deleted_dirs.isdisjoint(other.added_dirs)
+            and other.deleted_dirs.isdisjoint(self.added_dirs)
+        )
+
+
+class ChangedPathIndex:
+    """按需计算并缓存各分支的改动路径，用于跳过改动互不相交的分支对。"""
+
+    def __init__(self, source_repo: Path, main_commit: str) -> None:
+        self._source_repo = source_repo
+        self._main_commit = main_commit
+        self._changes: Dict[str, Optional[BranchChanges]] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def main_commit(self) -> str:
+        return self._main_commit
+
+    @profiled("phase")
+    def _compute(self, tip: str) -> Optional[BranchChanges]:
+        bases_result = run_git(
+            self._source_repo,
+            "merge-base",
+            "--all",
+            self._main_commit,
+            tip,
+            check=False,
+            allowed_returncodes=(0, 1),
+        )
+        bases = bases_result.stdout.split()
+        # 多个合并基点时三方合并的基准不唯一，不参与预筛
+        if len(bases) != 1:
+            return None
+
+        diff_result = run_git(self._source_repo, "diff", "--name-status", "--no-renames", "-z", bases[0], tip)
+        return BranchChanges.from_name_status(diff_result.stdout)
+
+    @profiled("phase")
+    def get(self, tip: str) -> Optional[BranchChanges]:
+        with self._lock:
+            if tip in self._changes:
+                return self._changes[tip]
+
+        changes = self._compute(tip)
+        with self._lock:
+            self._changes[tip] = changes
+        return changes
+
+    def decides_clean(self, prepared_a: PreparedMerge, prepared_b: PreparedMerge, tip_a: str, tip_b: str) -> bool:
+        if prepared_a.status is not PreparedMergeStatus.CLEAN or prepared_b.status is not PreparedMergeStatus.CLEAN:
+            return False
+
+        changes_a = self.get(tip_a)
+        changes_b = self.get(tip_b)
+        if changes_a is None or changes_b is None:
+            return False
+        return changes_a.is_disjoint(changes_b)
+
+
+def try_lock_file(path: Path) -> Optional[BinaryIO]:
+    """以非阻塞方式独占锁定文件，进程退出时锁自动释放；已被其它进程锁定时返回 None。"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    handle = path.open("a+b")
+    try:
+        if os.name == "nt":
+            import msvcrt
+
+            msvcrt.locking(handle.fileno(), msvcrt.LK_NBLCK, 1)
+        else:
+            import fcntl
+
+            fcntl.flock(handle.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        handle.close()
+        return None
+    return handle
+
+
+def find_ram_backed_dir() -> Optional[Path]:
+    """返回一个可写的内存文件系统目录（/dev/shm 或 XDG_RUNTIME_DIR），找不到时返回 None。"""
+    try:
+        mounts = Path("/proc/mounts").read_text(encoding="utf-8").splitlines()
+    except OSError:
+        return None
+
+    tmpfs_mounts = {fields[1] for line in mounts if len(fields := line.split()) >= 3 and fields[2] == "tmpfs"}
+    candidates = [Path("/dev/shm")]
+    if os.environ.get("XDG_RUNTIME_DIR"):
+        candidates.append(Path(os.environ["XDG_RUNTIME_DIR"]))
+    for candidate in candidates:
+        if candidate.as_posix() in tmpfs_mounts and os.access(candidate, os.W_OK):
+            return candidate
+    return None
+
+
 class MergeLab:
-    def __init__(self, source_git_dir: Path, temp_root: Path) -> None:
-        temp_root.mkdir(parents=True, exist_ok=True)
-        self._root = temp_root / f"git-mainline-conflicts-{uuid.uuid4().hex[:12]}"
-        self._root.mkdir(parents=True, exist_ok=False)
-        self.path = self._root
-        run_git(self.path, "init", "--quiet")
-        alternates = self.path / ".git" / "objects" / "info" / "alternates"
-        alternates.parent.mkdir(parents=True, exist_ok=True)
-        alternates.write_bytes(((source_git_dir / "objects").as_posix() + "\n").encode("utf-8"))
-        run_git(self.path, "config", "user.name", "Codex Temp Merge")
-        run_git(self.path, "config", "user.email", "codex-temp-merge@example.invalid")
+    """一个执行合并测试的位置：checkout 引擎使用实验对象库的独立工作树，merge-tree 引擎直接使用对象库本身。
+
+    持久工作树在关闭时保留在磁盘上供下次运行复用，只释放占用它的文件锁。
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        engine: MergeEngine = MergeEngine.CHECKOUT,
+        worktree: bool = True,
+        persistent: bool = False,
+        lock: Optional[BinaryIO] = None,
+    ) -> None:
+        self.path = path
+        self.engine = engine.resolve()
+        # 由实验位置池统一设置，切换策略不需要重建实验位置
+        self.strategy = MergeStrategy()
+        self._worktree = worktree
+        self._persistent = persistent
+        self._lock = lock
 
     def close(self) -> None:
-        shutil.rmtree(self._root, ignore_errors=True)
+        if self._worktree and not self._persistent:
+            shutil.rmtree(self.path, ignore_errors=True)
+        if self._lock is not None:
+            self._lock.close()
+            self._lock = None
+
+    @profiled("lab")
+    def set_sparse_directories(self, directories: Sequence[str]) -> None:
+        """把工作树限制为给定目录（cone 模式，根目录下的文件始终保留），之后的切换与合并只改写这些目录。"""
+        run_git(
+            self.path,
+            "merge",
+            "--abort",
+            check=False,
+            allowed_returncodes=(0, 1, 128),
+        )
+        run_git(
+            self.path,
+            "sparse-checkout",
+            "set",
+            "--cone",
+            "--sparse-index",
+            "--stdin",
+            input="".join(f"{directory}\n" for directory in sorted(directories)),
+        )
 
+    @profiled("lab")
     def reset_to(self, commit: str) -> None:
         run_git(
             self.path,
@@ -703,24 +2587,55 @@ class MergeLab:
         run_git(self.path, "reset", "--hard", commit)
         run_git(self.path, "clean", "-fd")
 
+    @profiled("lab")
     def head_commit(self) -> str:
         return run_git(self.path, "rev-parse", "HEAD").stdout.strip()
 
+    @profiled("lab")
     def list_conflict_files(self) -> Tuple[str, ...]:
         result = run_git(self.path, "diff", "--name-only", "--diff-filter=U")
         files = sorted({line.strip() for line in result.stdout.splitlines() if line.strip()})
         return tuple(files)
 
+    @profiled("lab")
+    def read_conflict_details(
+        self, conflict_files: Sequence[str], tree: Optional[str] = None
+    ) -> Tuple[ConflictDetail, ...]:
+        """统计各冲突文件中的冲突块与冲突行数；不带 tree 时读取工作区，否则经 `GitBatch` 读取 merge-tree 写出的树。"""
+        if tree is not None:
+            blobs = git_batch(self.path).read_blobs([f"{tree}:{path}" for path in conflict_files])
+            return tuple(
+                (
+                    ConflictDetail.from_text(path, blob.decode("utf-8", errors="replace"))
+                    if blob is not None
+                    else ConflictDetail.unknown(path)
+                )
+                for path, blob in zip(conflict_files, blobs)
+            )
+
+        details: List[ConflictDetail] = []
+        for path in conflict_files:
+            try:
+                text = (self.path / path).read_text(encoding="utf-8", errors="replace")
+            except OSError:
+                details.append(ConflictDetail.unknown(path))
+                continue
+            details.append(ConflictDetail.from_text(path, text))
+        return tuple(details)
+
+    @profiled("lab")
     def commit_merge(self, message: str) -> str:
         run_git(self.path, "commit", "--quiet", "-m", message)
         return self.head_commit()
 
+    @profiled("lab")
     def merge_without_commit(self, commit: str) -> Tuple[bool, Tuple[str, ...]]:
         result = run_git(
             self.path,
             "merge",
             "--no-commit",
             "--no-ff",
+            *self.strategy.git_args,
             commit,
             check=False,
             allowed_returncodes=(0, 1),
@@ -729,85 +2644,1243 @@ class MergeLab:
             return True, ()
         return False, self.list_conflict_files()
 
+    @profiled("lab")
+    def merge_tree(self, base_commit: str, commit: str) -> MergeAttempt:
+        result = run_git(
+            self.path,
+            "merge-tree",
+            "--write-tree",
+            "--name-only",
+            "--no-messages",
+            *self.strategy.git_args,
+            "-z",
+            base_commit,
+            commit,
+            allowed_returncodes=(0, 1),
+        )
+        # 输出格式：<tree>\0 后接每个冲突文件名\0，冲突文件段以空字段结束
+        fields = result.stdout.split("\0")
+        conflict_files: Set[str] = set()
+        for field in fields[1:]:
+            if not field:
+                break
+            conflict_files.add(field)
+
+        tree = fields[0].strip()
+        ordered_conflict_files = tuple(sorted(conflict_files))
+        return MergeAttempt(
+            parents=(base_commit, commit),
+            clean=result.returncode == 0,
+            conflict_files=ordered_conflict_files,
+            tree=tree,
+            conflict_details=self.read_conflict_details(ordered_conflict_files, tree),
+        )
 
-def analyse_repo(
-    source_repo: Path,
-    main_branch: str,
-    branches: Sequence[BranchInfo],
-    temp_root: Path,
-    cache: AnalysisCache,
-) -> AnalysisReport:
-    main_commit = run_git(source_repo, "rev-parse", f"{main_branch}^{{commit}}").stdout.strip()
-    source_git_dir = Path(run_git(source_repo, "rev-parse", "--absolute-git-dir").stdout.strip())
-    prepared_merges: Dict[str, PreparedMerge] = {}
-    pair_results: List[PairResult] = []
-    total_steps = 2 * comb(len(branches), 2)
-
-    lab = MergeLab(source_git_dir=source_git_dir, temp_root=temp_root)
-    try:
+    def merge(self, base_commit: str, commit: str) -> MergeAttempt:
+        if self.engine is MergeEngine.MERGE_TREE:
+            return self.merge_tree(base_commit, commit)
+
+        self.reset_to(base_commit)
+        clean, conflict_files = self.merge_without_commit(commit)
+        return MergeAttempt(
+            parents=(base_commit, commit),
+            clean=clean,
+            conflict_files=conflict_files,
+            conflict_details=self.read_conflict_details(conflict_files),
+        )
 
-        def get_prepared_merge(branch: BranchInfo) -> PreparedMerge:
-            cached = prepared_merges.get(branch.tip)
+    @profiled("lab")
+    def commit_attempt(self, attempt: MergeAttempt, message: str) -> str:
+        if attempt.tree is None:
+            return self.commit_merge(message)
+
+        base_commit, commit = attempt.parents
+        result = run_git(self.path, "commit-tree", attempt.tree, "-p", base_commit, "-p", commit, "-m", message)
+        return result.stdout.strip()
+
+
+class LabStore:
+    """实验用的裸仓库，通过 alternates 借用源仓库的对象库；所有实验工作树都挂在它下面。
+
+    持久化时集成提交会以 `refs/prepared/<main>/<tip>` 固定在这里，后续运行可以直接复用。
+    """
+
+    PREPARED_REF_PREFIX = "refs/prepared/"
+
+    def __init__(
+        self,
+        path: Path,
+        source_git_dir: Path,
+        persistent: bool = True,
+        remove_empty_parent: bool = False,
+    ) -> None:
+        self.path = path
+        self.persistent = persistent
+        self.remove_empty_parent = remove_empty_parent
+        if not (path / "HEAD").exists():
+            path.mkdir(parents=True, exist_ok=True)
+            run_git(path, "init", "--bare", "--quiet")
+            run_git(path, "config", "user.name", "Codex Temp Merge")
+            run_git(path, "config", "user.email", "codex-temp-merge@example.invalid")
+            # 多个工作树会并发写入同一个对象库，禁止 git 在 commit 后自动触发 gc
+            run_git(path, "config", "gc.auto", "0")
+            run_git(path, "config", "maintenance.auto", "false")
+
+        alternates = path / "objects" / "info" / "alternates"
+        alternates.parent.mkdir(parents=True, exist_ok=True)
+        alternates.write_bytes(((source_git_dir / "objects").as_posix() + "\n").encode("utf-8"))
+        # 清理以前被中断的运行留下的工作树登记
+        run_git(path, "worktree", "prune")
+
+    @classmethod
+    def temporary(cls, temp_root: Path, source_git_dir: Path, remove_empty_root: bool = False) -> Self:
+        """在 `temp_root` 下创建用完即删的实验对象库；`remove_empty_root` 时关闭后顺带删除变空的 `temp_root`。"""
+        temp_root.mkdir(parents=True, exist_ok=True)
+        path = temp_root / f"git-mainline-conflicts-{uuid.uuid4().hex[:12]}.git"
+        return cls(path, source_git_dir, persistent=False, remove_empty_parent=remove_empty_root)
+
+    def _add_worktree(self, worktree_path: Path, base_commit: str) -> None:
+        run_git(self.path, "worktree", "add", "--quiet", "--detach", "--no-checkout", str(worktree_path), base_commit)
+
+    def _reusable_worktree(self, worktree_path: Path) -> bool:
+        result = run_git(worktree_path, "rev-parse", "--git-common-dir", check=False)
+        if result.returncode != 0:
+            return False
+        common_dir = Path(result.stdout.strip())
+        if not common_dir.is_absolute():
+            common_dir = worktree_path / common_dir
+        return common_dir.resolve() == self.path.resolve()
+
+    def _acquire_persistent_worktree(self, engine: MergeEngine, base_commit: str) -> MergeLab:
+        # 每个槽位一个文件锁，同时运行的多个进程各自占用不同的工作树
+        slot = 0
+        while True:
+            worktree_path = self.path.with_name(f"{self.path.stem}-wt{slot}")
+            lock = try_lock_file(worktree_path.with_name(worktree_path.name + ".lock"))
+            if lock is not None:
+                break
+            slot += 1
+
+        try:
+            if not self._reusable_worktree(worktree_path):
+                shutil.rmtree(worktree_path, ignore_errors=True)
+                run_git(self.path, "worktree", "prune")
+                self._add_worktree(worktree_path, base_commit)
+        except Exception:
+            lock.close()
+            raise
+        return MergeLab(worktree_path, engine, worktree=True, persistent=True, lock=lock)
+
+    def create_lab(self, engine: MergeEngine, base_commit: str) -> MergeLab:
+        engine = engine.resolve()
+        if not engine.needs_worktree:
+            return MergeLab(self.path, engine, worktree=False)
+        if self.persistent:
+            return self._acquire_persistent_worktree(engine, base_commit)
+
+        worktree_path = self.path.parent / f"git-mainline-conflicts-{uuid.uuid4().hex[:12]}"
+        self._add_worktree(worktree_path, base_commit)
+        return MergeLab(worktree_path, engine, worktree=True)
+
+    def _prepared_ref(self, main_commit: str, tip: str) -> str:
+        return f"{self.PREPARED_REF_PREFIX}{main_commit}/{tip}"
+
+    def prepared_refs(self, main_commit: str) -> Dict[str, str]:
+        prefix = f"{self.PREPARED_REF_PREFIX}{main_commit}/"
+        result = run_git(self.path, "for-each-ref", "--format=%(refname)%00%(objectname)", prefix)
+        refs: Dict[str, str] = {}
+        for line in result.stdout.splitlines():
+            refname, _, object_name = line.partition("\0")
+            refs[refname.removeprefix(prefix)] = object_name
+        return refs
+
+    def pin_prepared(self, main_commit: str, tip: str, integration_commit: str) -> None:
+        if self.persistent:
+            run_git(self.path, "update-ref", self._prepared_ref(main_commit, tip), integration_commit)
+
+    def prune_prepared(self, keep_main_commits: Set[str]) -> None:
+        """删除不再有缓存分片的主分支提交对应的引用，并让 git 按需回收对象。"""
+        if not self.persistent:
+            return
+
+        result = run_git(self.path, "for-each-ref", "--format=%(refname)", self.PREPARED_REF_PREFIX)
+        stale_refs = [
+            refname
+            for refname in result.stdout.splitlines()
+            if refname.removeprefix(self.PREPARED_REF_PREFIX).split("/", 1)[0] not in keep_main_commits
+        ]
+        if stale_refs:
+            run_git(
+                self.path,
+                "update-ref",
+                "--stdin",
+                input="".join(f"delete {refname}\n" for refname in stale_refs),
+            )
+        run_git(self.path, "-c", "gc.auto=6700", "gc", "--auto", "--quiet", check=False)
+
+    def close(self) -> None:
+        if not self.persistent:
+            shutil.rmtree(self.path, ignore_errors=True)
+            if self.remove_empty_parent:
+                # 只有 --ram-lab 在内存文件系统中专门创建的目录才删除，用户的 --temp-root 保持原样
+                try:
+                    self.path.parent.rmdir()
+                except OSError:
+                    pass
+            return
+        run_git(self.path, "worktree", "prune", check=False)
+
+
+class MergeLabPool:
+    """同一个实验对象库上的若干实验位置，任一位置生成的集成提交都能被其它位置直接使用。"""
+
+    @profiled("phase")
+    def __init__(
+        self,
+        store: LabStore,
+        size: int,
+        base_commit: str,
+        engine: MergeEngine = MergeEngine.CHECKOUT,
+    ) -> None:
+        self.engine = engine.resolve()
+        self._labs: List[MergeLab] = []
+        self._slots: List[MergeLab] = []
+        self._idle: "queue.SimpleQueue[MergeLab]" = queue.SimpleQueue()
+        try:
+            if self.engine.needs_worktree:
+                self._labs = [store.create_lab(self.engine, base_commit) for _ in range(size)]
+                self._slots = list(self._labs)
+            else:
+                # merge-tree 引擎不使用工作区，所有并发槽位可以共用实验对象库
+                shared_lab = store.create_lab(self.engine, base_commit)
+                self._labs = [shared_lab]
+                self._slots = [shared_lab] * size
+        except Exception:
+            self.close()
+            raise
+
+        for lab in self._slots:
+            self._idle.put(lab)
+        self._sparse_directories: Optional[FrozenSet[str]] = None
+
+    @property
+    def size(self) -> int:
+        return len(self._slots)
+
+    def set_strategy(self, strategy: MergeStrategy) -> None:
+        for lab in self._labs:
+            lab.strategy = strategy
+
+    def set_sparse_directories(self, directories: Set[str]) -> None:
+        if not self.engine.needs_worktree or self._sparse_directories == directories:
+            return
+        for lab in self._labs:
+            lab.set_sparse_directories(sorted(directories))
+        self._sparse_directories = frozenset(directories)
+
+    @contextmanager
+    def acquire(self) -> Iterator[MergeLab]:
+        lab = self._idle.get()
+        try:
+            yield lab
+        finally:
+            self._idle.put(lab)
+
+    def close(self) -> None:
+        for lab in reversed(self._labs):
+            lab.close()
+
+
+class PreparedMergeRegistry:
+    """按分支提交缓存 `main + 分支` 的预合并结果；同一提交只会被一个线程计算一次。
+
+    新算出的结果会记录下来，由主线程通过 `drain_new` 取走写入持久缓存。
+    """
+
+    def __init__(
+        self,
+        ancestry: AncestryIndex,
+        main_commit: str,
+        store: Optional[LabStore] = None,
+        cached: Optional[Mapping[str, PreparedMerge]] = None,
+        cache_key: Optional[str] = None,
+    ) -> None:
+        self._ancestry = ancestry
+        self._main_commit = main_commit
+        # 固定集成提交的引用按缓存键分组：不同合并策略下同一分支的集成提交可能不同
+        self._cache_key = cache_key or main_commit
+        self._store = store
+        self._prepared: Dict[str, PreparedMerge] = {}
+        self._new: Dict[str, PreparedMerge] = {}
+        self._tip_locks: Dict[str, threading.Lock] = {}
+        self._registry_lock = threading.Lock()
+        if cached:
+            self._preload(cached)
+
+    def _preload(self, cached: Mapping[str, PreparedMerge]) -> None:
+        # 干净的预合并只有在集成提交仍被实验对象库中的引用固定时才能复用
+        pinned = self._store.prepared_refs(self._cache_key) if self._store is not None else {}
+        for tip, prepared in cached.items():
+            if prepared.status is PreparedMergeStatus.CLEAN and pinned.get(tip) != prepared.integration_commit:
+                continue
+            self._prepared[tip] = prepared
+
+    def get(self, lab: MergeLab, branch: BranchInfo) -> PreparedMerge:
+        with self._registry_lock:
+            tip_lock = self._tip_locks.setdefault(branch.tip, threading.Lock())
+
+        with tip_lock:
+            cached = self._prepared.get(branch.tip)
             if cached is not None:
                 return cached
 
             prepared = PreparedMerge.from_main_merge(
-                source_repo=source_repo,
+                ancestry=self._ancestry,
                 lab=lab,
-                main_commit=main_commit,
+                main_commit=self._main_commit,
                 branch=branch,
             )
-            prepared_merges[branch.tip] = prepared
+            if prepared.status is PreparedMergeStatus.CLEAN and self._store is not None:
+                self._store.pin_prepared(self._cache_key, branch.tip, prepared.integration_commit)
+
+            with self._registry_lock:
+                self._prepared[branch.tip] = prepared
+                self._new[branch.tip] = prepared
             return prepared
 
-        with tqdm(
-            total=total_steps,
-            desc="测试合并序列",
-            unit="step",
-            dynamic_ncols=True,
-            leave=True,
-        ) as progress:
-            for branch_a, branch_b in combinations(branches, 2):
-                cached_pair = cache.get_pair_result(
-                    main_commit=main_commit,
-                    branch_a=branch_a,
-                    branch_b=branch_b,
+    def peek(self, tip: str) -> Optional[PreparedMerge]:
+        """不触发计算地查看已有的预合并结果。"""
+        with self._registry_lock:
+            return self._prepared.get(tip)
+
+    def drain_new(self) -> Dict[str, PreparedMerge]:
+        with self._registry_lock:
+            new, self._new = self._new, {}
+        return new
+
+
+def analyse_pair(
+    lab: MergeLab,
+    prepared_merges: PreparedMergeRegistry,
+    ancestry: AncestryIndex,
+    changed_paths: Optional[ChangedPathIndex],
+    branch_a: BranchInfo,
+    branch_b: BranchInfo,
+) -> Tuple[PairResult, bool]:
+    """返回分支对结果，以及该结果是否由改动路径预筛直接判定。"""
+    result_a = prepared_merges.get(lab, branch_a)
+    result_b = prepared_merges.get(lab, branch_b)
+    if changed_paths is not None and changed_paths.decides_clean(result_a, result_b, branch_a.tip, branch_b.tip):
+        sequence_ab = result_a.predict_clean_followup(branch_b, ancestry)
+        sequence_ba = result_b.predict_clean_followup(branch_a, ancestry)
+        return PairResult.from_sequences(branch_a, branch_b, sequence_ab, sequence_ba), True
+
+    sequence_ab = result_a.analyse_followup(lab, branch_b, ancestry)
+    sequence_ba = result_b.analyse_followup(lab, branch_a, ancestry)
+    return PairResult.from_sequences(branch_a, branch_b, sequence_ab, sequence_ba), False
+
+
+def followup_merge_count(
+    prepared_merges: PreparedMergeRegistry,
+    ancestry: AncestryIndex,
+    changed_paths: Optional[ChangedPathIndex],
+    branch_a: BranchInfo,
+    branch_b: BranchInfo,
+) -> int:
+    """预合并完成后，分支对还需执行的后续合并数（0 到 2），判定方式与 `analyse_pair` 一致，用于调度排序。"""
+    result_a = prepared_merges.peek(branch_a.tip)
+    result_b = prepared_merges.peek(branch_b.tip)
+    if result_a is None or result_b is None:
+        return 2
+    if changed_paths is not None and changed_paths.decides_clean(result_a, result_b, branch_a.tip, branch_b.tip):
+        return 0
+    return result_a.needs_followup_merge(branch_b, ancestry) + result_b.needs_followup_merge(branch_a, ancestry)
+
+
+class MainlineAnalyser:
+    """在多次分析之间保持缓存、实验对象库与实验工作树，监视模式下每次只需补算新出现的分支对。"""
+
+    def __init__(
+        self,
+        source_repo: Path,
+        temp_root: Path,
+        cache: AnalysisCache,
+        jobs: int = 1,
+        engine: MergeEngine = MergeEngine.AUTO,
+        ancestry_file: Optional[Path] = None,
+        prefilter: bool = True,
+        lab_store_dir: Optional[Path] = None,
+        coordinator: Optional["WorkCoordinator"] = None,
+        strategy: MergeStrategy = MergeStrategy(),
+        remove_empty_temp_root: bool = False,
+    ) -> None:
+        self.source_repo = source_repo
+        self.temp_root = temp_root
+        self.cache = cache
+        self.jobs = jobs
+        self.requested_engine = engine
+        self.strategy = strategy
+        self.engine = self._engine_for(strategy)
+        self.ancestry_file = ancestry_file
+        self.prefilter = prefilter
+        self.lab_store_dir = lab_store_dir
+        self.remove_empty_temp_root = remove_empty_temp_root
+        # 指定时待测分支对交给远程 worker 执行，本机不做合并
+        self.coordinator = coordinator
+        self._source_git_dir = Path(run_git(source_repo, "rev-parse", "--absolute-git-dir").stdout.strip())
+        self._lab_store: Optional[LabStore] = None
+        self._lab_pool: Optional[MergeLabPool] = None
+        self._changed_files: Dict[Tuple[str, str], FrozenSet[str]] = {}
+        self._ancestry: Optional[AncestryIndex] = None
+        self._merge_bases: Dict[Tuple[str, str], List[str]] = {}
+        self._changed_paths: Optional[ChangedPathIndex] = None
+
+    def _engine_for(self, strategy: MergeStrategy) -> MergeEngine:
+        engine = strategy.compatible_engine(self.requested_engine)
+        if self.requested_engine is MergeEngine.MERGE_TREE and engine is not MergeEngine.MERGE_TREE:
+            raise ValueError("当前 git 版本的 merge-tree 不支持 -X 策略选项，请改用 --engine checkout 或 auto")
+        return engine
+
+    def use_strategy(self, strategy: MergeStrategy) -> None:
+        """切换合并策略；引擎因此改变时丢弃现有实验位置池，下次分析时重建。"""
+        engine = self._engine_for(strategy)
+        if engine is not self.engine and self._lab_pool is not None:
+            self._lab_pool.close()
+            self._lab_pool = None
+        self.strategy = strategy
+        self.engine = engine
+
+    def _cache_key(self, main_commit: str) -> str:
+        return self.strategy.cache_key(main_commit)
+
+    def _diff_files(self, base: str, commit: str) -> FrozenSet[str]:
+        key = (base, commit)
+        files = self._changed_files.get(key)
+        if files is None:
+            result = run_git(self.source_repo, "diff", "--name-only", "--no-renames", "-z", base, commit)
+            files = frozenset(path for path in result.stdout.split("\0") if path)
+            self._changed_files[key] = files
+        return files
+
+    def sparse_directories(self, main_commits: Sequence[str], branches: Sequence[BranchInfo]) -> Set[str]:
+        """候选分支与各主分支自分叉点以来改动过的文件所在目录，合并只会读写这些目录中的文件。"""
+        directories: Set[str] = set()
+        for main_commit in main_commits:
+            for branch in branches:
+                for base in self._merge_bases_of(main_commit, branch.tip):
+                    for path in self._diff_files(base, branch.tip) | self._diff_files(base, main_commit):
+                        directory = posixpath.dirname(path)
+                        if directory:
+                            directories.add(directory)
+        return directories
+
+    def _merge_bases_of(self, main_commit: str, tip: str) -> List[str]:
+        key = (main_commit, tip)
+        bases = self._merge_bases.get(key)
+        if bases is None:
+            result = run_git(self.source_repo, "merge-base", "--all", main_commit, tip, check=False)
+            bases = result.stdout.split()
+            self._merge_bases[key] = bases
+        return bases
+
+    def _changed_path_index(self, main_commit: str) -> ChangedPathIndex:
+        if self._changed_paths is None or self._changed_paths.main_commit != main_commit:
+            self._changed_paths = ChangedPathIndex(self.source_repo, main_commit)
+        return self._changed_paths
+
+    def _ancestry_index(self, commits: Sequence[str]) -> AncestryIndex:
+        # 多个主分支依次分析时，第一次构建的关系表已覆盖全部提交，后续直接复用内存中的表
+        if self._ancestry is None or not self._ancestry.covers(commits):
+            self._ancestry = AncestryIndex.load_or_build(self.source_repo, commits, self.ancestry_file)
+        return self._ancestry
+
+    def _ensure_lab_pool(self, size: int, base_commit: str) -> MergeLabPool:
+        if self._lab_store is None:
+            if self.lab_store_dir is not None:
+                self._lab_store = LabStore(self.lab_store_dir, self._source_git_dir)
+            else:
+                self._lab_store = LabStore.temporary(
+                    self.temp_root, self._source_git_dir, remove_empty_root=self.remove_empty_temp_root
                 )
-                if cached_pair is not None:
-                    pair_results.append(cached_pair)
-                    progress.set_postfix_str(f"cache {branch_a.name} + {branch_b.name}")
-                    progress.update(2)
-                    continue
 
-                result_a = get_prepared_merge(branch_a)
-                result_b = get_prepared_merge(branch_b)
+        if self._lab_pool is not None and self._lab_pool.size < size:
+            self._lab_pool.close()
+            self._lab_pool = None
+        if self._lab_pool is None:
+            self._lab_pool = MergeLabPool(
+                store=self._lab_store,
+                size=size,
+                base_commit=base_commit,
+                engine=self.engine,
+            )
+        return self._lab_pool
 
-                progress.set_postfix_str(f"main + {branch_a.name} + {branch_b.name}")
-                sequence_ab = result_a.analyse_followup(lab, branch_b)
-                progress.update(1)
+    def _prepare_lab_pool(
+        self,
+        size: int,
+        main_commits: Sequence[str],
+        branches: Sequence[BranchInfo],
+    ) -> MergeLabPool:
+        lab_pool = self._ensure_lab_pool(size, main_commits[0])
+        lab_pool.set_strategy(self.strategy)
+        if lab_pool.engine.needs_worktree:
+            lab_pool.set_sparse_directories(self.sparse_directories(main_commits, branches))
+        return lab_pool
+
+    def analyse(
+        self,
+        main_branch: str,
+        branches: Sequence[BranchInfo],
+        main_commit: Optional[str] = None,
+        on_result: Optional[Callable[[PairResult], None]] = None,
+        collect_results: bool = True,
+        sibling_main_commits: Sequence[str] = (),
+    ) -> AnalysisReport:
+        """分析全部分支对。
+
+        `on_result` 会在每个分支对结果从缓存读出或计算完成时立即被调用；
+        `collect_results=False` 时结果不保留在返回的报告中，用于流式输出大批量结果。
+        `sibling_main_commits` 为同一次运行中还要分析的其他主分支提交，稀疏工作树会一并覆盖它们。
+        """
+        cache = self.cache
+        main_commit = main_commit or resolve_commit(self.source_repo, main_branch)
+        cache_key = self._cache_key(main_commit)
+        pair_results: List[PairResult] = []
+        prefiltered_pair_count = 0
+        mergeless_sequence_count = 0
+        total_steps = 2 * comb(len(branches), 2)
+
+        def emit(pair_result: PairResult) -> None:
+            if collect_results:
+                pair_results.append(pair_result)
+            if on_result is not None:
+                on_result(pair_result)
+
+        cached_pair_count = 0
+        pending_pairs: List[Tuple[BranchInfo, BranchInfo]] = []
+        for branch_a, branch_b in combinations(branches, 2):
+            cached_pair = cache.get_pair_result(
+                main_commit=cache_key,
+                branch_a=branch_a,
+                branch_b=branch_b,
+            )
+            if cached_pair is not None:
+                cached_pair_count += 1
+                emit(cached_pair)
+            else:
+                pending_pairs.append((branch_a, branch_b))
 
-                progress.set_postfix_str(f"main + {branch_b.name} + {branch_a.name}")
-                sequence_ba = result_b.analyse_followup(lab, branch_a)
-                progress.update(1)
+        try:
+            with tqdm(
+                total=total_steps,
+                initial=2 * cached_pair_count,
+                desc="测试合并序列",
+                unit="step",
+                dynamic_ncols=True,
+                leave=True,
+            ) as progress:
+                if pending_pairs:
+                    if self.coordinator is not None:
+                        outcomes = self.coordinator.run_job(
+                            main_branch, main_commit, branches, pending_pairs, self.strategy
+                        )
+                    else:
+                        outcomes = self.run_pairs(main_commit, branches, pending_pairs, sibling_main_commits)
+                    # 缓存与进度条只在主线程中更新，工作线程与远程 worker 只负责执行合并
+                    for branch_a, branch_b, pair_result, prefiltered in outcomes:
+                        prefiltered_pair_count += prefiltered
+                        if not prefiltered:
+                            mergeless_sequence_count += pair_result.mergeless_sequence_count
+                        pair_result = cache.store_pair_result(
+                            main_commit=cache_key,
+                            branch_a=branch_a,
+                            branch_b=branch_b,
+                            result=pair_result,
+                        )
+                        emit(pair_result)
+                        progress.set_postfix_str(f"main + {branch_a.name} <-> {branch_b.name}")
+                        progress.update(2)
+        finally:
+            cache.save()
+
+        return AnalysisReport.create(
+            main_branch=main_branch,
+            main_commit=main_commit,
+            tested_branches=[branch.name for branch in branches],
+            pair_results=pair_results,
+            prefiltered_pair_count=prefiltered_pair_count,
+            strategy_options=self.strategy.options,
+            mergeless_sequence_count=mergeless_sequence_count,
+        )
 
-                pair_result = PairResult.from_sequences(branch_a, branch_b, sequence_ab, sequence_ba)
-                cache.store_pair_result(
-                    main_commit=main_commit,
+    def run_pairs(
+        self,
+        main_commit: str,
+        branches: Sequence[BranchInfo],
+        pairs: Sequence[Tuple[BranchInfo, BranchInfo]],
+        sibling_main_commits: Sequence[str] = (),
+    ) -> Iterator[Tuple[BranchInfo, BranchInfo, PairResult, bool]]:
+        """在本机实验工作树中并行分析给定分支对，按完成顺序在调用线程中逐个产出 (A, B, 结果, 是否预筛)。
+
+        先派发各分支与主分支的预合并：每个分支只需一次合并，就能决定它所在全部分支对中
+        "先与主分支冲突" 与 "已包含" 的序列，并为预筛提供依据。分支对在其两个分支的预合并都完成后立即派发，
+        同一批就绪的分支对按还需执行的后续合并数从少到多排序，不必等待全部预合并结束。
+        预合并结果在产出的间隙写入缓存；分支对结果由调用方决定如何保存。
+        """
+        cache = self.cache
+        cache_key = self._cache_key(main_commit)
+        ancestry = self._ancestry_index([main_commit, *(branch.tip for branch in branches)])
+        sparse_main_commits = [main_commit, *(commit for commit in sibling_main_commits if commit != main_commit)]
+        lab_pool = self._prepare_lab_pool(min(self.jobs, len(pairs)), sparse_main_commits, branches)
+        prepared_merges = PreparedMergeRegistry(
+            ancestry=ancestry,
+            main_commit=main_commit,
+            store=self._lab_store,
+            cached=cache.get_prepared_merges(cache_key),
+            cache_key=cache_key,
+        )
+        changed_paths = self._changed_path_index(main_commit) if self.prefilter else None
+
+        def record_prepared_merges() -> None:
+            for tip, prepared in prepared_merges.drain_new().items():
+                cache.store_prepared_merge(cache_key, tip, prepared)
+
+        def prepare_branch(branch: BranchInfo) -> None:
+            with lab_pool.acquire() as lab:
+                prepared = prepared_merges.get(lab, branch)
+            if changed_paths is not None and prepared.status is PreparedMergeStatus.CLEAN:
+                changed_paths.get(branch.tip)
+
+        def run_pair(branch_a: BranchInfo, branch_b: BranchInfo) -> Tuple[PairResult, bool]:
+            with lab_pool.acquire() as lab:
+                return analyse_pair(lab, prepared_merges, ancestry, changed_paths, branch_a, branch_b)
+
+        # 每个分支对还有几个分支的预合并没有完成；降到 0 时即可派发
+        unprepared_counts = [len({branch_a.tip, branch_b.tip}) for branch_a, branch_b in pairs]
+        pair_indexes_by_tip: Dict[str, List[int]] = {}
+        for index, pair in enumerate(pairs):
+            for tip in {branch.tip for branch in pair}:
+                pair_indexes_by_tip.setdefault(tip, []).append(index)
+
+        executor = ThreadPoolExecutor(max_workers=lab_pool.size, thread_name_prefix="merge-lab")
+        try:
+            pair_branches = {branch.tip: branch for pair in pairs for branch in pair}
+            prepare_futures: Dict[Future[None], str] = {
+                executor.submit(prepare_branch, branch): tip for tip, branch in pair_branches.items()
+            }
+            pair_futures: Dict[Future[Tuple[PairResult, bool]], Tuple[BranchInfo, BranchInfo]] = {}
+            running: Set[Future[Any]] = set(prepare_futures)
+            while running:
+                done, running = wait(running, return_when=FIRST_COMPLETED)
+                ready_pairs: List[Tuple[BranchInfo, BranchInfo]] = []
+                for future in done:
+                    tip = prepare_futures.pop(future, None)
+                    if tip is None:
+                        continue
+                    future.result()
+                    for index in pair_indexes_by_tip[tip]:
+                        unprepared_counts[index] -= 1
+                        if unprepared_counts[index] == 0:
+                            ready_pairs.append(pairs[index])
+
+                # 线程池按提交顺序执行，排序后的提交顺序即调度顺序；同一档内保持原顺序，相邻分支对共享分支
+                ready_pairs.sort(
+                    key=lambda pair: followup_merge_count(prepared_merges, ancestry, changed_paths, pair[0], pair[1])
+                )
+                for branch_a, branch_b in ready_pairs:
+                    pair_future = executor.submit(run_pair, branch_a, branch_b)
+                    pair_futures[pair_future] = (branch_a, branch_b)
+                    running.add(pair_future)
+
+                record_prepared_merges()
+                for future in done:
+                    if future not in pair_futures:
+                        continue
+                    branch_a, branch_b = pair_futures.pop(future)
+                    pair_result, prefiltered = future.result()
+                    record_prepared_merges()
+                    yield branch_a, branch_b, pair_result, prefiltered
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+            record_prepared_merges()
+
+    def analyse_leased_pairs(
+        self,
+        main_commit: str,
+        branches: Sequence[BranchInfo],
+        pairs: Sequence[Tuple[BranchInfo, BranchInfo]],
+    ) -> List[Tuple[PairResult, bool]]:
+        """worker 使用：分析 coordinator 派发的一批分支对，先查本机缓存，新结果同样写入本机缓存。"""
+        cache = self.cache
+        cache_key = self._cache_key(main_commit)
+        outcomes: Dict[Tuple[str, str], Tuple[PairResult, bool]] = {}
+        pending_pairs: List[Tuple[BranchInfo, BranchInfo]] = []
+        for branch_a, branch_b in pairs:
+            cached_pair = cache.get_pair_result(main_commit=cache_key, branch_a=branch_a, branch_b=branch_b)
+            if cached_pair is not None:
+                outcomes[(branch_a.name, branch_b.name)] = (cached_pair, False)
+            else:
+                pending_pairs.append((branch_a, branch_b))
+
+        if pending_pairs:
+            for branch_a, branch_b, pair_result, prefiltered in self.run_pairs(main_commit, branches, pending_pairs):
+                pair_result = cache.store_pair_result(
+                    main_commit=cache_key,
                     branch_a=branch_a,
                     branch_b=branch_b,
                     result=pair_result,
                 )
-                pair_results.append(pair_result)
-    finally:
-        lab.close()
-        cache.save()
-
-    return AnalysisReport.create(
-        main_branch=main_branch,
-        main_commit=main_commit,
-        tested_branches=[branch.name for branch in branches],
-        pair_results=pair_results,
-    )
+                outcomes[(branch_a.name, branch_b.name)] = (pair_result, prefiltered)
+        return [outcomes[(branch_a.name, branch_b.name)] for branch_a, branch_b in pairs]
+
+    def analyse_targets(
+        self,
+        targets: Sequence[BranchInfo],
+        branches: Sequence[BranchInfo],
+        plan: bool = False,
+        on_result: Optional[Callable[[str, PairResult], None]] = None,
+        collect_results: bool = True,
+    ) -> List[AnalysisReport]:
+        """依次针对每个主分支分析同一批候选分支，返回与 `targets` 顺序一致的报告。
+
+        祖先关系表按全部主分支一次构建，实验对象库与工作树在各主分支之间复用。
+        `on_result` 额外收到结果所属的主分支名称。
+        """
+        main_commits = [target.tip for target in targets]
+        self._ancestry_index([*main_commits, *(branch.tip for branch in branches)])
+
+        reports: List[AnalysisReport] = []
+        for target in targets:
+
+            def emit(pair_result: PairResult, main_branch: str = target.name) -> None:
+                if on_result is not None:
+                    on_result(main_branch, pair_result)
+
+            report = self.analyse(
+                target.name,
+                branches,
+                main_commit=target.tip,
+                on_result=emit if on_result is not None else None,
+                collect_results=collect_results,
+                sibling_main_commits=main_commits,
+            )
+            if plan:
+                report = self.plan_merge_order(report, branches, sibling_main_commits=main_commits)
+            reports.append(report)
+        return reports
+
+    @profiled("phase")
+    def plan_merge_order(
+        self,
+        report: AnalysisReport,
+        branches: Sequence[BranchInfo],
+        sibling_main_commits: Sequence[str] = (),
+    ) -> AnalysisReport:
+        """规划合并顺序，并在实验仓库中按该顺序真实地依次合并一遍加以验证。
+
+        验证链中发生冲突的分支会被跳过，后续分支继续在此前已干净合入的结果上合并。
+        """
+        planner = MergeOrderPlanner(report)
+        order, predicted_conflict_files = planner.plan()
+        tips = {branch.name: branch.tip for branch in branches}
+        ancestry = self._ancestry_index([report.main_commit, *tips.values()])
+
+        steps: List[MergePlanStep] = []
+        sparse_main_commits = [report.main_commit, *(c for c in sibling_main_commits if c != report.main_commit)]
+        lab_pool = self._prepare_lab_pool(1, sparse_main_commits, branches)
+        with lab_pool.acquire() as lab:
+            current_commit = report.main_commit
+            merged_commits = [report.main_commit]
+            for branch_name, predicted in zip(order, planner.step_costs(order)):
+                tip = tips[branch_name]
+                if any(ancestry.is_ancestor(tip, merged) for merged in merged_commits):
+                    status, conflict_files = SequenceStatus.ALREADY_CONTAINED, ()
+                else:
+                    attempt = lab.merge(current_commit, tip)
+                    if attempt.clean:
+                        current_commit = lab.commit_attempt(attempt, f"temp merge train {branch_name}")
+                        merged_commits.append(tip)
+                        status, conflict_files = SequenceStatus.CLEAN, ()
+                    else:
+                        status, conflict_files = SequenceStatus.CONFLICT, attempt.conflict_files
+                steps.append(
+                    MergePlanStep(
+                        branch=branch_name,
+                        predicted_conflict_files=predicted,
+                        status=status,
+                        conflict_files=list(conflict_files),
+                    )
+                )
+
+        merge_plan = MergePlan(order=order, predicted_conflict_files=predicted_conflict_files, steps=steps)
+        return replace(report, merge_plan=merge_plan)
+
+    def close(self) -> None:
+        if self._lab_pool is not None:
+            self._lab_pool.close()
+            self._lab_pool = None
+        if self._lab_store is not None:
+            # 先落盘缓存再清理引用，保证仍被缓存引用的集成提交不会被回收
+            self.cache.save()
+            self._lab_store.prune_prepared(self.cache.main_commits())
+            self._lab_store.close()
+            self._lab_store = None
+
+
+class WorkBranchPayload(TypedDict):
+    name: str
+    tip: str
+
+
+class WorkJobPayload(TypedDict):
+    job_id: int
+    main_branch: str
+    main_commit: str
+    branches: List[WorkBranchPayload]
+    # worker 必须使用与 coordinator 相同的合并策略，结果才能写入同一份缓存
+    strategy_options: List[str]
+
+
+class WorkLeaseRequestPayload(TypedDict):
+    worker: str
+    # worker 当前掌握的任务，与 coordinator 不一致时租约中会附带完整任务
+    job_id: int
+
+
+class WorkLeasePayload(TypedDict):
+    done: bool
+    retry_after: float
+    job: Optional[WorkJobPayload]
+    job_id: int
+    lease_id: int
+    pairs: List[Tuple[str, str]]
+
+
+class WorkPairOutcomePayload(TypedDict):
+    result: PairResult
+    prefiltered: bool
+
+
+class WorkReleasePayload(TypedDict):
+    worker: str
+    job_id: int
+    lease_id: int
+
+
+class WorkResultPayload(TypedDict):
+    worker: str
+    job_id: int
+    lease_id: int
+    outcomes: List[WorkPairOutcomePayload]
+
+
+WORK_LEASE_REQUEST_ADAPTER = TypeAdapter(WorkLeaseRequestPayload)
+WORK_LEASE_ADAPTER = TypeAdapter(WorkLeasePayload)
+WORK_RESULT_ADAPTER = TypeAdapter(WorkResultPayload)
+WORK_RELEASE_ADAPTER = TypeAdapter(WorkReleasePayload)
+
+
+@dataclass
+class WorkLease:
+    worker: str
+    pairs: List[Tuple[str, str]]
+    deadline: float
+
+
+class WorkCoordinator:
+    """分布式模式的协调端：以 HTTP + JSON 向 worker 分批出租待测分支对，并收回结果。
+
+    协议有三个请求：`POST /lease` 领取一批分支对（任务变化时附带主分支与候选分支），
+    `POST /result` 交回结果，`POST /release` 由无法处理该任务的 worker 立即退回租约。
+    超时未交回的租约会重新派发，重复交回的结果只采用第一份；连续 `idle_timeout` 秒没有任何结果时放弃任务。
+    """
+
+    def __init__(
+        self,
+        address: Tuple[str, int],
+        chunk_size: int = DISTRIBUTED_CHUNK_PAIRS,
+        lease_timeout: float = DISTRIBUTED_LEASE_TIMEOUT_SECONDS,
+        idle_timeout: float = DEFAULT_COORDINATOR_TIMEOUT_SECONDS,
+    ) -> None:
+        self.chunk_size = chunk_size
+        self.lease_timeout = lease_timeout
+        self.idle_timeout = idle_timeout
+        self._lock = threading.Lock()
+        self._job: Optional[WorkJobPayload] = None
+        self._last_job_id = 0
+        self._last_lease_id = 0
+        self._unleased: deque[List[Tuple[str, str]]] = deque()
+        self._leases: Dict[int, WorkLease] = {}
+        self._outcomes: queue.Queue[Tuple[int, WorkPairOutcomePayload]] = queue.Queue()
+        self._closing = False
+        # 领取过租约的 worker 与已收到结束通知的 worker
+        self._workers: Set[str] = set()
+        self._notified_workers: Set[str] = set()
+        self._last_poll = time.monotonic()
+        self._server = ThreadingHTTPServer(address, self._make_handler())
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name="work-coordinator", daemon=True).start()
+
+    @property
+    def server_address(self) -> Tuple[str, int]:
+        host, port = self._server.server_address[:2]
+        return str(host), int(port)
+
+    def _make_handler(self) -> type[BaseHTTPRequestHandler]:
+        coordinator = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self) -> None:
+                body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+                try:
+                    if self.path == "/lease":
+                        request = WORK_LEASE_REQUEST_ADAPTER.validate_json(body)
+                        payload = WORK_LEASE_ADAPTER.dump_json(coordinator.lease(request))
+                    elif self.path == "/result":
+                        coordinator.submit(WORK_RESULT_ADAPTER.validate_json(body))
+                        payload = b"{}"
+                    elif self.path == "/release":
+                        coordinator.release(WORK_RELEASE_ADAPTER.validate_json(body))
+                        payload = b"{}"
+                    else:
+                        self.send_error(404)
+                        return
+                except ValidationError as exc:
+                    self.send_error(400, explain=str(exc))
+                    return
+
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format: str, *args: object) -> None:
+                pass
+
+        return Handler
+
+    def lease(self, request: WorkLeaseRequestPayload) -> WorkLeasePayload:
+        with self._lock:
+            self._last_poll = time.monotonic()
+            self._workers.add(request["worker"])
+            if self._closing:
+                self._notified_workers.add(request["worker"])
+            job = self._job
+            if job is None:
+                return {
+                    "done": self._closing,
+                    "retry_after": 1.0,
+                    "job": None,
+                    "job_id": 0,
+                    "lease_id": 0,
+                    "pairs": [],
+                }
+
+            now = time.monotonic()
+            for lease_id, expired in [(key, lease) for key, lease in self._leases.items() if lease.deadline < now]:
+                del self._leases[lease_id]
+                self._unleased.appendleft(expired.pairs)
+
+            pairs: List[Tuple[str, str]] = []
+            lease_id = 0
+            if self._unleased:
+                pairs = self._unleased.popleft()
+                self._last_lease_id += 1
+                lease_id = self._last_lease_id
+                self._leases[lease_id] = WorkLease(
+                    worker=request["worker"],
+                    pairs=pairs,
+                    deadline=now + self.lease_timeout,
+                )
+            return {
+                "done": False,
+                # 全部分支对都已租出时，空闲 worker 稍后再来，以便接手超时的租约
+                "retry_after": 0.0 if pairs else 1.0,
+                "job": job if request["job_id"] != job["job_id"] else None,
+                "job_id": job["job_id"],
+                "lease_id": lease_id,
+                "pairs": pairs,
+            }
+
+    def submit(self, result: WorkResultPayload) -> None:
+        with self._lock:
+            if self._job is None or result["job_id"] != self._job["job_id"]:
+                return
+            self._leases.pop(result["lease_id"], None)
+        for outcome in result["outcomes"]:
+            self._outcomes.put((result["job_id"], outcome))
+
+    def release(self, request: WorkReleasePayload) -> None:
+        """worker 放弃租约时把其中的分支对放回队首，不必等租约超时。"""
+        with self._lock:
+            if self._job is None or request["job_id"] != self._job["job_id"]:
+                return
+            lease = self._leases.pop(request["lease_id"], None)
+            if lease is not None:
+                self._unleased.appendleft(lease.pairs)
+
+    def run_job(
+        self,
+        main_branch: str,
+        main_commit: str,
+        branches: Sequence[BranchInfo],
+        pairs: Sequence[Tuple[BranchInfo, BranchInfo]],
+        strategy: MergeStrategy = MergeStrategy(),
+    ) -> Iterator[Tuple[BranchInfo, BranchInfo, PairResult, bool]]:
+        """派发一次分析任务，按 worker 交回的顺序在调用线程中逐个产出 (A, B, 结果, 是否预筛)。"""
+        remaining = {(branch_a.name, branch_b.name): (branch_a, branch_b) for branch_a, branch_b in pairs}
+        pair_keys = list(remaining)
+        with self._lock:
+            self._last_job_id += 1
+            job_id = self._last_job_id
+            self._job = {
+                "job_id": job_id,
+                "main_branch": main_branch,
+                "main_commit": main_commit,
+                "branches": [{"name": branch.name, "tip": branch.tip} for branch in branches],
+                "strategy_options": list(strategy.options),
+            }
+            self._leases.clear()
+            self._unleased = deque(
+                pair_keys[start : start + self.chunk_size] for start in range(0, len(pair_keys), self.chunk_size)
+            )
+
+        last_progress = time.monotonic()
+        warned_idle = False
+        try:
+            while remaining:
+                try:
+                    outcome_job_id, outcome = self._outcomes.get(timeout=1.0)
+                except queue.Empty:
+                    now = time.monotonic()
+                    if now - last_progress > self.idle_timeout:
+                        raise RuntimeError(
+                            f"no worker result for {self.idle_timeout:.0f}s, {len(remaining)} pairs unfinished"
+                        )
+                    with self._lock:
+                        idle_seconds = now - self._last_poll if self._unleased else 0.0
+                    # 每段无人领取的时间只提示一次，有 worker 重新出现后再次计时
+                    if idle_seconds > DISTRIBUTED_IDLE_WARNING_SECONDS and not warned_idle:
+                        print(
+                            f"Warning: 已有 {idle_seconds:.0f} 秒没有 worker 领取分支对，"
+                            f"还有 {len(remaining)} 个分支对未完成",
+                            file=sys.stderr,
+                        )
+                    warned_idle = idle_seconds > DISTRIBUTED_IDLE_WARNING_SECONDS
+                    continue
+                last_progress = time.monotonic()
+                pair_result = outcome["result"]
+                pair = remaining.pop((pair_result.branch_a, pair_result.branch_b), None)
+                if outcome_job_id != job_id or pair is None:
+                    continue
+                yield pair[0], pair[1], pair_result, outcome["prefiltered"]
+        finally:
+            with self._lock:
+                self._job = None
+                self._leases.clear()
+                self._unleased.clear()
+
+    def close(self, grace_period: float = DISTRIBUTED_SHUTDOWN_GRACE_SECONDS) -> None:
+        """宣布结束，等所有已知 worker 都领到 "done"（最多 `grace_period` 秒）后再停止服务。"""
+        deadline = time.monotonic() + grace_period
+        with self._lock:
+            self._closing = True
+        while time.monotonic() < deadline:
+            with self._lock:
+                if self._workers <= self._notified_workers:
+                    break
+            time.sleep(0.1)
+        self._server.shutdown()
+        self._server.server_close()
+
+
+class WorkClient:
+    """worker 端访问 coordinator 的客户端；连接失败时在限定时间内重试。"""
+
+    def __init__(self, url: str, connect_timeout: float = WORKER_CONNECT_TIMEOUT_SECONDS) -> None:
+        self.url = url
+        self.connect_timeout = connect_timeout
+
+    def _post(self, path: str, body: bytes) -> bytes:
+        deadline = time.monotonic() + self.connect_timeout
+        while True:
+            request = urllib.request.Request(
+                f"{self.url}{path}",
+                data=body,
+                headers={"Content-Type": "application/json"},
+                method="POST",
+            )
+            try:
+                with urllib.request.urlopen(request, timeout=DISTRIBUTED_REQUEST_TIMEOUT_SECONDS) as response:
+                    return response.read()
+            except urllib.error.HTTPError as exc:
+                raise RuntimeError(f"coordinator rejected {path}: HTTP {exc.code}") from exc
+            except (urllib.error.URLError, OSError) as exc:
+                if time.monotonic() >= deadline:
+                    raise ConnectionError(f"unable to reach coordinator at {self.url}: {exc}") from exc
+                time.sleep(1.0)
+
+    def lease(self, worker: str, job_id: int) -> WorkLeasePayload:
+        body = WORK_LEASE_REQUEST_ADAPTER.dump_json({"worker": worker, "job_id": job_id})
+        return WORK_LEASE_ADAPTER.validate_json(self._post("/lease", body))
+
+    def submit(self, result: WorkResultPayload) -> None:
+        self._post("/result", WORK_RESULT_ADAPTER.dump_json(result))
+
+    def release(self, worker: str, job_id: int, lease_id: int) -> None:
+        self._post(
+            "/release", WORK_RELEASE_ADAPTER.dump_json({"worker": worker, "job_id": job_id, "lease_id": lease_id})
+        )
+
+
+def run_worker(args: Args, repo: Path, analyser: MainlineAnalyser) -> None:
+    """反复向 coordinator 领取分支对并交回结果，直到 coordinator 宣布结束或退出。"""
+    assert args.worker_url is not None
+    client = WorkClient(args.worker_url)
+    worker = f"{socket.gethostname()}-{os.getpid()}"
+    job: Optional[WorkJobPayload] = None
+    branches: Dict[str, BranchInfo] = {}
+    console.print(f"worker {worker} 已连接 {args.worker_url}")
+    while True:
+        try:
+            lease = client.lease(worker, job["job_id"] if job is not None else 0)
+        except ConnectionError:
+            if job is None:
+                raise
+            # 已经参与过分析的 worker 把 coordinator 退出视为全部任务结束
+            return
+        if lease["done"]:
+            return
+
+        if lease["job"] is not None:
+            job = lease["job"]
+            branches = {
+                branch["name"]: BranchInfo(name=branch["name"], tip=branch["tip"]) for branch in job["branches"]
+            }
+            commits = [job["main_commit"], *(branch.tip for branch in branches.values())]
+            missing = [
+                commit for commit, resolved in zip(commits, git_batch(repo).resolve_commits(commits)) if not resolved
+            ]
+            if missing:
+                # 先退回已领到的分支对，coordinator 可以立即转交其它 worker
+                if lease["pairs"]:
+                    client.release(worker, lease["job_id"], lease["lease_id"])
+                raise RuntimeError(f"commits missing from local clone, fetch first: {', '.join(missing[:5])}")
+            analyser.use_strategy(MergeStrategy.from_options(job["strategy_options"]))
+
+        if not lease["pairs"] or job is None:
+            time.sleep(lease["retry_after"])
+            continue
+
+        pairs = [(branches[branch_a], branches[branch_b]) for branch_a, branch_b in lease["pairs"]]
+        outcomes = analyser.analyse_leased_pairs(job["main_commit"], list(branches.values()), pairs)
+        client.submit(
+            {
+                "worker": worker,
+                "job_id": lease["job_id"],
+                "lease_id": lease["lease_id"],
+                "outcomes": [{"result": result, "prefiltered": prefiltered} for result, prefiltered in outcomes],
+            }
+        )
+        console.print(f"[{time.strftime('%H:%M:%S')}] 主分支 {job['main_branch']}：完成 {len(pairs)} 个分支对")
+
+
+def reports_to_json_dict(reports: Sequence[AnalysisReport]) -> Dict[str, object]:
+    """只有一个主分支时保持单份报告的格式；多个主分支时按传入顺序放在 `reports` 中。"""
+    if len(reports) == 1:
+        return reports[0].to_json_dict()
+    return {"reports": [report.to_json_dict() for report in reports]}
+
+
+class ReportPublisher:
+    """监视模式下发布最新报告：原子地覆盖 JSON 文件，并可在本机端口上以 HTTP 提供同样的内容。"""
+
+    def __init__(self, report_file: Optional[Path], serve_port: Optional[int]) -> None:
+        self.report_file = report_file
+        self._payload = b"{}\n"
+        self._payload_lock = threading.Lock()
+        self._server: Optional[ThreadingHTTPServer] = None
+        if serve_port is not None:
+            self._server = ThreadingHTTPServer(("127.0.0.1", serve_port), self._make_handler())
+            self._server.daemon_threads = True
+            threading.Thread(target=self._server.serve_forever, name="report-server", daemon=True).start()
+
+    @property
+    def server_address(self) -> Optional[Tuple[str, int]]:
+        if self._server is None:
+            return None
+        host, port = self._server.server_address[:2]
+        return str(host), int(port)
+
+    def _make_handler(self) -> type[BaseHTTPRequestHandler]:
+        publisher = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self) -> None:
+                payload = publisher.payload
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json; charset=utf-8")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format: str, *args: object) -> None:
+                pass
+
+        return Handler
+
+    @property
+    def payload(self) -> bytes:
+        with self._payload_lock:
+            return self._payload
+
+    def publish(self, reports: Sequence[AnalysisReport]) -> None:
+        document = {"updated_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"), **reports_to_json_dict(reports)}
+        payload = (json.dumps(document, ensure_ascii=False, indent=2) + "\n").encode("utf-8")
+        with self._payload_lock:
+            self._payload = payload
+
+        if self.report_file is not None:
+            self.report_file.parent.mkdir(parents=True, exist_ok=True)
+            temp_path = self.report_file.with_name(self.report_file.name + ".tmp")
+            temp_path.write_bytes(payload)
+            temp_path.replace(self.report_file)
+
+    def close(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+
+def interrupt_on_sigterm(signum: int, frame: Optional[FrameType]) -> None:
+    """监视模式下把 SIGTERM（systemd / docker stop / timeout）当作 Ctrl-C，走同样的清理流程。"""
+    raise KeyboardInterrupt
+
+
+def watch_repo(args: Args, repo: Path, analyser: MainlineAnalyser, publisher: ReportPublisher) -> None:
+    """轮询 `for-each-ref`，主分支或任一候选分支的提交变化时重新分析；未变化的分支对直接命中缓存。"""
+    last_snapshot: Optional[Tuple[Tuple[BranchInfo, ...], Tuple[BranchInfo, ...]]] = None
+    while True:
+        try:
+            targets, branch_info = resolve_targets(args, repo)
+            snapshot = (tuple(targets), tuple(branch_info))
+            if snapshot != last_snapshot:
+                reports = analyser.analyse_targets(targets, branch_info, plan=args.plan)
+                publisher.publish(reports)
+                last_snapshot = snapshot
+                for report in reports:
+                    risky_count = len(report.filtered_pair_results(conflicts_only=True))
+                    console.print(
+                        f"[{time.strftime('%H:%M:%S')}] 主分支 {report.main_branch} @ {report.main_commit[:12]}，"
+                        f"{report.branch_count} 个分支，{risky_count} 个分支对存在风险"
+                    )
+        except (RuntimeError, ValueError) as exc:
+            # 分支正在被改写、匹配的分支被删除或改名等情况只影响本轮，下一轮轮询时重试
+            print(f"Error: {exc}", file=sys.stderr)
+
+        time.sleep(args.poll_interval)
 
 
 def print_table(
@@ -835,6 +3908,10 @@ def print_report(report: AnalysisReport, conflicts_only: bool) -> None:
     console.print(f"[bold]主分支:[/] {report.main_branch}")
     console.print(f"[bold]主分支提交:[/] {report.main_commit}")
     console.print(f"[bold]测试分支数:[/] {report.branch_count}")
+    console.print(f"[bold]预筛判定分支对:[/] {report.prefiltered_pair_count}")
+    console.print(f"[bold]无需后续合并的序列:[/] {report.mergeless_sequence_count}")
+    if report.strategy_options:
+        console.print(f"[bold]合并策略选项:[/] {' '.join(f'-X {option}' for option in report.strategy_options)}")
     console.print()
 
     print_table(
@@ -851,35 +3928,183 @@ def print_report(report: AnalysisReport, conflicts_only: bool) -> None:
         ],
     )
 
+    if report.merge_plan is not None:
+        console.print()
+        console.print(f"[bold]预测冲突文件数:[/] {report.merge_plan.predicted_conflict_files}")
+        console.print(f"[bold]验证链冲突步骤:[/] {report.merge_plan.conflict_step_count}")
+        print_table(
+            "建议合并顺序",
+            [step.to_row(index) for index, step in enumerate(report.merge_plan.steps, start=1)],
+            [
+                ("index", "序号"),
+                ("branch", "分支"),
+                ("predicted_conflict_files", "预测冲突文件数"),
+                ("status", "验证结果"),
+                ("conflict_files", "冲突文件"),
+            ],
+        )
+
+
+class NdjsonWriter:
+    """逐行输出分支对结果，每行一个 JSON 对象；最后输出一行汇总。"""
+
+    def __init__(self, stream: TextIO, conflicts_only: bool) -> None:
+        self.stream = stream
+        self.conflicts_only = conflicts_only
+        # 多个主分支时各自计数，汇总行按主分支分别输出
+        self.pair_counts: Dict[str, int] = {}
+        self.status_counts: Dict[str, Dict[str, int]] = {}
+
+    def _write(self, payload: Mapping[str, object]) -> None:
+        self.stream.write(json.dumps(payload, ensure_ascii=False) + "\n")
+        self.stream.flush()
+
+    def write_pair(self, main_branch: str, pair_result: PairResult) -> None:
+        self.pair_counts[main_branch] = self.pair_counts.get(main_branch, 0) + 1
+        status_counts = self.status_counts.setdefault(main_branch, {status.value: 0 for status in PairStatus})
+        status_counts[pair_result.pair_status] += 1
+        if self.conflicts_only and pair_result.pair_status is PairStatus.CLEAN:
+            return
+        self._write({"type": "pair", "main_branch": main_branch, **asdict(pair_result)})
+
+    def write_summary(self, report: AnalysisReport, extra: Optional[Mapping[str, object]] = None) -> None:
+        payload: Dict[str, object] = {
+            "type": "summary",
+            "main_branch": report.main_branch,
+            "main_commit": report.main_commit,
+            "tested_branches": report.tested_branches,
+            "branch_count": report.branch_count,
+            "pair_count": self.pair_counts.get(report.main_branch, 0),
+            "status_counts": self.status_counts.get(report.main_branch, {status.value: 0 for status in PairStatus}),
+            "prefiltered_pair_count": report.prefiltered_pair_count,
+            "mergeless_sequence_count": report.mergeless_sequence_count,
+            "strategy_options": report.strategy_options,
+        }
+        if report.merge_plan is not None:
+            payload["merge_plan"] = asdict(report.merge_plan)
+        payload.update(extra or {})
+        self._write(payload)
+
+
+def print_profile(stats: Sequence[ProfileStat]) -> None:
+    console.print()
+    print_table(
+        "性能统计",
+        [stat.to_row() for stat in stats],
+        [
+            ("category", "类别"),
+            ("name", "名称"),
+            ("calls", "调用次数"),
+            ("total_seconds", "总耗时(s)"),
+            ("p50_ms", "P50(ms)"),
+            ("p90_ms", "P90(ms)"),
+            ("p99_ms", "P99(ms)"),
+            ("max_ms", "最大(ms)"),
+            ("output_bytes", "输出字节"),
+        ],
+    )
+
+
+def write_trace_file(path: Path) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(PROFILER.to_chrome_trace(), ensure_ascii=False), encoding="utf-8")
+
 
 def main() -> int:
     args = parse_args()
+    if args.profile or args.trace_file is not None:
+        PROFILER.enable()
+    if args.ram_lab and args.lab_root == args.temp_root:
+        print("Warning: 未找到可写的内存文件系统，实验仓库仍放在 --temp-root 中", file=sys.stderr)
+    cache: Optional[AnalysisCache] = None
+    analyser: Optional[MainlineAnalyser] = None
+    publisher: Optional[ReportPublisher] = None
+    ndjson_writer: Optional[NdjsonWriter] = None
+    coordinator: Optional[WorkCoordinator] = None
     try:
         repo = validate_repo(args.repo)
-        main_branch = detect_main_branch(repo, args.main_branch)
-        all_branches = collect_branches(repo)
-        branches = select_branches(all_branches, args.branch_patterns, main_branch)
-        if len(branches) < 2:
-            raise RuntimeError("过滤后至少需要 2 个候选分支")
-
-        branch_info = BranchInfo.resolve_many(repo, branches)
-        cache = AnalysisCache.load(args.cache_file)
-        report = analyse_repo(
+        cache = AnalysisCache.load(args.cache_dir, max_age_days=args.cache_max_age_days)
+        if args.coordinator_address is not None:
+            coordinator = WorkCoordinator(args.coordinator_address, idle_timeout=args.coordinator_timeout)
+            host, port = coordinator.server_address
+            # 标准输出留给 --json / --ndjson 结果
+            print(f"worker 接入地址: http://{host}:{port}", file=sys.stderr)
+        analyser = MainlineAnalyser(
             repo,
-            main_branch,
-            branch_info,
-            temp_root=args.temp_root,
+            temp_root=args.lab_root,
             cache=cache,
+            jobs=args.jobs,
+            engine=args.engine,
+            ancestry_file=args.ancestry_file,
+            prefilter=args.prefilter,
+            lab_store_dir=args.lab_store_dir,
+            coordinator=coordinator,
+            strategy=args.strategy,
+            # 实验仓库放在 --ram-lab 专门创建的目录中时，用完后连同该目录一起删除
+            remove_empty_temp_root=args.lab_root != args.temp_root,
         )
+        if args.worker_url is not None:
+            run_worker(args, repo, analyser)
+            return 0
+        if args.watch:
+            signal.signal(signal.SIGTERM, interrupt_on_sigterm)
+            publisher = ReportPublisher(args.report_file, args.serve_port)
+            if publisher.server_address is not None:
+                host, port = publisher.server_address
+                console.print(f"报告地址: http://{host}:{port}/")
+            watch_repo(args, repo, analyser, publisher)
+            return 0
+
+        targets, branch_info = resolve_targets(args, repo)
+        if args.output_ndjson:
+            ndjson_writer = NdjsonWriter(sys.stdout, conflicts_only=args.conflicts_only)
+            # 规划合并顺序需要完整的两两结果，此时仍需保留结果
+            reports = analyser.analyse_targets(
+                targets,
+                branch_info,
+                plan=args.plan,
+                on_result=ndjson_writer.write_pair,
+                collect_results=args.plan,
+            )
+        else:
+            reports = analyser.analyse_targets(targets, branch_info, plan=args.plan)
+    except KeyboardInterrupt:
+        return 0 if args.watch else 130
     except Exception as exc:
         print(f"Error: {exc}", file=sys.stderr)
         return 1
-
-    if args.output_json:
-        json.dump(report.to_json_dict(), sys.stdout, ensure_ascii=False, indent=2)
+    finally:
+        if coordinator is not None:
+            coordinator.close()
+        if publisher is not None:
+            publisher.close()
+        if analyser is not None:
+            analyser.close()
+        if cache is not None:
+            cache.close()
+        close_git_batches()
+        if args.trace_file is not None:
+            write_trace_file(args.trace_file)
+
+    profile_stats = PROFILER.summary() if args.profile else None
+    if ndjson_writer is not None:
+        extra = {"profile": [asdict(stat) for stat in profile_stats]} if profile_stats is not None else None
+        for index, report in enumerate(reports):
+            # 性能统计覆盖整次运行，只附在最后一行汇总上
+            ndjson_writer.write_summary(report, extra if index == len(reports) - 1 else None)
+    elif args.output_json:
+        payload = reports_to_json_dict(reports)
+        if profile_stats is not None:
+            payload["profile"] = [asdict(stat) for stat in profile_stats]
+        json.dump(payload, sys.stdout, ensure_ascii=False, indent=2)
         sys.stdout.write("\n")
     else:
-        print_report(report, conflicts_only=args.conflicts_only)
+        for index, report in enumerate(reports):
+            if index:
+                console.print()
+            print_report(report, conflicts_only=args.conflicts_only)
+        if profile_stats is not None:
+            print_profile(profile_stats)
 
     return 0
 
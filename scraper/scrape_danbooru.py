@@ -1,10 +1,8 @@
 # pyright: standard
 import argparse
-import hashlib
 import json
 import re
 import sys
-import time
 from collections.abc import Mapping
 from dataclasses import dataclass
 from pathlib import Path
@@ -14,8 +12,18 @@ from urllib.parse import parse_qsl, unquote, urlencode, urljoin, urlsplit, urlun
 from playwright.sync_api import Locator, Page, TimeoutError as PlaywrightTimeoutError, sync_playwright
 from rich.console import Console
 from tqdm import tqdm
+from utils import (
+    DEFAULT_BURST,
+    DEFAULT_MAX_RETRIES,
+    DEFAULT_REQUESTS_PER_SECOND,
+    RETRYABLE_STATUS_CODES,
+    CrawlProgress,
+    CrawlState,
+    FileHashIndex,
+    RateLimiter,
+    parse_retry_after,
+)
 
-REQUEST_DELAY_MS = 500
 POSTS_PER_PAGE = 200
 MAX_FILENAME_LENGTH = 64
 REMOVED_POST_TEXT = "This page has been removed because of a takedown request."
@@ -30,12 +38,19 @@ class Args:
     timeout_ms: int
     headless: bool
     profile_dir: Path
+    rate: float
+    burst: int
+    incremental: bool
 
     @classmethod
     def from_ns(cls, namespace: argparse.Namespace) -> "Args":
         timeout_seconds = namespace.timeout
         if timeout_seconds < 0:
             raise ValueError("--timeout must be greater than or equal to 0.")
+        if namespace.rate <= 0:
+            raise ValueError("--rate must be greater than 0.")
+        if namespace.burst < 1:
+            raise ValueError("--burst must be at least 1.")
 
         timeout_ms = 0 if timeout_seconds == 0 else timeout_seconds * 1000
         base_dir = Path(__file__).parent
@@ -48,6 +63,9 @@ class Args:
             timeout_ms=timeout_ms,
             headless=namespace.headless,
             profile_dir=profile_dir,
+            rate=namespace.rate,
+            burst=namespace.burst,
+            incremental=namespace.incremental,
         )
 
 
@@ -55,10 +73,12 @@ class Args:
 args: Args = cast(Args, None)
 existing_file_hashes: Set[str] = cast(Set[str], None)
 download_page: Page = cast(Page, None)
+rate_limiter: RateLimiter = cast(RateLimiter, None)
+crawl_state: CrawlState = cast(CrawlState, None)
 
 
 def load_args() -> None:
-    global args
+    global args, rate_limiter
     parser = argparse.ArgumentParser(description="Danbooru 资源抓取脚本 (Playwright Python API)")
     parser.add_argument("url", type=str, help="目标网页 URL")
     parser.add_argument("-o", "--output", type=str, default=None, help="资源保存目录 (默认: .danbooru)")
@@ -75,7 +95,18 @@ def load_args() -> None:
         default=None,
         help="浏览器用户数据目录 (默认: scraper/.danbooru_profile)",
     )
+    parser.add_argument(
+        "--rate",
+        type=float,
+        default=DEFAULT_REQUESTS_PER_SECOND,
+        help=f"每个主机每秒最多发起的请求数 (默认: {DEFAULT_REQUESTS_PER_SECOND})",
+    )
+    parser.add_argument(
+        "--burst", type=int, default=DEFAULT_BURST, help=f"每个主机允许的突发请求数 (默认: {DEFAULT_BURST})"
+    )
+    parser.add_argument("--incremental", action="store_true", help="增量抓取：遇到上次完整抓取时已记录的帖子后停止翻页")
     args = Args.from_ns(parser.parse_args())
+    rate_limiter = RateLimiter(args.rate, args.burst)
 
 
 def log(message: str) -> None:
@@ -114,6 +145,12 @@ def build_counts_api_url() -> str:
     return urlunsplit((parsed.scheme, parsed.netloc, "/counts/posts.json", urlencode(query_params), ""))
 
 
+def build_crawl_query() -> str:
+    parsed = urlsplit(args.url)
+    query_params = [(key, value) for key, value in build_api_query_params() if key not in {"z", "page", "limit"}]
+    return urlunsplit((parsed.scheme, parsed.netloc, "/posts", urlencode(query_params), ""))
+
+
 def build_post_url(post_id: str) -> str:
     return urlunsplit(urlsplit(args.url)._replace(path=f"/posts/{post_id}", query="", fragment=""))
 
@@ -182,31 +219,10 @@ def extract_embedded_hash(filename: str) -> str | None:
     return candidate.lower()
 
 
-def calculate_file_md5(file_path: Path) -> str:
-    hasher = hashlib.md5()
-    with file_path.open("rb") as handle:
-        for chunk in iter(lambda: handle.read(1024 * 1024), b""):
-            hasher.update(chunk)
-    return hasher.hexdigest()
-
-
 def initialize_existing_file_hashes(output_dir: Path) -> None:
     global existing_file_hashes
-    hashes: set[str] = set()
-
-    for entry in output_dir.iterdir():
-        if not entry.is_file():
-            continue
-
-        hash_value = extract_embedded_hash(entry.name) or calculate_file_md5(entry)
-        if hash_value:
-            hashes.add(hash_value)
-
-    existing_file_hashes = hashes
-
-
-def delay(ms: int) -> None:
-    time.sleep(ms / 1000)
+    with FileHashIndex(output_dir) as index:
+        existing_file_hashes = index.collect(extract_embedded_hash)
 
 
 def get_error_message(error: BaseException) -> str:
@@ -261,7 +277,23 @@ def wait_for_challenge_clear(page: Page) -> None:
         raise RuntimeError("Cloudflare challenge is still active after manual confirmation.")
 
 
-def fetch_json_in_page(page: Page, target_url: str) -> Any:
+def goto_rate_limited(page: Page, url: str) -> None:
+    """经过限速器打开页面；429/503 时退避重试，Cloudflare 验证页交给 `wait_for_challenge_clear` 处理。"""
+    attempt = 0
+    while True:
+        rate_limiter.acquire(url)
+        response = page.goto(url, wait_until="domcontentloaded", timeout=args.timeout_ms)
+        if response is None or response.status not in RETRYABLE_STATUS_CODES or is_challenge_page(page):
+            rate_limiter.recover(url)
+            return
+
+        rate_limiter.back_off(url, parse_retry_after(response.headers.get("retry-after")))
+        if attempt >= DEFAULT_MAX_RETRIES:
+            return
+        attempt += 1
+
+
+def evaluate_fetch(page: Page, target_url: str) -> Mapping[str, Any]:
     result = page.evaluate(
         """
         async ({ url, timeoutMs }) => {
@@ -276,6 +308,7 @@ def fetch_json_in_page(page: Page, target_url: str) -> Any:
               status: response.status,
               text,
               url: response.url,
+              retryAfter: response.headers.get("Retry-After") || "",
               timedOut: false,
               fetchError: "",
             };
@@ -286,6 +319,7 @@ def fetch_json_in_page(page: Page, target_url: str) -> Any:
               status: 0,
               text: "",
               url,
+              retryAfter: "",
               timedOut: timeoutMs > 0 && message.toLowerCase().includes("abort"),
               fetchError: message,
             };
@@ -302,6 +336,24 @@ def fetch_json_in_page(page: Page, target_url: str) -> Any:
     if not isinstance(result, Mapping):
         raise RuntimeError(f"Unexpected fetch result for {target_url}")
 
+    return result
+
+
+def fetch_json_in_page(page: Page, target_url: str) -> Any:
+    attempt = 0
+    while True:
+        rate_limiter.acquire(target_url)
+        result = evaluate_fetch(page, target_url)
+        if result.get("status") not in RETRYABLE_STATUS_CODES:
+            rate_limiter.recover(target_url)
+            break
+
+        retry_after = result.get("retryAfter")
+        rate_limiter.back_off(target_url, parse_retry_after(retry_after if isinstance(retry_after, str) else None))
+        if attempt >= DEFAULT_MAX_RETRIES:
+            break
+        attempt += 1
+
     if result.get("timedOut"):
         raise RuntimeError(f"Timed out fetching {target_url}")
 
@@ -370,6 +422,10 @@ def prefetch_posts_pages(page: Page) -> list[list[Any]]:
         pages.append(posts)
         if len(posts) < POSTS_PER_PAGE:
             break
+        if args.incremental and any(
+            crawl_state.is_settled(post_id) for post in posts if (post_id := get_post_id(post))
+        ):
+            break
 
         page_number += 1
 
@@ -400,8 +456,8 @@ def get_download_link() -> Locator:
     return download_page.get_by_role("link", name=re.compile(r"^Download$"))
 
 
-def prepare_download(post_url: str) -> Path:
-    download_page.goto(post_url, wait_until="domcontentloaded", timeout=args.timeout_ms)
+def prepare_download(post_url: str) -> tuple[str, Path]:
+    goto_rate_limited(download_page, post_url)
     wait_for_challenge_clear(download_page)
     non_downloadable_reason = get_non_downloadable_reason(download_page)
     if non_downloadable_reason:
@@ -415,18 +471,19 @@ def prepare_download(post_url: str) -> Path:
 
     download_url = urljoin(post_url, download_href)
     download_attribute = download_link.get_attribute("download")
-    return args.output / resolve_download_filename(download_url, download_attribute)
+    return download_url, args.output / resolve_download_filename(download_url, download_attribute)
 
 
-def download_post_asset(output_path: Path) -> None:
+def download_post_asset(download_url: str, output_path: Path) -> None:
     download_link = get_download_link()
+    rate_limiter.acquire(download_url)
     with download_page.expect_download(timeout=args.timeout_ms) as download_info:
         download_link.click()
     download = download_info.value
     download.save_as(output_path)
 
 
-def process_posts(posts: list[Any], page_number: int, seen_post_ids: set[str]) -> None:
+def process_posts(posts: list[Any], page_number: int, seen_post_ids: set[str], crawl_progress: CrawlProgress) -> None:
     progress = tqdm(posts, desc=f"Page {page_number}", unit="post", leave=False, position=1, file=sys.stderr)
     for index, post in enumerate(progress, start=1):
         post_id = get_post_id(post)
@@ -438,44 +495,53 @@ def process_posts(posts: list[Any], page_number: int, seen_post_ids: set[str]) -
             continue
 
         seen_post_ids.add(post_id)
+        crawl_progress.observe(post_id)
+        if args.incremental and crawl_state.is_settled(post_id):
+            crawl_progress.reached_known = True
+            continue
 
         post_hash = get_post_hash(post)
         if post_hash and post_hash in existing_file_hashes:
             log(f"[yellow]Skipped page[/yellow] {page_number} post {index}: hash already exists {post_hash}")
+            crawl_state.record_post(post_id, content_hash=post_hash)
             continue
 
         try:
-            output_path = prepare_download(build_post_url(post_id))
+            download_url, output_path = prepare_download(build_post_url(post_id))
         except SkipPostError as error:
             log(f"[yellow]Skipped page[/yellow] {page_number} post {index}: {get_error_message(error)}")
+            crawl_state.record_post(post_id, content_hash=post_hash)
             continue
         except Exception as error:
+            crawl_progress.failures += 1
             log(f"[red]Failed page[/red] {page_number} post {index}: {get_error_message(error)}")
-            delay(REQUEST_DELAY_MS)
             continue
 
         if output_path.exists():
             log(f"[yellow]Skipped page[/yellow] {page_number} post {index}: file already exists")
+            crawl_state.record_post(post_id, image_url=download_url, content_hash=post_hash)
             continue
 
         try:
-            download_post_asset(output_path)
+            download_post_asset(download_url, output_path)
+            crawl_state.record_post(post_id, image_url=download_url, content_hash=post_hash)
         except Exception as error:
+            crawl_progress.failures += 1
             log(f"[red]Failed page[/red] {page_number} post {index}: {get_error_message(error)}")
 
-        delay(REQUEST_DELAY_MS)
-
 
 def run_browser_scrape() -> None:
-    global download_page
+    global download_page, crawl_state
     assert args is not None
 
     args.output.mkdir(parents=True, exist_ok=True)
     args.profile_dir.mkdir(parents=True, exist_ok=True)
     initialize_existing_file_hashes(args.output)
     assert existing_file_hashes is not None
+    with CrawlState(args.output, build_crawl_query()) as state, sync_playwright() as playwright:
+        if args.incremental and state.completed_at is None:
+            log("[yellow]No completed crawl recorded for this query, running a full crawl.[/yellow]")
 
-    with sync_playwright() as playwright:
         context = playwright.chromium.launch_persistent_context(
             str(args.profile_dir),
             headless=args.headless,
@@ -484,8 +550,9 @@ def run_browser_scrape() -> None:
         )
 
         try:
+            crawl_state = state
             page = context.pages[0] if context.pages else context.new_page()
-            page.goto(args.url, wait_until="domcontentloaded", timeout=args.timeout_ms)
+            goto_rate_limited(page, args.url)
             wait_for_challenge_clear(page)
 
             total_pages, _, cached_pages = fetch_total_pages(page)
@@ -494,6 +561,7 @@ def run_browser_scrape() -> None:
             download_page = context.new_page()
             assert download_page is not None
             seen_post_ids: set[str] = set()
+            crawl_progress = CrawlProgress()
 
             with tqdm(
                 range(1, total_pages + 1), desc="Processing pages", unit="page", position=0, file=sys.stderr
@@ -502,10 +570,17 @@ def run_browser_scrape() -> None:
                     posts = (
                         cached_pages[page_number - 1] if cached_pages is not None else fetch_posts(page, page_number)
                     )
-                    process_posts(posts, page_number, seen_post_ids)
+                    process_posts(posts, page_number, seen_post_ids, crawl_progress)
+                    if crawl_progress.reached_known:
+                        log(f"[green]Reached posts from the previous crawl at page[/green] {page_number}")
+                        break
+
+            if not crawl_state.mark_completed(crawl_progress):
+                log(f"[yellow]{crawl_progress.failures} failures, crawl state not marked as complete.[/yellow]")
         finally:
             download_page = cast(Page, None)
             context.close()
+            crawl_state = cast(CrawlState, None)
 
 
 def main() -> None:
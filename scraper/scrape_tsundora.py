@@ -3,7 +3,7 @@ import argparse
 import math
 import re
 import sys
-import time
+from concurrent.futures import Future, as_completed
 from pathlib import Path
 from urllib.parse import urlparse, urlunparse
 
@@ -11,9 +11,20 @@ import requests
 from bs4 import BeautifulSoup
 from rich.console import Console
 from tqdm import tqdm
-from utils import build_session, download_url_to_directory, fetch_html, get_tag_attr, normalize_url
+from utils import (
+    DEFAULT_BURST,
+    DEFAULT_HOST_CONCURRENCY,
+    DEFAULT_REQUESTS_PER_SECOND,
+    CrawlProgress,
+    CrawlState,
+    DownloadEngine,
+    RateLimiter,
+    build_session,
+    fetch_html,
+    get_tag_attr,
+    normalize_url,
+)
 
-REQUEST_DELAY_SECONDS = 1.0
 REQUEST_TIMEOUT_SECONDS = 30
 PAGE_PATH_RE = re.compile(r"/page/\d+/?$")
 console = Console(file=sys.stderr)
@@ -28,6 +39,10 @@ class CliArgs(argparse.Namespace):
     url: str
     output: str | None
     timeout: int
+    jobs: int
+    rate: float
+    burst: int
+    incremental: bool
 
 
 def build_first_page_url(url: str) -> str:
@@ -151,32 +166,47 @@ def process_page(
     base_url: str,
     page: int,
     session: requests.Session,
+    engine: DownloadEngine,
     output_dir: Path,
+    crawl_state: CrawlState,
+    crawl_progress: CrawlProgress,
+    incremental: bool,
 ) -> None:
     page_url = build_page_url(base_url, page)
     html = fetch_html(session, page_url, timeout=REQUEST_TIMEOUT_SECONDS)
     soup = BeautifulSoup(html, "html.parser")
     post_urls = parse_listing_post_urls(page_url, soup)
+    if post_urls:
+        crawl_progress.observe(post_urls[0])
 
+    # 解析帖子页仍逐个进行，图片交给下载引擎在后台并发下载
+    downloads: dict[Future[Path], tuple[str, str]] = {}
     progress = tqdm(post_urls, desc=f"Page {page}", unit="post", leave=False, position=1)
     for post_url in progress:
+        if incremental and crawl_state.is_settled(post_url):
+            crawl_progress.reached_known = True
+            continue
+
         try:
-            image_url = resolve_image_url(session, post_url)
-            download_url_to_directory(
-                session,
-                image_url,
-                output_dir,
-                referer=post_url,
-                timeout=REQUEST_TIMEOUT_SECONDS,
-            )
+            # 已记录的原图地址无需再解析帖子页与图片页
+            image_url = crawl_state.get_image_url(post_url) or resolve_image_url(session, post_url)
+            downloads[engine.submit(image_url, output_dir, referer=post_url)] = (post_url, image_url)
         except Exception as exc:
+            crawl_progress.failures += 1
             log(f"[red]Failed to process[/red] {post_url}: {exc}")
 
-        time.sleep(REQUEST_DELAY_SECONDS)
+    for future in as_completed(downloads):
+        post_url, image_url = downloads[future]
+        try:
+            future.result()
+            crawl_state.record_post(post_url, image_url=image_url)
+        except Exception as exc:
+            crawl_progress.failures += 1
+            log(f"[red]Failed to download[/red] {post_url}: {exc}")
 
 
-def crawl_listing(start_url: str, output_dir: Path) -> None:
-    session = build_session()
+def crawl_listing(start_url: str, output_dir: Path, jobs: int, rate_limiter: RateLimiter, incremental: bool) -> None:
+    session = build_session(rate_limiter=rate_limiter, pool_maxsize=jobs)
     first_page_url = build_first_page_url(start_url)
 
     log(f"[cyan]Fetching first page:[/cyan] {first_page_url}")
@@ -185,17 +215,35 @@ def crawl_listing(start_url: str, output_dir: Path) -> None:
     total_pages = parse_total_pages(first_page_soup)
     log(f"[green]Total pages:[/green] {total_pages}")
 
-    outer_progress = tqdm(range(1, total_pages + 1), desc="Processing pages", unit="page", position=0)
-    for page_number in outer_progress:
-        page_url = build_page_url(first_page_url, page_number)
-        outer_progress.set_postfix_str(page_url, refresh=False)
+    with (
+        CrawlState(output_dir, first_page_url) as crawl_state,
+        DownloadEngine(session, max_per_host=jobs, timeout=REQUEST_TIMEOUT_SECONDS) as engine,
+    ):
+        if incremental and crawl_state.completed_at is None:
+            log("[yellow]No completed crawl recorded for this URL, running a full crawl.[/yellow]")
+
+        crawl_progress = CrawlProgress()
+        outer_progress = tqdm(range(1, total_pages + 1), desc="Processing pages", unit="page", position=0)
+        for page_number in outer_progress:
+            page_url = build_page_url(first_page_url, page_number)
+            outer_progress.set_postfix_str(page_url, refresh=False)
+
+            process_page(
+                base_url=first_page_url,
+                page=page_number,
+                session=session,
+                engine=engine,
+                output_dir=output_dir,
+                crawl_state=crawl_state,
+                crawl_progress=crawl_progress,
+                incremental=incremental,
+            )
+            if crawl_progress.reached_known:
+                log(f"[green]Reached posts from the previous crawl at page[/green] {page_number}")
+                break
 
-        process_page(
-            base_url=first_page_url,
-            page=page_number,
-            session=session,
-            output_dir=output_dir,
-        )
+        if not crawl_state.mark_completed(crawl_progress):
+            log(f"[yellow]{crawl_progress.failures} failures, crawl state not marked as complete.[/yellow]")
 
 
 def main() -> None:
@@ -205,13 +253,30 @@ def main() -> None:
     parser.add_argument("url", type=str, help="目标网页 URL")
     parser.add_argument("-o", "--output", type=str, default=None, help="图片保存目录 (默认: .tsundora)")
     parser.add_argument("--timeout", type=int, default=REQUEST_TIMEOUT_SECONDS, help="请求超时秒数 (默认: 30)")
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=DEFAULT_HOST_CONCURRENCY,
+        help=f"同一主机的最大并发下载数 (默认: {DEFAULT_HOST_CONCURRENCY})",
+    )
+    parser.add_argument(
+        "--rate",
+        type=float,
+        default=DEFAULT_REQUESTS_PER_SECOND,
+        help=f"每个主机每秒最多发起的请求数 (默认: {DEFAULT_REQUESTS_PER_SECOND})",
+    )
+    parser.add_argument(
+        "--burst", type=int, default=DEFAULT_BURST, help=f"每个主机允许的突发请求数 (默认: {DEFAULT_BURST})"
+    )
+    parser.add_argument("--incremental", action="store_true", help="增量抓取：遇到上次完整抓取时已记录的帖子后停止翻页")
     args = parser.parse_args(namespace=CliArgs())
     REQUEST_TIMEOUT_SECONDS = args.timeout
 
     output_dir = Path(args.output) if args.output else Path(__file__).parent / ".tsundora"
     output_dir.mkdir(parents=True, exist_ok=True)
 
-    crawl_listing(args.url, output_dir)
+    crawl_listing(args.url, output_dir, args.jobs, RateLimiter(args.rate, args.burst), args.incremental)
 
 
 if __name__ == "__main__":
@@ -1,6 +1,7 @@
 # pyright: standard
 import argparse
 import sys
+from concurrent.futures import as_completed
 from pathlib import Path
 from typing import List
 from urllib.parse import parse_qs, urlencode, urlparse, urlunparse
@@ -9,7 +10,18 @@ import requests
 from bs4 import BeautifulSoup
 from rich.console import Console
 from tqdm import tqdm
-from utils import build_session, download_url_to_directory, fetch_html, get_tag_attr
+from utils import (
+    DEFAULT_BURST,
+    DEFAULT_HOST_CONCURRENCY,
+    DEFAULT_REQUESTS_PER_SECOND,
+    CrawlProgress,
+    CrawlState,
+    DownloadEngine,
+    RateLimiter,
+    build_session,
+    fetch_html,
+    get_tag_attr,
+)
 
 REQUEST_TIMEOUT_SECONDS = 30
 console = Console(file=sys.stderr)
@@ -68,16 +80,37 @@ def parse_current_page(soup: BeautifulSoup) -> int:
     return 1
 
 
-def process_page(session: requests.Session, base_url: str, page: int, output_dir: Path) -> None:
+def process_page(
+    session: requests.Session,
+    engine: DownloadEngine,
+    base_url: str,
+    page: int,
+    output_dir: Path,
+    crawl_state: CrawlState,
+    progress: CrawlProgress,
+    incremental: bool,
+) -> None:
     new_url = build_page_url(base_url, page)
     html: str = fetch_html(session, new_url, timeout=REQUEST_TIMEOUT_SECONDS)
     soup: BeautifulSoup = BeautifulSoup(html, "html.parser")
     image_links: List[str] = parse_image_links(soup)
 
-    for link in tqdm(image_links, desc="Downloading images", unit="image", leave=False):
+    # 列表页只给出原图直链，直接以它作为帖子的标识
+    if image_links:
+        progress.observe(image_links[0])
+    if incremental:
+        settled_links = [link for link in image_links if crawl_state.is_settled(link)]
+        progress.reached_known = progress.reached_known or bool(settled_links)
+        image_links = [link for link in image_links if link not in settled_links]
+
+    futures = {engine.submit(link, output_dir): link for link in image_links}
+    for future in tqdm(as_completed(futures), total=len(futures), desc="Downloading images", unit="image", leave=False):
+        link = futures[future]
         try:
-            download_url_to_directory(session, link, output_dir, timeout=REQUEST_TIMEOUT_SECONDS)
+            future.result()
+            crawl_state.record_post(link, image_url=link)
         except Exception as e:
+            progress.failures += 1
             log(f"[red]Failed to download[/red] {link}: {e}")
 
 
@@ -88,12 +121,29 @@ def main() -> None:
     parser.add_argument("url", type=str, help="目标网页 URL")
     parser.add_argument("-o", "--output", type=str, default=None, help="图片保存目录 (默认: .yandere)")
     parser.add_argument("--timeout", type=int, default=REQUEST_TIMEOUT_SECONDS, help="请求超时秒数 (默认: 15)")
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=DEFAULT_HOST_CONCURRENCY,
+        help=f"同一主机的最大并发下载数 (默认: {DEFAULT_HOST_CONCURRENCY})",
+    )
+    parser.add_argument(
+        "--rate",
+        type=float,
+        default=DEFAULT_REQUESTS_PER_SECOND,
+        help=f"每个主机每秒最多发起的请求数 (默认: {DEFAULT_REQUESTS_PER_SECOND})",
+    )
+    parser.add_argument(
+        "--burst", type=int, default=DEFAULT_BURST, help=f"每个主机允许的突发请求数 (默认: {DEFAULT_BURST})"
+    )
+    parser.add_argument("--incremental", action="store_true", help="增量抓取：遇到上次完整抓取时已记录的帖子后停止翻页")
     args: argparse.Namespace = parser.parse_args()
     REQUEST_TIMEOUT_SECONDS = args.timeout
 
     output_dir: Path = Path(args.output) if args.output else Path(__file__).parent / ".yandere"
     output_dir.mkdir(parents=True, exist_ok=True)
-    session: requests.Session = build_session()
+    session: requests.Session = build_session(rate_limiter=RateLimiter(args.rate, args.burst), pool_maxsize=args.jobs)
     first_page_url = build_page_url(args.url, 1)
 
     log(f"[cyan]Fetching HTML from[/cyan] {first_page_url}...")
@@ -103,11 +153,27 @@ def main() -> None:
     total_page_count = parse_total_pages(soup)
     log(f"[green]Total pages:[/green] {total_page_count}")
 
-    for page in tqdm(range(1, total_page_count + 1), desc="Processing pages", unit="page"):
-        try:
-            process_page(session, first_page_url, page, output_dir)
-        except Exception as e:
-            log(f"[red]Failed to process page[/red] {page}: {e}")
+    with (
+        CrawlState(output_dir, first_page_url) as crawl_state,
+        DownloadEngine(session, max_per_host=args.jobs, timeout=REQUEST_TIMEOUT_SECONDS) as engine,
+    ):
+        if args.incremental and crawl_state.completed_at is None:
+            log("[yellow]No completed crawl recorded for this URL, running a full crawl.[/yellow]")
+
+        progress = CrawlProgress()
+        for page in tqdm(range(1, total_page_count + 1), desc="Processing pages", unit="page"):
+            try:
+                process_page(session, engine, first_page_url, page, output_dir, crawl_state, progress, args.incremental)
+            except Exception as e:
+                progress.failures += 1
+                log(f"[red]Failed to process page[/red] {page}: {e}")
+
+            if progress.reached_known:
+                log(f"[green]Reached posts from the previous crawl at page[/green] {page}")
+                break
+
+        if not crawl_state.mark_completed(progress):
+            log(f"[yellow]{progress.failures} failures, crawl state not marked as complete.[/yellow]")
 
 
 if __name__ == "__main__":
@@ -1,21 +1,210 @@
+import asyncio
+import functools
 import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
 from pathlib import Path
-from typing import Any
+from types import TracebackType
+from typing import Any, Callable, Dict, Self
 from urllib.parse import urljoin, urlparse, urlunparse
 
 import requests
 from bs4.element import Tag
+from requests.adapters import HTTPAdapter
+from tqdm import tqdm
 
 DEFAULT_USER_AGENT = "Mozilla/5.0"
 DEFAULT_HTML_TIMEOUT_SECONDS = 10
 DEFAULT_DOWNLOAD_TIMEOUT_SECONDS = 15
 MAX_FILENAME_LENGTH = 64
 FILENAME_HASH_LENGTH = 16
+DEFAULT_HOST_CONCURRENCY = 4
+DEFAULT_DOWNLOAD_WORKERS = 16
+DEFAULT_REQUESTS_PER_SECOND = 2.0
+DEFAULT_BURST = 4
+DEFAULT_MAX_RETRIES = 3
+MAX_BACKOFF_SECONDS = 60
+# 退避后速率最低降到基准速率的 1/RATE_RECOVERY_STEPS，之后每次成功恢复同样的一份
+RATE_RECOVERY_STEPS = 10
+RETRYABLE_STATUS_CODES = frozenset({429, 503})
+PARTIAL_DOWNLOAD_SUFFIX = ".part"
+# `.part` 文件旁记录首次响应的 ETag 或 Last-Modified，续传时作为 If-Range 发送
+PARTIAL_VALIDATOR_SUFFIX = ".validator"
+CRAWL_STATE_FILENAME = ".crawl_state.sqlite3"
+CRAWL_STATE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS posts (
+    query TEXT NOT NULL,
+    post_id TEXT NOT NULL,
+    image_url TEXT,
+    content_hash TEXT,
+    seen_at REAL NOT NULL,
+    PRIMARY KEY (query, post_id)
+);
+CREATE TABLE IF NOT EXISTS queries (
+    query TEXT PRIMARY KEY,
+    high_water_mark TEXT,
+    completed_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS file_hashes (
+    name TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    md5 TEXT NOT NULL
+);
+"""
+# 待计算的文件不少于这个数量时才启动进程池
+HASH_POOL_MIN_FILES = 8
+CONTENT_RANGE_RE = re.compile(r"bytes (?:(\d+)-\d+|\*)/(\d+|\*)")
 
 
-def build_session(user_agent: str = DEFAULT_USER_AGENT) -> requests.Session:
-    session = requests.Session()
+class IncompleteDownloadError(RuntimeError):
+    pass
+
+
+def parse_retry_after(value: str | None) -> float | None:
+    """解析 `Retry-After` 头，支持秒数与 HTTP 日期两种形式。"""
+    if not value:
+        return None
+
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max((retry_at - datetime.now(timezone.utc)).total_seconds(), 0.0)
+
+
+@dataclass(slots=True)
+class TokenBucket:
+    rate: float
+    capacity: float
+    tokens: float
+    updated: float
+    blocked_until: float = 0.0
+    failures: int = 0
+
+    def refill(self, now: float) -> None:
+        # 退避期间 updated 被推到解封时刻，解封前不累积令牌
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+
+class RateLimiter:
+    """
+    按主机划分的令牌桶限速器，可在多个线程间共享。
+
+    每个主机允许 `burst` 个请求的突发，之后按 `requests_per_second` 补充令牌；
+    遇到 429/503 时暂停该主机（优先遵循 `Retry-After`，否则指数退避）并将速率减半，之后每次成功再逐步恢复。
+    """
+
+    def __init__(self, requests_per_second: float = DEFAULT_REQUESTS_PER_SECOND, burst: int = DEFAULT_BURST) -> None:
+        if requests_per_second <= 0:
+            raise ValueError("requests_per_second must be greater than 0.")
+        if burst < 1:
+            raise ValueError("burst must be at least 1.")
+
+        self.requests_per_second = requests_per_second
+        self.burst = burst
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, url: str) -> None:
+        """阻塞直到 URL 所在主机有可用令牌。"""
+        while True:
+            with self._lock:
+                bucket = self._bucket(url)
+                now = time.monotonic()
+                bucket.refill(now)
+                if now >= bucket.blocked_until and bucket.tokens >= 1:
+                    bucket.tokens -= 1
+                    return
+                wait = max(bucket.blocked_until - now, (1 - bucket.tokens) / bucket.rate)
+            time.sleep(wait)
+
+    def back_off(self, url: str, retry_after: float | None = None) -> float:
+        """主机返回 429/503 后暂停该主机并降低速率，返回暂停的秒数。"""
+        with self._lock:
+            bucket = self._bucket(url)
+            now = time.monotonic()
+            bucket.failures += 1
+            delay = retry_after if retry_after is not None else min(2.0**bucket.failures, MAX_BACKOFF_SECONDS)
+            bucket.blocked_until = max(bucket.blocked_until, now + delay)
+            bucket.rate = max(bucket.rate / 2, self.requests_per_second / RATE_RECOVERY_STEPS)
+            bucket.tokens = 0.0
+            bucket.updated = bucket.blocked_until
+            return delay
+
+    def recover(self, url: str) -> None:
+        """请求成功后逐步恢复被降低的速率。"""
+        with self._lock:
+            bucket = self._bucket(url)
+            bucket.failures = 0
+            bucket.rate = min(self.requests_per_second, bucket.rate + self.requests_per_second / RATE_RECOVERY_STEPS)
+
+    def _bucket(self, url: str) -> TokenBucket:
+        host = urlparse(url).netloc
+        bucket = self._buckets.get(host)
+        if bucket is None:
+            bucket = self._buckets[host] = TokenBucket(
+                rate=self.requests_per_second,
+                capacity=self.burst,
+                tokens=self.burst,
+                updated=time.monotonic(),
+            )
+        return bucket
+
+
+class RateLimitedSession(requests.Session):
+    """所有请求先从限速器取令牌；遇到 429/503 时退避并重试，重试耗尽后把最后的响应交给调用方处理。"""
+
+    def __init__(self, rate_limiter: RateLimiter, max_retries: int = DEFAULT_MAX_RETRIES) -> None:
+        super().__init__()
+        self.rate_limiter = rate_limiter
+        self.max_retries = max_retries
+
+    def request(self, method: str | bytes, url: str | bytes, *args: Any, **kwargs: Any) -> requests.Response:
+        target_url = url.decode() if isinstance(url, bytes) else url
+        attempt = 0
+        while True:
+            self.rate_limiter.acquire(target_url)
+            response = super().request(method, url, *args, **kwargs)
+            if response.status_code not in RETRYABLE_STATUS_CODES:
+                self.rate_limiter.recover(target_url)
+                return response
+
+            self.rate_limiter.back_off(target_url, parse_retry_after(response.headers.get("Retry-After")))
+            if attempt >= self.max_retries:
+                return response
+
+            attempt += 1
+            response.close()
+
+
+def build_session(
+    user_agent: str = DEFAULT_USER_AGENT,
+    rate_limiter: RateLimiter | None = None,
+    pool_maxsize: int | None = None,
+) -> requests.Session:
+    """`pool_maxsize` 为每个主机保持的连接数，与 `DownloadEngine` 的主机并发数一致时连接可以全部复用。"""
+    session = RateLimitedSession(rate_limiter) if rate_limiter else requests.Session()
     session.headers.update({"User-Agent": user_agent})
+    if pool_maxsize is not None:
+        adapter = HTTPAdapter(pool_maxsize=pool_maxsize)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
     return session
 
 
@@ -70,25 +259,130 @@ def fetch_json(
     return response.json()
 
 
+def parse_content_range(value: str | None) -> tuple[int | None, int | None]:
+    """解析 `Content-Range` 头，返回 (起始偏移, 文件总长)，未知的部分为 None。"""
+    match = CONTENT_RANGE_RE.fullmatch(value.strip()) if value else None
+    if not match:
+        return None, None
+
+    start, total = match.groups()
+    return (int(start) if start else None), (int(total) if total.isdigit() else None)
+
+
+def partial_validator_path(partial_path: Path) -> Path:
+    return partial_path.with_name(partial_path.name + PARTIAL_VALIDATOR_SUFFIX)
+
+
+def discard_partial(partial_path: Path) -> None:
+    partial_path.unlink(missing_ok=True)
+    partial_validator_path(partial_path).unlink(missing_ok=True)
+
+
+def get_range_validator(response: requests.Response) -> str | None:
+    """取可用于 If-Range 的校验值；弱 ETag 不能用于 Range 请求，此时退回 Last-Modified。"""
+    etag = response.headers.get("ETag")
+    if etag and not etag.startswith("W/"):
+        return etag
+    return response.headers.get("Last-Modified")
+
+
+def fetch_into_partial(
+    session: requests.Session,
+    url: str,
+    partial_path: Path,
+    headers: dict[str, str],
+    timeout: int,
+) -> int | None:
+    """
+    从 `.part` 文件已有的长度处续传，返回完整文件的期望长度（未知时为 None）。
+
+    续传请求带 If-Range，远端文件变化时服务器返回完整内容，从头重写；没有记录校验值的 `.part` 无法确认
+    远端未变，同样从头下载。
+    """
+    validator_path = partial_validator_path(partial_path)
+    offset = partial_path.stat().st_size if partial_path.exists() else 0
+    validator = validator_path.read_text(encoding="utf-8").strip() if offset and validator_path.exists() else ""
+    if not validator:
+        offset = 0
+    request_headers = {**headers, "Range": f"bytes={offset}-", "If-Range": validator} if offset else headers
+
+    with session.get(url, headers=request_headers, stream=True, timeout=timeout) as response:
+        if offset and response.status_code == 416:
+            # 已下载的部分可能已经是完整文件，否则说明远端文件变了，只能从头下载
+            _, total = parse_content_range(response.headers.get("Content-Range"))
+            if total == offset:
+                return total
+            discard_partial(partial_path)
+            raise IncompleteDownloadError(f"Partial download no longer matches {url}")
+
+        response.raise_for_status()
+        if response.status_code == 206:
+            start, total = parse_content_range(response.headers.get("Content-Range"))
+            if start != offset:
+                discard_partial(partial_path)
+                raise IncompleteDownloadError(f"Unexpected range in response for {url}")
+            mode = "ab"
+        else:
+            # 服务器不支持 Range 时会返回完整内容
+            content_length = response.headers.get("Content-Length", "")
+            encoded = response.headers.get("Content-Encoding", "identity") != "identity"
+            total = int(content_length) if content_length.isdigit() and not encoded else None
+            mode = "wb"
+            response_validator = get_range_validator(response)
+            if response_validator:
+                validator_path.write_text(response_validator, encoding="utf-8")
+            else:
+                validator_path.unlink(missing_ok=True)
+
+        with partial_path.open(mode) as file_obj:
+            for chunk in response.iter_content(chunk_size=8192):
+                if chunk:
+                    file_obj.write(chunk)
+
+    return total
+
+
 def download_file(
     session: requests.Session,
     url: str,
     output_path: Path,
     referer: str | None = None,
     timeout: int = DEFAULT_DOWNLOAD_TIMEOUT_SECONDS,
+    max_retries: int = DEFAULT_MAX_RETRIES,
 ) -> Path:
+    """
+    下载到 `<文件名>.part`，长度与 `Content-Length` 一致后再原子地重命名为目标文件。
+
+    网络中断时按指数退避等待后用 Range 请求从已下载的位置续传；重试耗尽后 `.part` 文件保留，下次运行会继续续传。
+    """
     if output_path.exists():
         return output_path
 
-    headers = {"Referer": referer} if referer else None
-    with session.get(url, headers=headers, stream=True, timeout=timeout) as response:
-        response.raise_for_status()
-        with output_path.open("wb") as file_obj:
-            for chunk in response.iter_content(chunk_size=8192):
-                if chunk:
-                    file_obj.write(chunk)
+    partial_path = output_path.with_name(output_path.name + PARTIAL_DOWNLOAD_SUFFIX)
+    headers = {"Referer": referer} if referer else {}
+    attempt = 0
+    while True:
+        try:
+            expected_size = fetch_into_partial(session, url, partial_path, headers, timeout)
+            actual_size = partial_path.stat().st_size
+            if expected_size is not None and actual_size != expected_size:
+                if actual_size > expected_size:
+                    discard_partial(partial_path)
+                raise IncompleteDownloadError(f"Incomplete download {url}: {actual_size}/{expected_size} bytes")
 
-    return output_path
+            partial_path.replace(output_path)
+            partial_validator_path(partial_path).unlink(missing_ok=True)
+            return output_path
+        except (
+            requests.ConnectionError,
+            requests.Timeout,
+            requests.exceptions.ChunkedEncodingError,
+            IncompleteDownloadError,
+        ):
+            if attempt >= max_retries:
+                raise
+            attempt += 1
+            time.sleep(min(2.0**attempt, MAX_BACKOFF_SECONDS))
 
 
 def download_url_to_directory(
@@ -100,3 +394,300 @@ def download_url_to_directory(
 ) -> Path:
     output_path = output_dir / get_filename_from_url(url)
     return download_file(session, url, output_path, referer=referer, timeout=timeout)
+
+
+@dataclass(slots=True)
+class DownloadEngine:
+    """
+    并发下载引擎：事件循环运行在后台线程中，调用方在同步代码里提交 URL 并拿到 Future。
+
+    每个主机的并发数受 `max_per_host` 限制，请求速率由 session 上的限速器控制（见 `build_session`）；
+    实际的 HTTP 请求在线程池中通过共享 session 发出。引擎不修改传入的 session，连接池大小由创建方决定，
+    用 `build_session(pool_maxsize=max_per_host)` 创建时长连接可以全部复用。
+
+    正常退出时等待已提交的下载完成；因异常（包括 Ctrl-C）退出时取消尚未开始的下载，不再等待。
+    """
+
+    session: requests.Session
+    max_per_host: int = DEFAULT_HOST_CONCURRENCY
+    timeout: int = DEFAULT_DOWNLOAD_TIMEOUT_SECONDS
+    max_workers: int = DEFAULT_DOWNLOAD_WORKERS
+    _loop: asyncio.AbstractEventLoop = field(init=False)
+    _thread: threading.Thread = field(init=False)
+    _executor: ThreadPoolExecutor = field(init=False)
+    _hosts: Dict[str, asyncio.Semaphore] = field(init=False, default_factory=dict)
+    _pending: Dict[Path, Future[Path]] = field(init=False, default_factory=dict)
+    _pending_lock: threading.Lock = field(init=False, default_factory=threading.Lock)
+
+    def __post_init__(self) -> None:
+        if self.max_per_host < 1:
+            raise ValueError("max_per_host must be at least 1.")
+        if self.max_workers < 1:
+            raise ValueError("max_workers must be at least 1.")
+
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="download")
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="download-engine", daemon=True)
+        self._thread.start()
+
+    def __enter__(self) -> Self:
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        self.close(cancel=exc_type is not None)
+
+    def submit(self, url: str, output_dir: Path, referer: str | None = None) -> Future[Path]:
+        """提交一个下载任务；同一目标文件正在下载时返回已有的 Future。"""
+        output_path = output_dir / get_filename_from_url(url)
+        with self._pending_lock:
+            future = self._pending.get(output_path)
+            if future is not None:
+                return future
+            future = asyncio.run_coroutine_threadsafe(self._download(url, output_path, referer), self._loop)
+            self._pending[output_path] = future
+        # 回调可能在当前线程立即执行，不能在持锁时注册
+        future.add_done_callback(lambda _: self._forget(output_path))
+        return future
+
+    def close(self, cancel: bool = False) -> None:
+        """
+        关闭事件循环与线程池。
+
+        默认等待已提交的下载完成；`cancel` 为真时取消所有下载并立即返回，
+        已经在传输的请求在线程池中自行结束，留下的 `.part` 文件下次运行时续传。
+        """
+        if cancel:
+            asyncio.run_coroutine_threadsafe(self._cancel_all(), self._loop).result()
+        else:
+            with self._pending_lock:
+                pending = list(self._pending.values())
+            for future in pending:
+                try:
+                    future.result()
+                except Exception:
+                    pass
+
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+        self._executor.shutdown(wait=not cancel, cancel_futures=cancel)
+
+    async def _cancel_all(self) -> None:
+        tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _forget(self, output_path: Path) -> None:
+        with self._pending_lock:
+            self._pending.pop(output_path, None)
+
+    async def _download(self, url: str, output_path: Path, referer: str | None) -> Path:
+        host = urlparse(url).netloc
+        semaphore = self._hosts.get(host)
+        if semaphore is None:
+            semaphore = self._hosts[host] = asyncio.Semaphore(self.max_per_host)
+
+        async with semaphore:
+            return await self._loop.run_in_executor(
+                self._executor,
+                functools.partial(download_file, self.session, url, output_path, referer=referer, timeout=self.timeout),
+            )
+
+
+@dataclass(slots=True)
+class CrawlProgress:
+    """一次抓取的进度：最新的帖子、失败数，以及增量模式下是否已经遇到上次抓取记录过的帖子。"""
+
+    newest_post_id: str | None = None
+    failures: int = 0
+    reached_known: bool = False
+
+    def observe(self, post_id: str) -> None:
+        if self.newest_post_id is None:
+            self.newest_post_id = post_id
+
+
+class StateDatabase:
+    """输出目录中抓取状态库 (SQLite) 的连接；抓取状态与文件哈希索引共用同一个文件与表结构。"""
+
+    def __init__(self, directory: Path) -> None:
+        self._connection = sqlite3.connect(directory / CRAWL_STATE_FILENAME, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.executescript(CRAWL_STATE_SCHEMA)
+
+    def __enter__(self) -> Self:
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self._connection.close()
+
+
+class CrawlState(StateDatabase):
+    """
+    输出目录中的抓取状态库 (SQLite)，按查询记录见过的帖子、解析出的图片 URL、内容哈希与高水位。
+
+    帖子只在成功处理后记录；只有没有失败的完整抓取才会更新查询的完成时间。
+    完成时间之前记录的帖子视为 "已结算"，增量抓取遇到它们即可停止翻页；中断的抓取不会留下缺口。
+    """
+
+    def __init__(self, output_dir: Path, query: str) -> None:
+        super().__init__(output_dir)
+        self.query = query
+
+        row = self._connection.execute(
+            "SELECT high_water_mark, completed_at FROM queries WHERE query = ?", (query,)
+        ).fetchone()
+        self.high_water_mark: str | None = row[0] if row else None
+        self.completed_at: float | None = row[1] if row else None
+
+    def is_settled(self, post_id: str) -> bool:
+        """帖子是否在上一次完整抓取完成前就已记录。"""
+        if self.completed_at is None:
+            return False
+
+        row = self._connection.execute(
+            "SELECT 1 FROM posts WHERE query = ? AND post_id = ? AND seen_at <= ?",
+            (self.query, post_id, self.completed_at),
+        ).fetchone()
+        return row is not None
+
+    def get_image_url(self, post_id: str) -> str | None:
+        row = self._connection.execute(
+            "SELECT image_url FROM posts WHERE query = ? AND post_id = ?", (self.query, post_id)
+        ).fetchone()
+        return row[0] if row else None
+
+    def record_post(self, post_id: str, image_url: str | None = None, content_hash: str | None = None) -> None:
+        # 保留首次记录的时间，已结算的帖子不会因为再次出现而失去结算状态
+        self._connection.execute(
+            """
+            INSERT INTO posts (query, post_id, image_url, content_hash, seen_at) VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (query, post_id) DO UPDATE SET
+                image_url = COALESCE(excluded.image_url, posts.image_url),
+                content_hash = COALESCE(excluded.content_hash, posts.content_hash)
+            """,
+            (self.query, post_id, image_url, content_hash, time.time()),
+        )
+
+    def mark_completed(self, progress: CrawlProgress) -> bool:
+        """抓取结束时调用；有失败时不更新完成时间，返回是否已更新。"""
+        if progress.failures:
+            return False
+
+        self.completed_at = time.time()
+        self.high_water_mark = progress.newest_post_id or self.high_water_mark
+        self._connection.execute(
+            """
+            INSERT INTO queries (query, high_water_mark, completed_at) VALUES (?, ?, ?)
+            ON CONFLICT (query) DO UPDATE SET
+                high_water_mark = excluded.high_water_mark,
+                completed_at = excluded.completed_at
+            """,
+            (self.query, self.high_water_mark, self.completed_at),
+        )
+        return True
+
+
+def calculate_file_md5(file_path: Path) -> str:
+    hasher = hashlib.md5()
+    with file_path.open("rb") as handle:
+        for chunk in iter(lambda: handle.read(1024 * 1024), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+class FileHashIndex(StateDatabase):
+    """
+    目录中文件内容 MD5 的持久索引，与抓取状态保存在同一个 SQLite 文件中。
+
+    以文件名、大小与修改时间为键，启动时只需重新计算新增或改动过的文件；大量文件需要计算时使用进程池。
+    """
+
+    def __init__(self, directory: Path) -> None:
+        super().__init__(directory)
+        self.directory = directory
+
+    def collect(
+        self,
+        embedded_hash: Callable[[str], str | None] | None = None,
+        max_workers: int | None = None,
+    ) -> set[str]:
+        """
+        返回目录中所有文件的 MD5 集合，并同步更新索引。
+
+        `embedded_hash` 可以从文件名中直接取出哈希，这样的文件不需要读取内容；
+        抓取状态库与未完成的 `.part` 文件不计入。
+        """
+        cached = {
+            name: (size, mtime_ns, md5)
+            for name, size, mtime_ns, md5 in self._connection.execute(
+                "SELECT name, size, mtime_ns, md5 FROM file_hashes"
+            )
+        }
+        hashes: set[str] = set()
+        present: set[str] = set()
+        pending: list[tuple[str, int, int]] = []
+
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if (
+                    not entry.is_file()
+                    or entry.name.startswith(CRAWL_STATE_FILENAME)
+                    or entry.name.endswith(
+                        (PARTIAL_DOWNLOAD_SUFFIX, PARTIAL_DOWNLOAD_SUFFIX + PARTIAL_VALIDATOR_SUFFIX)
+                    )
+                ):
+                    continue
+
+                hash_value = embedded_hash(entry.name) if embedded_hash else None
+                if hash_value:
+                    hashes.add(hash_value)
+                    continue
+
+                stat = entry.stat()
+                present.add(entry.name)
+                cached_entry = cached.get(entry.name)
+                if cached_entry and cached_entry[:2] == (stat.st_size, stat.st_mtime_ns):
+                    hashes.add(cached_entry[2])
+                else:
+                    pending.append((entry.name, stat.st_size, stat.st_mtime_ns))
+
+        paths = [self.directory / name for name, _, _ in pending]
+        executor = ProcessPoolExecutor(max_workers=max_workers) if len(paths) >= HASH_POOL_MIN_FILES else None
+        try:
+            results = (
+                executor.map(calculate_file_md5, paths, chunksize=4) if executor else map(calculate_file_md5, paths)
+            )
+            digests = list(
+                tqdm(results, total=len(paths), desc="Hashing files", unit="file", leave=False, disable=not paths)
+            )
+        finally:
+            if executor:
+                executor.shutdown()
+
+        hashes.update(digests)
+        with self._connection:
+            self._connection.execute("BEGIN")
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO file_hashes (name, size, mtime_ns, md5) VALUES (?, ?, ?, ?)",
+                [(name, size, mtime_ns, md5) for (name, size, mtime_ns), md5 in zip(pending, digests)],
+            )
+            self._connection.executemany(
+                "DELETE FROM file_hashes WHERE name = ?", [(name,) for name in cached.keys() - present]
+            )
+        return hashes